@@ -1,86 +1,125 @@
 pragma solidity ^0.4.24;
 
-contract CreativeContract {
+// State and rules shared by CreativeContract and CreativeContractTemplate,
+// each one sets up a new agreement through '_init'.
+contract CreativeContractBase {
 
   // TODO Extract handling due and settlement dates in modifiers
 
-  // Dates (unix timestamp)
-  uint256 settlementTimestamp;
-  uint256 duedateTimestamp;
-  uint256 deliveryTimestamp;
-  // uint256 contractTimestamp; // handled by the blockchain
-
-  uint256 amount;     // Price of the service
-  uint256 oracleFee;  // Amount to be payed to the oracle
-
-  string legalContractUrl;    // URL to the textual contract.
-  bytes32 legalContractHash;  // SHA256 of the textual contract.
+  // Storage is packed in 5 slots, every line below is a single slot. The
+  // legal contract URL and the intents are only kept in the events.
 
-  // Parties
   address business;  // owner
+  uint64 settlementTimestamp;  // Dates (unix timestamp)
+  uint8 intents;     // Bitfield with the parties' intents, see below
+
   address customer;
+  uint64 duedateTimestamp;
+
   address oracle;
+  uint64 deliveryTimestamp;
+  // uint256 contractTimestamp; // handled by the blockchain
+
+  uint128 amount;     // Price of the service
+  uint128 oracleFee;  // Amount to be payed to the oracle
+
+  bytes32 legalContractHash;  // SHA256 of the textual contract.
 
   // ============== INTERNALS
 
-  mapping(address => bool) cancelIntent;  // Track the intent of contract cancelation
-  mapping(address => bool) settleIntent;  // Track the intent of settle the contract
-  mapping(address => bool) rebateIntent;  // Track the intent of contract rebate
+  uint8 constant BUSINESS_CANCELS = 1;  // Track the intent of contract cancelation
+  uint8 constant CUSTOMER_CANCELS = 2;
+  uint8 constant BUSINESS_SETTLES = 4;  // Track the intent of settle the contract
+  uint8 constant CUSTOMER_REBATES = 8;  // Track the intent of contract rebate
+
+  // ============== EVENTS
+
+  // Terms are [amount, oracleFee, settlementTs, dueTs, deliveryTs]
+  event Created(address business, address customer, address oracle,
+                uint256[5] terms, string legalContractUrl,
+                bytes32 legalContractHash);
+  event Funded(address from, uint256 value, uint256 balance);
+  event CancelIntent(address party);
+  event SettleIntent(address party);
+  event RebateIntent(address party);
+  event Canceled(uint256 balance);
+  event Settled(uint256 oracleFee, uint256 balance);
+  event Rebated(uint256 oracleFee, uint256 balance);
+  event Claimed(uint256 balance);
+
+  // Parties are [business, customer, oracle] and terms are
+  // [amount, oracleFee, settlementTs, dueTs, deliveryTs], packed in arrays to
+  // keep the calls within the stack limits
+  function _init(address[3] _parties,
+                 uint256[5] _terms,
+                 string _lcUrl,
+                 bytes32 _lcHash
+                 ) internal {
+    require(_terms[0] < 2**128 && _terms[1] < 2**128, "Amount too big");
+    require(_terms[2] < 2**64 && _terms[3] < 2**64 && _terms[4] < 2**64,
+            "Date too big");
 
-  constructor(address _customer,
-              address _oracle,
-              uint256 _amount,
-              uint256 _oracleFee,
-              string _lcUrl,
-              bytes32 _lcHash,
-              uint256 _settlementTs,
-              uint256 _dueTs,
-              uint256 _deliveryTs
-              ) public {
     // Parties
-    business = msg.sender;  // TODO Validate is not same as business or oracle
-    customer = _customer;   // TODO Validate is not same as business or oracle
-    oracle = _oracle;       // TODO Validate is not the same as business or oracle
+    business = _parties[0];  // TODO Validate is not same as business or oracle
+    customer = _parties[1];  // TODO Validate is not same as business or oracle
+    oracle = _parties[2];    // TODO Validate is not the same as business or oracle
 
     // Amounts
-    amount = _amount;
-    oracleFee = _oracleFee;  // TODO Validate fee is less than amount
+    amount = uint128(_terms[0]);
+    oracleFee = uint128(_terms[1]);  // TODO Validate fee is less than amount
 
     // Textual contract
-    legalContractUrl = _lcUrl;
     legalContractHash = _lcHash;
 
     // Dates
     // TODO Validate duedateTimestamp < settlementTimestamp
-    settlementTimestamp = _settlementTs;
-    duedateTimestamp = _dueTs;
-    deliveryTimestamp = _deliveryTs;
+    settlementTimestamp = uint64(_terms[2]);
+    duedateTimestamp = uint64(_terms[3]);
+    deliveryTimestamp = uint64(_terms[4]);
+
+    emit Created(_parties[0], _parties[1], _parties[2], _terms, _lcUrl,
+                 _lcHash);
   }
 
   // Both customer and business want to cancel the contract
   function cancel() public returns (bool) {
     // TODO When a contract can be canceled?
 
-    require(msg.sender == business || msg.sender == customer);
-    cancelIntent[msg.sender] = true;
+    uint8 flags = intents;
+    if (msg.sender == business) {
+      flags |= BUSINESS_CANCELS;
+    } else if (msg.sender == customer) {
+      flags |= CUSTOMER_CANCELS;
+    } else {
+      revert();
+    }
+
+    emit CancelIntent(msg.sender);
 
-    if (cancelIntent[business] && cancelIntent[customer]) {
+    if ((flags & (BUSINESS_CANCELS | CUSTOMER_CANCELS)) ==
+        (BUSINESS_CANCELS | CUSTOMER_CANCELS)) {
+      emit Canceled(address(this).balance);
       selfdestruct(business);
     }
+
+    intents = flags;
   }
 
   // Business demands the payment
   function settle() public returns (bool) {
-    require(address(this).balance >= oracleFee, "Need to fund the contract first");
-    require(msg.sender == customer || msg.sender == business);
+    uint256 fee = oracleFee;
+    require(address(this).balance >= fee, "Need to fund the contract first");
+    require(msg.sender == business || msg.sender == oracle);
     require(now > deliveryTimestamp, "Can't unlock funds before contract's delivery date");
 
     if (msg.sender == business) {
-      settleIntent[business] = true;
+      intents |= BUSINESS_SETTLES;
+      emit SettleIntent(msg.sender);
       return false;
-    } else if (msg.sender == oracle) {
-      require(settleIntent[business], "Business doesn't want settle");
-      oracle.transfer(oracleFee);
+    } else {
+      require((intents & BUSINESS_SETTLES) != 0, "Business doesn't want settle");
+      emit Settled(fee, address(this).balance);
+      oracle.transfer(fee);
       selfdestruct(business);  // TODO Or business.transfer(amount - oracleFee) ?
       return true;
     }
@@ -88,16 +127,19 @@ contract CreativeContract {
 
   // Customer demands a refund
   function rebate() public returns (bool) {
-    require(address(this).balance >= oracleFee, "Need to fund the contract first");
+    uint256 fee = oracleFee;
+    require(address(this).balance >= fee, "Need to fund the contract first");
     require(msg.sender == customer || msg.sender == oracle);
     require(now > deliveryTimestamp, "Can refund only delivered contracts");
 
     if (msg.sender == customer) {
-      rebateIntent[customer] = true;
+      intents |= CUSTOMER_REBATES;
+      emit RebateIntent(msg.sender);
       return false;
-    } else if (msg.sender == oracle) {
-      require(rebateIntent[customer], "Customer doesn't want rebate");
-      oracle.transfer(oracleFee);
+    } else {
+      require((intents & CUSTOMER_REBATES) != 0, "Customer doesn't want rebate");
+      emit Rebated(fee, address(this).balance);
+      oracle.transfer(fee);
       selfdestruct(customer);  // TODO Or customer.transfer(amount - oracleFee) ?
       return true;
     }
@@ -107,20 +149,17 @@ contract CreativeContract {
   function fund() public payable {
     // TODO Anyone can fund the contract?
 
-    uint256 balance = address(this).balance;
-    uint256 debt = amount - balance; // TODO Use safe math
-    require(balance < amount, "Contract is already fully paid");
-    require(msg.value <= debt, "Can't over paid the contract");
+    uint256 balance = address(this).balance;  // Includes 'msg.value'
+    uint256 previous = balance - msg.value;
+    require(previous < amount, "Contract is already fully paid");
+    require(balance <= amount, "Can't over paid the contract");
 
-    if (now > duedateTimestamp) {  // Contract is due
-      // call claim()
-    } else {
-      if (balance == 0) { // Is the first payment?
-        require(msg.value >= oracleFee, "Need to cover at least oracle expenses");
-      }
-
-      // Blockchain handles the money
+    if (now <= duedateTimestamp && previous == 0) { // Is the first payment?
+      require(msg.value >= oracleFee, "Need to cover at least oracle expenses");
     }
+
+    // Blockchain handles the money
+    emit Funded(msg.sender, msg.value, balance);
   }
 
   // Business claim contract funds due to contract breach
@@ -128,6 +167,7 @@ contract CreativeContract {
     require(msg.sender == business);
     require(now > duedateTimestamp, "Can only claim if contract is due");
     require(address(this).balance < amount, "Can only claim on breach of contract");
+    emit Claimed(address(this).balance);
     selfdestruct(business);
     return true;
   }
@@ -136,3 +176,21 @@ contract CreativeContract {
     return amount - address(this).balance;
   }
 }
+
+contract CreativeContract is CreativeContractBase {
+
+  constructor(address _customer,
+              address _oracle,
+              uint256 _amount,
+              uint256 _oracleFee,
+              string _lcUrl,
+              bytes32 _lcHash,
+              uint256 _settlementTs,
+              uint256 _dueTs,
+              uint256 _deliveryTs
+              ) public {
+    _init([msg.sender, _customer, _oracle],
+          [_amount, _oracleFee, _settlementTs, _dueTs, _deliveryTs],
+          _lcUrl, _lcHash);
+  }
+}
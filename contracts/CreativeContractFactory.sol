@@ -0,0 +1,67 @@
+pragma solidity ^0.4.24;
+
+import "./CreativeContract.sol";
+
+// Same rules as CreativeContract, but set up through 'initialize' instead of
+// the constructor so it can be used as the implementation of many EIP-1167
+// clones, each one a new agreement.
+contract CreativeContractTemplate is CreativeContractBase {
+
+  constructor() public {
+    // The implementation itself can't be initialized (nor destroyed)
+    business = address(this);
+  }
+
+  // Parties are [business, customer, oracle] and terms are
+  // [amount, oracleFee, settlementTs, dueTs, deliveryTs]
+  function initialize(address[3] _parties,
+                      uint256[5] _terms,
+                      string _lcUrl,
+                      bytes32 _lcHash
+                      ) public {
+    require(business == address(0), "Contract already initialized");
+    _init(_parties, _terms, _lcUrl, _lcHash);
+  }
+}
+
+// Creates each agreement as a minimal proxy (EIP-1167) delegating to a single
+// CreativeContractTemplate, so only 55 bytes of code are deployed per contract.
+contract CreativeContractFactory {
+
+  address public implementation;
+
+  event ContractCreated(address contractAddress, address business);
+
+  constructor(address _implementation) public {
+    implementation = _implementation;
+  }
+
+  // Terms are [amount, oracleFee, settlementTs, dueTs, deliveryTs], the
+  // sender is the contract's business
+  function createContract(address _customer,
+                          address _oracle,
+                          uint256[5] _terms,
+                          string _lcUrl,
+                          bytes32 _lcHash
+                          ) public returns (address) {
+    address clone = createClone(implementation);
+    CreativeContractTemplate(clone).initialize(
+      [msg.sender, _customer, _oracle], _terms, _lcUrl, _lcHash);
+
+    emit ContractCreated(clone, msg.sender);
+    return clone;
+  }
+
+  // https://eips.ethereum.org/EIPS/eip-1167
+  function createClone(address target) internal returns (address result) {
+    bytes20 targetBytes = bytes20(target);
+    assembly {
+      let clone := mload(0x40)
+      mstore(clone, 0x3d602d80600a3d3981f3363d3d373d3d3d363d73000000000000000000000000)
+      mstore(add(clone, 0x14), targetBytes)
+      mstore(add(clone, 0x28), 0x5af43d82803e903d91602b57fd5bf30000000000000000000000000000000000)
+      result := create(0, clone, 0x37)
+    }
+    require(result != address(0), "Clone creation failed");
+  }
+}
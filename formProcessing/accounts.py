@@ -0,0 +1,132 @@
+import random
+from collections import namedtuple
+from eth_account import Account
+from nonces import NonceManager
+
+Deployer = namedtuple('Deployer', ['address', 'private_key', 'passphrase'])
+
+
+class DeployerPool:
+    """ Spreads the contract deployments among several accounts.
+
+    Each account has its own nonce sequence and balance, so deployments made
+    with different accounts don't wait for each other. Accounts are chosen at
+    random weighted by their balance and by how many of their transactions are
+    pending, and accounts running out of funds are left out.
+
+    Attributes:
+        redis (object): The redis.StrictRedis client holding the nonces and
+            balances shared by all workers.
+        deployers (list): The Deployer of each account in the pool.
+        min_balance (int): Accounts with less funds (in wei) aren't used.
+        balance_ttl (int): Seconds an account balance is cached.
+    """
+
+    def __init__(self,
+                 redis,
+                 private_keys,
+                 passphrases=None,
+                 min_balance=0,
+                 balance_ttl=60):
+        """ Create a pool with the given accounts.
+
+        Args:
+            redis (object): The redis.StrictRedis client holding the nonces
+                and balances shared by all workers.
+            private_keys (list): Ethereum private key of each account.
+            passphrases (list): Passphrase of each account, only needed when
+                the node signs the transactions.
+            min_balance (int): Accounts with less funds (in wei) aren't used.
+            balance_ttl (int): Seconds an account balance is cached.
+
+        Raises:
+            ValueError: If no private key is given, one of them is empty or
+                the number of private keys and passphrases don't match.
+        """
+        if not private_keys:
+            raise ValueError('At least one deployer account is needed')
+        if not all(private_keys):
+            raise ValueError('Empty deployer private key, set '
+                             'ETH_DEPLOYER_PKEYS or ETH_USER_PKEY')
+
+        passphrases = passphrases or [None] * len(private_keys)
+        if len(passphrases) != len(private_keys):
+            raise ValueError('Expected one passphrase per private key')
+
+        self.redis = redis
+        self.min_balance = min_balance
+        self.balance_ttl = balance_ttl
+        self.deployers = [
+            Deployer(Account.privateKeyToAccount(key).address, key, passphrase)
+            for key, passphrase in zip(private_keys, passphrases)
+        ]
+
+    def nonce_manager(self, w3, address):
+        """ Get a nonce manager of one of the pool's accounts.
+
+        The nonces are kept in Redis, so a new manager is created for each
+        client instead of sharing one between the tasks running at once.
+
+        Args:
+            w3 (object): Instance of the web3 client using the manager.
+            address (str): Ethereum address of the account.
+
+        Returns:
+            NonceManager: A manager of the account's nonces.
+        """
+        return NonceManager(self.redis, w3, address)
+
+    def balance(self, w3, address):
+        """ Get the balance of an account, cached for 'balance_ttl' seconds.
+
+        Accounts with less than 'min_balance' are reported when their balance
+        is refreshed, not every time it is read.
+
+        Args:
+            w3 (object): Instance of the web3 client.
+            address (str): Ethereum address of the account.
+
+        Returns:
+            int: The account's balance in wei.
+        """
+        key = 'balance:%s' % address.lower()
+
+        balance = self.redis.get(key)
+        if balance is None:
+            balance = w3.eth.getBalance(address)
+            self.redis.setex(key, self.balance_ttl, balance)
+            if balance < self.min_balance:
+                # TODO Use the flask app's logger instead of print to stdout
+                # directly
+                print('Not enough funds, skipping account: ', address)
+
+        return int(balance)
+
+    def choose(self, w3):
+        """ Choose the account to use for the next deployment.
+
+        Args:
+            w3 (object): Instance of the web3 client.
+
+        Returns:
+            Deployer: The chosen account.
+
+        Raises:
+            ValueError: If no account in the pool has enough funds.
+        """
+        funded = []
+        weights = []
+
+        for deployer in self.deployers:
+            balance = self.balance(w3, deployer.address)
+            if balance < self.min_balance:
+                continue
+
+            pending = self.nonce_manager(w3, deployer.address).in_flight()
+            funded.append(deployer)
+            weights.append(max(balance, 1) / (1 + pending))
+
+        if not funded:
+            raise ValueError('No deployer account has enough funds')
+
+        return random.choices(funded, weights)[0]
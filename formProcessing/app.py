@@ -1,90 +1,45 @@
 import os
+import re
 import json
+import time
+import uuid
 import pprint
-from dateutil import parser as dateparser
+import threading
+import redis
+from concurrent import futures
 from flask import Flask
+from flask import Response
+from flask import g
+from flask import abort
+from flask import redirect
+from flask import send_file
+from flask import stream_with_context
 from flask import render_template
 from flask import request
-from weasyprint import HTML
-from utils import make_celery, generate_pdf
-from smartcontract import SmartContract
-
+from flask import url_for
+import config
+from utils import generate_pdf, event_data_key
+from utils import validate_event_data, parse_batch
+from rendering import get_renderer
+from receipts import ReceiptTracker
+from jobs import JobStore
+from renderpool import RenderPool, RenderQueueFull
+from storage import make_storage, LocalStorage
+from indexer import ContractIndex
+from metrics import Metrics
+
+# Only what the routes need is imported here, the deployment runs in the
+# celery workers (see 'worker.py') and the rendering in the render pool
 app = Flask(__name__, static_url_path='/static')
-app.config.update(
-    # Celery will use the broker as a task queue
-    CELERY_BROKER_URL='redis://localhost:6379',
-    CELERY_RESULT_BACKEND='redis://localhost:6379',
-
-    # Options to connect to the Ethereum node used for deployment
-    GETH_NODE_URI=os.getenv('GETH_NODE_URI', 'http://localhost:8565'),
-    GETH_USES_IPC=os.getenv('GETH_USES_IPC', False),
-    GETH_USES_POA=os.getenv('GETH_USES_POA', False),
-
-    # User account used to sign and deploy the contract
-    ETH_USER_PKEY=os.environ['ETH_USER_PKEY'],
-    ETH_USER_PASS=os.environ['ETH_USER_PASS'],
-
-    # Contract name and file path to the contract's solidity file
-    CREATIVE_CONTRACT_NAME=os.getenv('CC_NAME', 'CreativeContract'),
-    CREATIVE_CONTRACT_FILE=os.getenv('CC_FILE',
-                                     '../contracts/CreativeContract.sol'))
-
-celery = make_celery(app)
-
-
-@celery.task()
-def deploy_new_contract(contract_hash, contract_url, event_details):
-    sc = SmartContract(celery.conf['GETH_NODE_URI'],
-                       celery.conf['GETH_USES_IPC'],
-                       celery.conf['GETH_USES_POA'])
-
-    sc.import_account(celery.conf['ETH_USER_PKEY'],
-                      celery.conf['ETH_USER_PASS'])
-
-    # TODO: Generate a new PDF with a QR code of the 'contract_address'
-    # TODO Some parameters are not in the 'event_data'
-    # TODO Validate convert dates
-
-    # Transform dates to unix timestamps
-    due_ts = int(dateparser.parse(event_details['dueDate']).timestamp())
-    settlement_ts = int(
-        dateparser.parse(event_details['settlementDate']).timestamp())
-    delivery_ts = int(
-        dateparser.parse(event_details['dateOfDelivery']).timestamp())
-
-    sc.set_contract_data(
-        customer_address=event_details['customerAddress'],
-        oracle_address=event_details['oracleAddress'],
-        contract_amount=int(event_details['amount']),
-        oracle_fee=int(event_details['oracleFee']),
-        lcurl=contract_url,
-        lchash=contract_hash,
-        contract_duedate_ts=due_ts,
-        contract_settlement_ts=settlement_ts,
-        contract_delivery_ts=delivery_ts)
-
-    # Read solidity code
-    source_code = ''
-    with open(celery.conf['CREATIVE_CONTRACT_FILE'], 'r') as f:
-        source_code = ''.join(f.readlines())
-
-    # This will block until transaction is mined (default timeout is 120s)
-    contract_address = sc.deploy(celery.conf['CREATIVE_CONTRACT_NAME'],
-                                 source_code).hex()
-
-    # PDF Generation
-    event_details['ETHContractAddress'] = contract_address
-
-    # TODO Should the 'contract_address' be part of the file name?
-    contract_in_html = render_template('CONTRATO.html', e=event_details)
-    contract_in_pdf = HTML(string=contract_in_html).write_pdf()
-    contract_path = "./static/contratos/%s_deployed.pdf" % contract_hash
-    filehandler = open(contract_path, "wb")
-    filehandler.write(contract_in_pdf)
-    print('\n\n======= GENERATED PDF =======')
-    print('Address ==> ', contract_address)
-    print('File    ==> ', contract_path)
-    print('=================================')
+app.config.from_object(config)
+
+redis_client = redis.StrictRedis.from_url(app.config['CELERY_BROKER_URL'])
+metrics = Metrics(app.config['CELERY_BROKER_URL'])
+job_store = JobStore(redis_client)
+contract_storage = make_storage(app.config)
+render_pool = RenderPool(app.config['RENDER_WORKERS'],
+                         app.config['RENDER_QUEUE_SIZE'])
+contract_index = ContractIndex(app.config['CC_INDEX_DB'])
 
 
 @app.route('/')
@@ -123,20 +78,442 @@ def postjson():
     return pprint.pformat(content)
 
 
+def deploy_new_contract(contract_hash,
+                        contract_url,
+                        event_details,
+                        job_id=None,
+                        job_key=None,
+                        request_id=None):
+    """ Start the deployment of a rendered contract.
+
+    The deployment is a chain of tasks, each one passing the deployment to
+    the next: 'validate_deployment', 'compile_contract' and
+    'submit_deployment'. Then 'track_deployments' confirms it together with
+    every other pending deployment and starts 'render_deployed_contract'.
+
+    Args:
+        contract_hash (str): Hex digest of the SHA256 of the contract's PDF.
+        contract_url (str): URL of the contract's PDF.
+        event_details (dict): The event data the contract was rendered with.
+        job_id (str): The contract's job identifier.
+        job_key (str): The key indexing the job, forgotten if the deployment
+            fails so the contract can be submitted again.
+        request_id (str): Correlation id of the request that created the
+            contract, logged by each stage.
+
+    Returns:
+        object: The AsyncResult of the last task of the chain.
+    """
+    deployment = {
+        'contract_hash': contract_hash,
+        'contract_url': contract_url,
+        'event_details': event_details,
+        'job_id': job_id,
+        'job_key': job_key,
+        'request_id': request_id
+    }
+
+    # Sent by name, the web app doesn't import the tasks nor what they use
+    from celery import chain
+    from celeryapp import celery
+
+    return chain(
+        celery.signature('tasks.validate_deployment', args=(deployment, )),
+        celery.signature('tasks.compile_contract'),
+        celery.signature('tasks.submit_deployment')).delay()
+
+
+def contract_rendered(job_id,
+                      job_key,
+                      host_url,
+                      event_data,
+                      future,
+                      request_id=None):
+    """ Start the deployment of a contract once its PDF is rendered.
+
+    Args:
+        job_id (str): The contract's job identifier.
+        job_key (str): The key indexing the job, see 'utils.event_data_key'.
+        host_url (str): Root URL of the app, used for the PDF's URL.
+        event_data (dict): The event data the contract was rendered with.
+        future (object): The finished render returning the PDF's hash.
+        request_id (str): Correlation id of the request that created the
+            contract.
+
+    Returns:
+        dict: The fields set in the job.
+    """
+    try:
+        contract_hash = future.result()
+    except Exception as e:
+        # TODO Use the flask app's logger instead of print to stdout directly
+        print('Contract rendering failed: ', request_id, job_id, e)
+        job_store.update(job_id, renderStatus='failed')
+        # Let the client submit it again
+        job_store.forget(job_key)
+        return {'renderStatus': 'failed'}
+
+    if app.config['CONTRACTS_BASE_URL']:
+        contract_url = (app.config['CONTRACTS_BASE_URL'] +
+                        contract_storage.key(contract_hash))
+    else:
+        contract_url = "%scontratos/%s.pdf" % (host_url, contract_hash)
+    fields = {
+        'renderStatus': 'done',
+        'deployStatus': 'queued',
+        'legalContractUrl': contract_url,
+        'legalContractHash': contract_hash,
+        'renderedAt': time.time()
+    }
+    job_store.update(job_id, **fields)
+
+    # Smart Contract Generation
+    try:
+        deploy_new_contract(
+            contract_hash,
+            contract_url,
+            event_data,
+            job_id=job_id,
+            job_key=job_key,
+            request_id=request_id)  # async
+    except Exception as e:
+        # E.g. the broker is down
+        # TODO Use the flask app's logger instead of print to stdout directly
+        print('Contract deployment failed: ', request_id, job_id, e)
+        fields.update(deployStatus='failed', deployError=str(e))
+        job_store.update(job_id, **fields)
+        job_store.forget(job_key)
+
+    return fields
+
+
+@app.before_request
+def set_request_id():
+    # Correlation id followed from the request to the deployed contract,
+    # given by the client or the proxy in front of the app
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+
+@app.after_request
+def add_request_id(response):
+    response.headers['X-Request-ID'] = g.request_id
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """ Metrics of the whole deployment in the Prometheus text format.
+
+    Besides the recorded counters and histograms, it measures the length of
+    the celery queues and the number of deployments waiting to be mined.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for queue in app.config['METRICS_QUEUES']:
+        pipe.llen(queue)
+    pipe.hlen(ReceiptTracker.PENDING_KEY)
+    lengths = pipe.execute()
+
+    gauges = [('celery_queue_length', {'queue': queue}, length)
+              for queue, length in zip(app.config['METRICS_QUEUES'], lengths)]
+    gauges.append(('deployments_pending', {}, lengths[-1]))
+
+    return Response(
+        metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/contrato/new', methods=['POST'])
 def contrato_new():
     event_data = request.get_json()
+    errors = validate_event_data(event_data)
+    if errors:
+        return json.dumps({'errors': errors}), 400
+
+    request_id = g.request_id
+    job_key = event_data_key(event_data, get_renderer().version)
+    job_id, created = job_store.find_or_create(
+        job_key,
+        renderStatus='queued',
+        requestId=request_id,
+        receivedAt=time.time())
+
+    # Same contract submitted again, e.g. a client retrying. Don't render nor
+    # deploy it twice
+    if not created:
+        job = job_store.get(job_id) or {}
+        job['jobId'] = job_id
+        job['statusUrl'] = url_for(
+            'contrato_status', job_id=job_id, _external=True)
+        return json.dumps(job)
+
+    # PDF Generation, in the render pool to keep this thread free
+    try:
+        future = render_pool.submit(
+            generate_pdf, event_data, contract_storage, metrics=metrics)
+    except RenderQueueFull:
+        job_store.forget(job_key)
+        job_store.delete(job_id)
+        retry_after = app.config['RENDER_RETRY_AFTER']
+        return json.dumps({
+            'error': 'Too many contracts being rendered, retry later'
+        }), 429, {'Retry-After': str(retry_after)}
+
+    # The callback runs outside of the request, so don't use 'request' there
+    host_url = request.host_url
+    future.add_done_callback(lambda f: contract_rendered(
+        job_id, job_key, host_url, event_data, f, request_id=request_id))
 
-    # PDF Generation
-    contract_hash = generate_pdf(event_data)
-    contract_url = "%sstatic/contratos/%s.pdf" % (request.host_url,
-                                                  contract_hash)
-
-    # Smart Contract Generation
-    deploy_new_contract.delay(contract_hash, contract_url, event_data)  # async
-
-    # TODO Should add the expected URL for the post-deployed contract PDF?
     return json.dumps({
-        'legalContractUrl': contract_url,
-        'legalContractHash': contract_hash
-    })
+        'jobId': job_id,
+        'statusUrl': url_for('contrato_status', job_id=job_id, _external=True)
+    }), 202
+
+
+@app.route('/contrato/<job_id>')
+def contrato_status(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return json.dumps({'error': 'Unknown contract'}), 404
+
+    job['jobId'] = job_id
+    return json.dumps(job)
+
+
+# Stored contracts are named after their hash, optionally '_deployed'
+CONTRACT_NAME_RE = re.compile(r'^[0-9a-f]{64}(_deployed)?$')
+
+
+@app.route('/contratos/<name>.pdf')
+def contrato_pdf(name):
+    """ Download a contract's PDF.
+
+    The content of a name never changes, so it can be cached forever and
+    its ETag is the name itself. Range requests and conditional GETs are
+    supported and the bytes are sent by the web server when configured.
+    """
+    if not CONTRACT_NAME_RE.match(name):
+        abort(404)
+
+    if not isinstance(contract_storage, LocalStorage):
+        # Served by the object storage or its CDN
+        if not app.config['CONTRACTS_BASE_URL']:
+            abort(404)
+        return redirect(
+            app.config['CONTRACTS_BASE_URL'] + contract_storage.key(name),
+            code=301)
+
+    path = contract_storage.path(name)
+    if not os.path.exists(path):
+        abort(404)
+
+    if (app.config['CONTRACTS_ACCEL_REDIRECT']
+            and path == contract_storage.path(name, legacy=False)):
+        # nginx sends the file, handling ranges and conditional requests
+        response = app.response_class(mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = (
+            app.config['CONTRACTS_ACCEL_REDIRECT'] +
+            contract_storage.key(name))
+    else:
+        # With 'USE_X_SENDFILE' the file isn't read here either
+        response = send_file(
+            path,
+            mimetype='application/pdf',
+            add_etags=False,
+            conditional=False)
+
+    response.set_etag(name)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+
+    if 'X-Accel-Redirect' in response.headers or app.config['USE_X_SENDFILE']:
+        # Ranges are handled by the web server, only answer 304 here
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+    else:
+        response = response.make_conditional(
+            request,
+            accept_ranges=True,
+            complete_length=os.path.getsize(path))
+
+    return response
+
+
+def submit_batch(items, host_url, request_id):
+    """ Claim the jobs of a batch and render and deploy them in background.
+
+    Every job is claimed before returning and a feeder thread submits the
+    renders, at most 'BATCH_MAX_IN_FLIGHT' at once, so the whole batch is
+    processed even if the client goes away. Each contract's deployment
+    starts as soon as it is rendered.
+
+    Args:
+        items (list): The event data of each contract, already validated.
+        host_url (str): Root URL of the app, used for the PDFs' URLs.
+        request_id (str): Correlation id of the batch, each contract's is
+            followed by its index in the batch.
+
+    Returns:
+        list: The index in the batch, job id and future of the fields set in
+            the job of each contract.
+    """
+    version = get_renderer().version
+    jobs = []
+    to_render = []
+
+    for index, event_data in enumerate(items):
+        item_request_id = '%s-%d' % (request_id, index)
+        job_key = event_data_key(event_data, version)
+        job_id, created = job_store.find_or_create(
+            job_key,
+            renderStatus='queued',
+            requestId=item_request_id,
+            receivedAt=time.time())
+
+        result = futures.Future()
+        if created:
+            to_render.append(
+                (result, job_id, job_key, event_data, item_request_id))
+        else:
+            # Same contract submitted before, don't render nor deploy it twice
+            result.set_result(job_store.get(job_id) or {})
+        jobs.append((index, job_id, result))
+
+    if to_render:
+        feeder = threading.Thread(
+            target=feed_batch, args=(to_render, host_url), daemon=True)
+        feeder.start()
+
+    return jobs
+
+
+def feed_batch(to_render, host_url):
+    """ Submit the renders of a batch, waiting while too many are running.
+
+    Args:
+        to_render (list): The result future, job id, job key, event data and
+            request id of each contract to render.
+        host_url (str): Root URL of the app, used for the PDFs' URLs.
+    """
+    max_in_flight = app.config['BATCH_MAX_IN_FLIGHT']
+    in_flight = set()
+
+    def on_rendered(result, job_id, job_key, event_data, item_request_id):
+        def callback(future):
+            try:
+                result.set_result(contract_rendered(
+                    job_id,
+                    job_key,
+                    host_url,
+                    event_data,
+                    future,
+                    request_id=item_request_id))
+            except Exception as e:
+                result.set_exception(e)
+
+        return callback
+
+    for result, job_id, job_key, event_data, item_request_id in to_render:
+        while len(in_flight) >= max_in_flight:
+            _, in_flight = futures.wait(
+                in_flight, return_when=futures.FIRST_COMPLETED)
+
+        while True:
+            try:
+                future = render_pool.submit(
+                    generate_pdf, event_data, contract_storage,
+                    metrics=metrics)
+                break
+            except RenderQueueFull:
+                # Wait for the renders of this batch, or of other requests
+                if in_flight:
+                    _, in_flight = futures.wait(
+                        in_flight, 1, return_when=futures.FIRST_COMPLETED)
+                else:
+                    time.sleep(0.1)
+            except Exception as e:
+                # TODO Use the flask app's logger instead of print to stdout
+                # directly
+                print('Contract rendering failed: ', item_request_id, job_id,
+                      e)
+                job_store.update(job_id, renderStatus='failed')
+                job_store.forget(job_key)
+                future = None
+                result.set_result({'renderStatus': 'failed'})
+                break
+
+        if future is not None:
+            in_flight.add(result)
+            future.add_done_callback(on_rendered(
+                result, job_id, job_key, event_data, item_request_id))
+
+
+def batch_results(jobs, host_url):
+    """ Report the results of a batch submitted with 'submit_batch'.
+
+    Args:
+        jobs (list): The index, job id and future of each contract's job.
+        host_url (str): Root URL of the app, used for the status URLs.
+
+    Yields:
+        str: A JSON line with the 'index' of the contract in the batch, its
+            'jobId' and the fields of its job known so far, in order of
+            completion.
+    """
+    pending = {result: (index, job_id) for index, job_id, result in jobs}
+
+    for result in futures.as_completed(pending):
+        index, job_id = pending[result]
+        line = dict(result.result(), index=index, jobId=job_id)
+        line['statusUrl'] = '%scontrato/%s' % (host_url, job_id)
+        yield json.dumps(line) + '\n'
+
+
+@app.route('/contrato/batch', methods=['POST'])
+def contrato_batch():
+    try:
+        items = parse_batch(request.get_data(as_text=True))
+    except ValueError as e:
+        return json.dumps({'error': 'Invalid JSON: %s' % e}), 400
+
+    if not isinstance(items, list):
+        return json.dumps({'error': 'Expected a list of contracts'}), 400
+
+    # Nothing is rendered unless every contract is valid
+    errors = []
+    for index, event_data in enumerate(items):
+        item_errors = validate_event_data(event_data)
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+    if errors:
+        return json.dumps({'errors': errors}), 400
+
+    # Everything is claimed and submitted before answering, the response only
+    # reports the results
+    jobs = submit_batch(items, request.host_url, g.request_id)
+    return Response(
+        stream_with_context(batch_results(jobs, request.host_url)),
+        mimetype='application/x-ndjson')
+
+
+@app.route('/contratos/past-due')
+def contratos_past_due():
+    """ Open contracts past their due date with outstanding debt.
+
+    Answered from the index kept by 'indexer.py', the optional 'now' query
+    parameter is the unix timestamp to compare due dates with.
+    """
+    now = request.args.get('now', type=int)
+    return json.dumps(contract_index.past_due(now))
+
+
+@app.route('/contratos/state/<address>')
+def contrato_state(address):
+    """ Indexed state of a deployed contract. """
+    try:
+        contract = contract_index.get(address)
+    except ValueError as e:
+        return json.dumps({'error': str(e)}), 400
+    if contract is None:
+        return json.dumps({'error': 'Unknown contract'}), 404
+
+    return json.dumps(contract)
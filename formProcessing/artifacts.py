@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import hashlib
+import solc
+
+# Only relative imports of whole files are supported: import "./Other.sol";
+IMPORT_RE = re.compile(r'^import\s+"(\.{1,2}/[^"]+)"\s*;[ \t]*$', re.MULTILINE)
+
+
+class ArtifactStore:
+    """ Content addressed store of compiled contracts.
+
+    Each artifact holds the ABI and Bytecode of one contract and is identified
+    by the SHA256 of the contract source, the compiler version and the compiler
+    settings, so a given source is compiled only once. Artifacts are kept in
+    memory and persisted as JSON files in 'cache_dir' to be shared between
+    processes and restarts.
+
+    Attributes:
+        cache_dir (str): Folder where the artifact files are stored.
+        optimize (bool): Whether to compile with the optimizer enabled.
+    """
+
+    def __init__(self, cache_dir, optimize=True):
+        """ Create a store persisting its artifacts in 'cache_dir'.
+
+        Args:
+            cache_dir (str): Folder where the artifact files are stored, it is
+                created if it doesn't exist.
+            optimize (bool): Whether to compile with the optimizer enabled.
+        """
+        self.cache_dir = cache_dir
+        self.optimize = optimize
+        self._compiler_version = None
+        self._artifacts = {}
+        # (path, contract name) -> (((path, mtime, size), ...), artifact id)
+        self._files = {}
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def compiler_version(self):
+        """ str: Version of the installed 'solc', queried only once. """
+        if self._compiler_version is None:
+            self._compiler_version = str(solc.get_solc_version())
+        return self._compiler_version
+
+    def artifact_id(self, contract_name, source_code):
+        """ Compute the identifier of the artifact for the given source.
+
+        Args:
+            contract_name (str): The contract's name.
+            source_code (str): The contract's plain source code.
+
+        Returns:
+            str: Hex digest of the SHA256 of the source and compiler settings.
+        """
+        key = json.dumps({
+            'name': contract_name,
+            'source': hashlib.sha256(source_code.encode('utf-8')).hexdigest(),
+            'solc': self.compiler_version,
+            'optimize': self.optimize
+        }, sort_keys=True)
+
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _artifact_path(self, artifact_id):
+        return os.path.join(self.cache_dir, '%s.json' % artifact_id)
+
+    def get(self, artifact_id):
+        """ Get a compiled contract by its identifier.
+
+        Args:
+            artifact_id (str): Identifier returned by 'compile' or
+                'compile_file'.
+
+        Returns:
+            dict: With keys 'name', 'abi' and 'bin' of the compiled contract.
+
+        Raises:
+            KeyError: If there isn't an artifact with the given identifier.
+        """
+        if artifact_id not in self._artifacts:
+            try:
+                with open(self._artifact_path(artifact_id), 'r') as f:
+                    self._artifacts[artifact_id] = json.load(f)
+            except FileNotFoundError:
+                raise KeyError('Unknown contract artifact: ' + artifact_id)
+
+        return self._artifacts[artifact_id]
+
+    def _save(self, artifact_id, artifact):
+        # Write to a temporary file first so other processes never read a
+        # partially written artifact
+        path = self._artifact_path(artifact_id)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(artifact, f)
+        os.replace(tmp_path, path)
+
+    def compile(self, contract_name, source_code):
+        """ Compile the contract unless it is already in the store.
+
+        Args:
+            contract_name (str): The contract's name.
+            source_code (str): The contract's plain source code.
+
+        Returns:
+            str: The artifact identifier to use with 'get'.
+        """
+        artifact_id = self.artifact_id(contract_name, source_code)
+
+        try:
+            self.get(artifact_id)
+        except KeyError:
+            compiled_sol = solc.compile_source(
+                source_code, optimize=self.optimize)
+            contract_interface = compiled_sol['<stdin>:' + contract_name]
+            artifact = {
+                'name': contract_name,
+                'abi': contract_interface['abi'],
+                'bin': contract_interface['bin']
+            }
+            self._save(artifact_id, artifact)
+            self._artifacts[artifact_id] = artifact
+
+        return artifact_id
+
+    @staticmethod
+    def _stat(paths):
+        stats = []
+        for path in paths:
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(stats)
+
+    def read_source(self, file_path, _read=None):
+        """ Read a solidity file inlining the files it imports.
+
+        'compile' passes the source to solc through stdin, where imports can't
+        be resolved, so relative imports are replaced by the imported file,
+        each file being included only once.
+
+        Args:
+            file_path (str): File path to the contract's solidity file.
+
+        Returns:
+            (str, list): The source code and the paths of all the files read.
+        """
+        read = [] if _read is None else _read
+        path = os.path.abspath(file_path)
+        if path in read:
+            return '', read
+        read.append(path)
+
+        with open(path, 'r') as f:
+            source_code = f.read()
+
+        def inline(match):
+            imported = os.path.join(os.path.dirname(path), match.group(1))
+            return self.read_source(imported, read)[0]
+
+        return IMPORT_RE.sub(inline, source_code), read
+
+    def compile_file(self, contract_name, file_path):
+        """ Compile the contract in the given file unless already compiled.
+
+        The files are read again only when the modification time or size of
+        the file, or of any file it imports, changes.
+
+        Args:
+            contract_name (str): The contract's name.
+            file_path (str): File path to the contract's solidity file.
+
+        Returns:
+            str: The artifact identifier to use with 'get'.
+        """
+        key = (os.path.abspath(file_path), contract_name)
+        known = self._files.get(key)
+
+        try:
+            if known and self._stat(p for p, _, _ in known[0]) == known[0]:
+                return known[1]
+        except FileNotFoundError:
+            pass  # An imported file is gone, read the sources again
+
+        source_code, paths = self.read_source(file_path)
+        stats = self._stat(paths)
+
+        artifact_id = self.compile(contract_name, source_code)
+        self._files[key] = (stats, artifact_id)
+
+        return artifact_id
@@ -0,0 +1,78 @@
+""" Compare deploying the whole CreativeContract against deploying clones.
+
+Deploys the same contract data repeatedly with each mode on a local chain and
+reports the gas used, the transaction's calldata size and the time to submit
+and mine each deployment.
+"""
+import argparse
+import statistics
+import common
+
+
+def deploy_full(sc, store, artifact_id):
+    return sc.deploy_artifact(store, artifact_id)
+
+
+def deploy_clone(sc, store, factory_id, factory_address):
+    return sc.deploy_clone(store.get(factory_id)['abi'], factory_address)
+
+
+def measure(sc, deploy, count):
+    gas_used = []
+    calldata = []
+    seconds = []
+
+    for _ in range(count):
+        with common.Timer() as timer:
+            tx_hash = deploy()
+            receipt = sc.w3.eth.waitForTransactionReceipt(tx_hash)
+
+        tx_input = sc.w3.eth.getTransaction(tx_hash)['input']
+        gas_used.append(receipt['gasUsed'])
+        calldata.append((len(tx_input) - 2) // 2)  # Hex string with '0x'
+        seconds.append(timer.elapsed)
+
+    return {
+        'count': count,
+        'gas_used': statistics.mean(gas_used),
+        'calldata_bytes': statistics.mean(calldata),
+        'seconds_mean': statistics.mean(seconds),
+        'seconds_median': statistics.median(seconds)
+    }
+
+
+def main(count):
+    sc = common.local_chain()
+    store = common.artifact_store()
+
+    full_id = store.compile_file('CreativeContract',
+                                 common.contract_file('CreativeContract.sol'))
+    factory_file = common.contract_file('CreativeContractFactory.sol')
+    template_id = store.compile_file('CreativeContractTemplate', factory_file)
+    factory_id = store.compile_file('CreativeContractFactory', factory_file)
+
+    factory_address = sc.deploy_factory(store, template_id, factory_id)
+    sc.set_contract_data(**common.SAMPLE_CONTRACT_DATA)
+
+    results = {
+        'full': measure(sc, lambda: deploy_full(sc, store, full_id), count),
+        'clone': measure(
+            sc, lambda: deploy_clone(sc, store, factory_id, factory_address),
+            count)
+    }
+
+    for mode, result in sorted(results.items()):
+        print('%-6s gas=%9.0f calldata=%6.0fB time=%.4fs' %
+              (mode, result['gas_used'], result['calldata_bytes'],
+               result['seconds_median']))
+    print('Gas saved per contract: %.1f%%' %
+          (100 * (1 - results['clone']['gas_used'] /
+                  results['full']['gas_used'])))
+    print('Results ==> ', common.write_results('clone_gas', results))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=20,
+                        help='Deployments measured per mode')
+    main(parser.parse_args().count)
@@ -0,0 +1,122 @@
+""" Measure the gas used by each CreativeContract operation.
+
+Every scenario deploys a new contract on a local chain and runs the
+transactions of one of its flows: fund, settle, rebate, claim and cancel. The
+chain's clock is moved forward when a flow needs the contract to be delivered
+or due. Give '--file' to measure another revision of the contract, e.g. one
+extracted with 'git show'.
+"""
+import argparse
+import common
+
+ETHER = 10**18
+
+
+class Scenario:
+    """ A deployed contract and the accounts of its parties. """
+
+    def __init__(self, sc, artifact):
+        self.w3 = sc.w3
+        self.business, self.customer, self.oracle = sc.w3.eth.accounts[:3]
+        self.gas = {}
+
+        now = self.w3.eth.getBlock('latest')['timestamp']
+        sc.set_deployment_account(self.business)
+        sc.set_contract_data(
+            customer_address=self.customer,
+            oracle_address=self.oracle,
+            contract_amount=ETHER,
+            oracle_fee=ETHER // 100,
+            lcurl=common.SAMPLE_CONTRACT_DATA['lcurl'],
+            lchash=common.SAMPLE_CONTRACT_DATA['lchash'],
+            contract_settlement_ts=now + 1000,
+            contract_duedate_ts=now + 2000,
+            contract_delivery_ts=now + 3000)
+
+        receipt = self._wait(sc.deploy_compiled(artifact['abi'],
+                                                artifact['bin']))
+        self.gas['constructor'] = receipt['gasUsed']
+        self.contract = self.w3.eth.contract(
+            address=receipt['contractAddress'], abi=artifact['abi'])
+
+    def _wait(self, tx_hash):
+        receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+        if receipt.get('status') == 0:
+            raise RuntimeError('Transaction reverted')
+        return receipt
+
+    def call(self, name, function, sender, value=0):
+        tx_hash = getattr(self.contract.functions, function)().transact({
+            'from': sender,
+            'value': value
+        })
+        self.gas[name] = self._wait(tx_hash)['gasUsed']
+
+    def after(self, seconds):
+        now = self.w3.eth.getBlock('latest')['timestamp']
+        self.w3.testing.timeTravel(now + seconds)
+        self.w3.testing.mine(1)
+
+
+def fund(s):
+    s.call('fund_first', 'fund', s.customer, ETHER // 2)
+    s.call('fund_rest', 'fund', s.customer, ETHER // 2)
+
+
+def settle(s):
+    s.call('fund_full', 'fund', s.customer, ETHER)
+    s.after(4000)
+    s.call('settle_intent', 'settle', s.business)
+    s.call('settle', 'settle', s.oracle)
+
+
+def rebate(s):
+    s.call('fund_full', 'fund', s.customer, ETHER)
+    s.after(4000)
+    s.call('rebate_intent', 'rebate', s.customer)
+    s.call('rebate', 'rebate', s.oracle)
+
+
+def claim(s):
+    s.call('fund_fee', 'fund', s.customer, ETHER // 100)
+    s.after(2500)
+    s.call('claim', 'claim', s.business)
+
+
+def cancel(s):
+    s.call('cancel_intent', 'cancel', s.business)
+    s.call('cancel', 'cancel', s.customer)
+
+
+SCENARIOS = [fund, settle, rebate, claim, cancel]
+
+
+def main(file_path, name):
+    sc = common.local_chain()
+    store = common.artifact_store()
+    artifact = store.get(store.compile_file(name, file_path))
+
+    results = {}
+    for scenario in SCENARIOS:
+        s = Scenario(sc, artifact)
+        try:
+            scenario(s)
+        except Exception as e:
+            print('%s failed: %s' % (scenario.__name__, e))
+        results[scenario.__name__] = s.gas
+
+        for operation, gas in sorted(s.gas.items()):
+            print('%-8s %-14s %8d' % (scenario.__name__, operation, gas))
+
+    print('Results ==> ', common.write_results('contract_gas', results))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--file',
+                        default=common.contract_file('CreativeContract.sol'),
+                        help='Solidity file with the contract')
+    parser.add_argument('--name', default='CreativeContract',
+                        help='Name of the contract in the file')
+    args = parser.parse_args()
+    main(args.file, args.name)
@@ -0,0 +1,241 @@
+""" Measure the contract pipeline, from the event data to the deployed PDF.
+
+Runs the app's own code and celery tasks offline: celery runs eagerly, the
+chain is an in-process eth-tester and the PDFs are rendered from the real
+templates into a temporary folder. Jobs, nonces and receipts still need a
+local Redis, a database is used only by this benchmark and flushed first.
+
+First measures the latency of each stage of a single contract: render, hash,
+compile (cold and cached), sign, submit, mine and render of the deployed PDF.
+Then the sustained throughput of the pipeline at each concurrency level, with
+that many rendering processes and the chain (which isn't thread safe) used by
+one contract at a time.
+"""
+import os
+import time
+import hashlib
+import argparse
+import contextlib
+import tempfile
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import common
+
+# Arguments of the CreativeContract's constructor, in order
+CONSTRUCTOR_ARGS = ('customer_address', 'oracle_address', 'contract_amount',
+                    'oracle_fee', 'lcurl', 'lchash', 'contract_settlement_ts',
+                    'contract_duedate_ts', 'contract_delivery_ts')
+
+TMP_DIR = tempfile.mkdtemp(prefix='bench-pipeline-')
+
+# The app is configured from the environment when imported
+os.environ.setdefault('CELERY_BROKER_URL', 'redis://localhost:6379/15')
+os.environ.setdefault('CELERY_RESULT_BACKEND', os.environ['CELERY_BROKER_URL'])
+os.environ['ETH_SIGN_LOCALLY'] = 'True'
+os.environ['CONTRACTS_DIR'] = os.path.join(TMP_DIR, 'contratos')
+os.environ['CC_INDEX_DB'] = os.path.join(TMP_DIR, 'contracts.sqlite')
+os.environ['CC_ARTIFACTS_DIR'] = os.path.join(common.HERE, '.artifacts')
+os.environ['CC_FILE'] = common.contract_file('CreativeContract.sol')
+
+
+def summary(seconds):
+    return {
+        'count': len(seconds),
+        'seconds_mean': statistics.mean(seconds),
+        'seconds_median': statistics.median(seconds),
+        'seconds_max': max(seconds)
+    }
+
+
+class TaskTimes:
+    """ Records how long each celery task runs, from its signals. """
+
+    def __init__(self):
+        from celery.signals import task_prerun, task_postrun
+
+        self.seconds = {}
+        self._started = {}
+        task_prerun.connect(self._prerun, weak=False)
+        task_postrun.connect(self._postrun, weak=False)
+
+    def _prerun(self, task_id=None, **kwargs):
+        self._started[task_id] = time.perf_counter()
+
+    def _postrun(self, task_id=None, task=None, **kwargs):
+        elapsed = time.perf_counter() - self._started.pop(task_id)
+        self.seconds.setdefault(task.name, []).append(elapsed)
+
+
+def event_data(index):
+    # Different contracts, so every render and hash is a new one
+    event = common.load_test_data()
+    event['eventName'] = 'Benchmark event %d' % index
+    return event
+
+
+def setup():
+    from eth_account import Account
+
+    account = Account.create()
+    os.environ['ETH_USER_PKEY'] = account.privateKey.hex()
+
+    # Imported together, so the web app runs the tasks instead of sending
+    # them to a worker
+    import tasks
+    import app
+
+    tasks.celery.conf.update(
+        CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
+    tasks.redis_client.flushdb()
+
+    # Every task uses the in-process chain instead of connecting to a node
+    sc = common.local_chain()
+
+    @contextlib.contextmanager
+    def client(*args, **kwargs):
+        yield sc
+
+    tasks.client_pool.client = client
+    sc.w3.eth.sendTransaction({
+        'from': sc.w3.eth.accounts[0],
+        'to': account.address,
+        'value': 10**21
+    })
+
+    return app, tasks, sc
+
+
+def deploy(app, tasks, contract_hash, index):
+    url = 'http://localhost/contratos/%s.pdf' % contract_hash
+    app.deploy_new_contract(contract_hash, url, event_data(index))
+    # Finds the receipt and renders the deployed PDF
+    tasks.track_deployments.apply()
+
+
+def measure_stages(app, tasks, sc, count):
+    from artifacts import ArtifactStore
+    from rendering import get_renderer
+    from utils import generate_pdf
+
+    task_times = TaskTimes()
+    renderer = get_renderer()
+    renderer.render_pdf(event_data(-1))  # Warm up the caches
+
+    stages = {'render': [], 'hash': [], 'sign': []}
+    for index in range(count):
+        with common.Timer() as timer:
+            contract_hash = generate_pdf(event_data(index),
+                                         app.contract_storage)
+        stages['render'].append(timer.elapsed)
+
+        pdf = app.contract_storage.read(contract_hash)
+        with common.Timer() as timer:
+            hashlib.sha256(pdf).hexdigest()
+        stages['hash'].append(timer.elapsed)
+
+        # Same transaction 'submit_deployment' sends, without sending it
+        tasks.use_deployment_account(sc)
+        sc.set_contract_data(**common.SAMPLE_CONTRACT_DATA)
+        artifact = tasks.artifact_store.get(tasks.contract_artifact_id())
+        contract = sc.w3.eth.contract(
+            abi=artifact['abi'], bytecode=artifact['bin'])
+        with common.Timer() as timer:
+            transaction = contract.constructor(
+                *[sc.contract_data[field] for field in CONSTRUCTOR_ARGS]
+            ).buildTransaction(dict(sc.transaction_defaults(), nonce=0))
+            sc.signing_account.signTransaction(transaction)
+        stages['sign'].append(timer.elapsed)
+
+        deploy(app, tasks, contract_hash, index)
+
+    results = {stage: summary(seconds) for stage, seconds in stages.items()}
+
+    # Compiling from scratch, and once compiled
+    store = ArtifactStore(os.path.join(TMP_DIR, 'artifacts'))
+    file_path = common.contract_file('CreativeContract.sol')
+    with common.Timer() as timer:
+        store.compile_file('CreativeContract', file_path)
+    results['compile_cold'] = summary([timer.elapsed])
+    with common.Timer() as timer:
+        store.compile_file('CreativeContract', file_path)
+    results['compile_cached'] = summary([timer.elapsed])
+
+    # Sign, submit and track with the nonce, receipt and job bookkeeping
+    seconds = task_times.seconds
+    results['submit'] = summary(seconds['tasks.submit_deployment'])
+    results['render_deployed'] = summary(
+        seconds['tasks.render_deployed_contract'])
+    # Finding the receipts, the deployed PDF is rendered within the task
+    results['mine'] = summary([
+        track - render for track, render in zip(
+            seconds['tasks.track_deployments'],
+            seconds['tasks.render_deployed_contract'])
+    ])
+
+    return results
+
+
+def measure_throughput(app, tasks, concurrency, count):
+    from renderpool import RenderPool
+    from utils import generate_pdf
+
+    pool = RenderPool(workers=concurrency, max_pending=concurrency)
+    chain_lock = threading.Lock()
+
+    def pipeline(index):
+        contract_hash = pool.submit(generate_pdf, event_data(index),
+                                    app.contract_storage).result()
+        with chain_lock:
+            deploy(app, tasks, contract_hash, index)
+
+    try:
+        # Start the rendering processes before measuring
+        list(ThreadPoolExecutor(concurrency).map(
+            lambda i: pool.submit(generate_pdf, event_data(-1),
+                                  app.contract_storage).result(),
+            range(concurrency)))
+
+        with common.Timer() as timer:
+            with ThreadPoolExecutor(concurrency) as executor:
+                list(executor.map(pipeline, range(count)))
+    finally:
+        pool.shutdown()
+
+    return {
+        'concurrency': concurrency,
+        'count': count,
+        'seconds': timer.elapsed,
+        'contracts_per_second': count / timer.elapsed
+    }
+
+
+def main(count, concurrency_levels):
+    app, tasks, sc = setup()
+
+    results = {
+        'stages': measure_stages(app, tasks, sc, count),
+        'throughput': []
+    }
+    for stage, result in sorted(results['stages'].items()):
+        print('%-16s median=%.4fs' % (stage, result['seconds_median']))
+
+    for concurrency in concurrency_levels:
+        result = measure_throughput(app, tasks, concurrency,
+                                    count * concurrency)
+        results['throughput'].append(result)
+        print('concurrency=%-3d %.2f contracts/s' %
+              (concurrency, result['contracts_per_second']))
+
+    print('Results ==> ', common.write_results('pipeline', results))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=5,
+                        help='Contracts measured per stage and per '
+                        'concurrency unit')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 4], help='Concurrency levels')
+    args = parser.parse_args()
+    main(args.count, args.concurrency)
@@ -0,0 +1,75 @@
+""" Compare rendering the contract's PDF with and without the renderer caches.
+
+The uncached mode renders as the app used to: the stylesheet inlined in the
+HTML and parsed on every render, and every image and font fetched again. The
+cached mode reuses the ContractRenderer's compiled template, parsed
+stylesheet and fetched resources. The compact mode is the cached one with
+the renderer's compact mode on, downsampling the images and compressing the
+PDF. Reports the time, the peak of Python memory allocated by each render
+and the size of the PDF.
+"""
+import argparse
+import statistics
+import tracemalloc
+import common
+from weasyprint import HTML
+from rendering import BASE_URL, ContractRenderer
+
+
+def render_uncached(renderer, event_data):
+    html = renderer.template.render(e=event_data, external_stylesheet=False)
+    return HTML(string=html, base_url=BASE_URL,
+                url_fetcher=renderer._fetch).write_pdf()
+
+
+def render_cached(renderer, event_data):
+    return renderer.render_pdf(event_data)
+
+
+def measure(render, renderer, event_data, count):
+    render(renderer, event_data)  # Warm up (and fill the caches)
+
+    seconds = []
+    peaks = []
+    for _ in range(count):
+        tracemalloc.start()
+        with common.Timer() as timer:
+            pdf = render(renderer, event_data)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        seconds.append(timer.elapsed)
+
+    return {
+        'count': count,
+        'seconds_mean': statistics.mean(seconds),
+        'seconds_median': statistics.median(seconds),
+        'peak_bytes_mean': statistics.mean(peaks),
+        'pdf_bytes': len(pdf)
+    }
+
+
+def main(count):
+    renderer = ContractRenderer()
+    compact_renderer = ContractRenderer(compact=True)
+    event_data = common.load_test_data()
+
+    results = {
+        'uncached': measure(render_uncached, renderer, event_data, count),
+        'cached': measure(render_cached, renderer, event_data, count),
+        'compact': measure(render_cached, compact_renderer, event_data,
+                           count)
+    }
+
+    for mode, result in sorted(results.items()):
+        print('%-9s time=%.4fs peak=%.1fMiB size=%.1fKiB' %
+              (mode, result['seconds_median'],
+               result['peak_bytes_mean'] / 2**20,
+               result['pdf_bytes'] / 2**10))
+    print('Results ==> ', common.write_results('render', results))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=20,
+                        help='Renders measured per mode')
+    main(parser.parse_args().count)
@@ -0,0 +1,92 @@
+""" Measure the import time and memory of the app's entry points.
+
+Each module is imported by a new interpreter, as the web server or celery
+would do when starting a process, and the seconds spent importing it, its
+maximum RSS and its number of loaded modules are measured. A bare
+interpreter ('os') is measured too as the baseline.
+
+To compare with another revision, measure a checkout of it:
+
+    git worktree add /tmp/before HEAD~1
+    python benchmarks/bench_startup.py --app-dir /tmp/before/formProcessing \
+        --modules app
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+import common
+
+PROBE = '''
+import sys
+import time
+import json
+import resource
+
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+
+print(json.dumps({{
+    'seconds': elapsed,
+    # Kilobytes on Linux
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules)
+}}))
+'''
+
+# Never funded, only so the workers' modules can be imported
+DUMMY_PKEY = '0x' + '11' * 32
+
+
+def measure(module, app_dir, env):
+    output = subprocess.check_output(
+        [sys.executable, '-c', PROBE.format(module=module)],
+        cwd=app_dir,
+        env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(modules, app_dir, repeat):
+    tmp_dir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(
+        os.environ,
+        ETH_USER_PKEY=os.getenv('ETH_USER_PKEY', DUMMY_PKEY),
+        CONTRACTS_DIR=os.path.join(tmp_dir, 'contratos'),
+        CC_INDEX_DB=os.path.join(tmp_dir, 'contracts.sqlite'),
+        CC_ARTIFACTS_DIR=os.path.join(common.HERE, '.artifacts'))
+
+    results = {'app_dir': os.path.abspath(app_dir), 'modules': {}}
+    for module in ['os'] + modules:
+        # The first import also compiles the bytecode, not measured
+        measure(module, app_dir, env)
+        runs = [measure(module, app_dir, env) for _ in range(repeat)]
+
+        result = {
+            'seconds_median': statistics.median(r['seconds'] for r in runs),
+            'max_rss_mb_median': statistics.median(r['max_rss_mb']
+                                                   for r in runs),
+            'modules': runs[-1]['modules']
+        }
+        results['modules'][module] = result
+        print('%-8s %.3fs %6.1fMB %5d modules' %
+              (module, result['seconds_median'], result['max_rss_mb_median'],
+               result['modules']))
+
+    print('Results ==> ', common.write_results('startup', results))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=['app', 'worker'],
+                        help='Entry points to import')
+    parser.add_argument('--app-dir', default=os.path.dirname(common.HERE),
+                        help='Folder of the app to measure')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Imports measured for each module')
+    args = parser.parse_args()
+    main(args.modules, args.app_dir, args.repeat)
@@ -0,0 +1,123 @@
+""" Helpers shared by the benchmarks.
+
+Benchmarks run fully offline against an in-process chain (eth-tester), so
+they need the packages in 'requirements.txt' besides the application ones and
+'solc' to compile the contracts. Run them from the 'formProcessing' folder:
+
+    python benchmarks/bench_clone_gas.py
+"""
+import os
+import sys
+import json
+import time
+import platform
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))  # To import the app's modules
+
+CONTRACTS_DIR = os.path.join(HERE, '..', '..', 'contracts')
+RESULTS_DIR = os.path.join(HERE, 'results')
+
+SAMPLE_CONTRACT_DATA = {
+    'customer_address': '0x14723a09acff6d2a60dcdf7aa4aff308fddc160c',
+    'oracle_address': '0x4b0897b0513fdc7c541b6d9d7e929c4e5364d2db',
+    'contract_amount': 10,
+    'oracle_fee': 1,
+    'lcurl': 'http://www.creativecontract.org',
+    'lchash': 'B221D9DBB083A7F33428D7C2A3C3198AE925614D70210E28716CCAA7CD4DDB79',
+    'contract_duedate_ts': 1544779800,
+    'contract_settlement_ts': 1545384600,
+    'contract_delivery_ts': 1546384600
+}
+
+
+def local_chain():
+    """ Create a client connected to a new in-process chain.
+
+    Returns:
+        SmartContract: Client deploying with the first (funded) test account.
+    """
+    from web3 import EthereumTesterProvider
+    from smartcontract import SmartContract
+
+    sc = SmartContract(None, provider=EthereumTesterProvider())
+
+    # A new chain has too few blocks to sample gas prices from
+    sc.w3.eth.setGasPriceStrategy(None)
+    sc.set_deployment_account(sc.w3.eth.accounts[0])
+
+    return sc
+
+
+def artifact_store():
+    """ Get the artifact store used by the benchmarks.
+
+    Returns:
+        ArtifactStore: Store caching the contracts compiled by benchmarks.
+    """
+    from artifacts import ArtifactStore
+
+    return ArtifactStore(os.path.join(HERE, '.artifacts'))
+
+
+def contract_file(file_name):
+    """ Get the path of one of the repo's solidity files.
+
+    Args:
+        file_name (str): Name of the file in the 'contracts' folder.
+
+    Returns:
+        str: Path to the file.
+    """
+    return os.path.join(CONTRACTS_DIR, file_name)
+
+
+class Timer:
+    """ Context manager measuring the seconds spent in its block.
+
+    Attributes:
+        elapsed (float): Seconds spent in the block once it exits.
+    """
+
+    def __enter__(self):
+        self.elapsed = None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._start
+
+
+def load_test_data():
+    """ Load the sample event data posted by the test clients.
+
+    Returns:
+        dict: The contents of 'test/test_data.json'.
+    """
+    with open(os.path.join(HERE, '..', 'test', 'test_data.json'), 'r') as f:
+        return json.load(f)
+
+
+def write_results(name, results):
+    """ Write the results of a benchmark as JSON in the 'results' folder.
+
+    Args:
+        name (str): Name of the benchmark, used as file name.
+        results (dict): JSON serializable measurements.
+
+    Returns:
+        str: Path to the written file.
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, '%s.json' % name)
+
+    with open(path, 'w') as f:
+        json.dump({
+            'benchmark': name,
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+    return path
@@ -0,0 +1,345 @@
+""" Deploy many contracts at once, without the web app nor celery.
+
+The constructor arguments of each contract are read from a CSV file (with a
+header) or a JSONL file, with the fields of 'SmartContract.set_contract_data'
+and optionally an 'id'. The contract is compiled once, transactions are
+signed locally with the account of 'ETH_USER_PKEY' and sent concurrently.
+
+Every row's transaction hash, and then its contract address, is appended to a
+results file as soon as it is known. Running the same command again resumes
+from it: deployed rows are skipped and sent ones are waited for instead of
+being sent again.
+
+    ETH_USER_PKEY="Some Secret Key" python bulkdeploy.py contracts.csv
+"""
+import os
+import csv
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from artifacts import ArtifactStore
+from nonces import LocalNonceAllocator
+from smartcontract import SmartContract
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CONTRACT_FIELDS = ('customer_address', 'oracle_address', 'contract_amount',
+                   'oracle_fee', 'lcurl', 'lchash', 'contract_duedate_ts',
+                   'contract_settlement_ts', 'contract_delivery_ts')
+INT_FIELDS = ('contract_amount', 'oracle_fee', 'contract_duedate_ts',
+              'contract_settlement_ts', 'contract_delivery_ts')
+
+
+def read_rows(file_path):
+    """ Read the contracts to deploy.
+
+    Args:
+        file_path (str): CSV file (by its '.csv' extension) or JSONL file.
+
+    Returns:
+        list: Tuples with the identifier of each row, its 'id' field or its
+            line number, and its contract data.
+
+    Raises:
+        ValueError: If a row is missing a field or has an invalid number.
+    """
+    with open(file_path, 'r', newline='') as f:
+        if file_path.endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    contracts = []
+    for number, row in enumerate(rows, 1):
+        row_id = str(row.get('id') or number)
+        missing = [field for field in CONTRACT_FIELDS if field not in row]
+        if missing:
+            raise ValueError('Row %s is missing %s' % (row_id,
+                                                       ', '.join(missing)))
+
+        contract_data = {field: row[field] for field in CONTRACT_FIELDS}
+        try:
+            for field in INT_FIELDS:
+                contract_data[field] = int(contract_data[field])
+        except ValueError as e:
+            raise ValueError('Row %s has an invalid number: %s' % (row_id, e))
+        contracts.append((row_id, contract_data))
+
+    return contracts
+
+
+class Results:
+    """ Append only log of the deployments, read back to resume them.
+
+    Each line is the JSON of everything known about a row so far, the last
+    line of a row wins.
+    """
+
+    def __init__(self, file_path):
+        """ Load the results of previous runs, if any, and open the log.
+
+        Args:
+            file_path (str): The JSONL results file.
+        """
+        self.rows = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                for line in f:
+                    # The last line may be cut by an interruption
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.rows[result['id']] = result
+
+        self._file = open(file_path, 'a')
+        self._lock = threading.Lock()
+
+    def get(self, row_id):
+        """ Everything known about a row, an empty dict if nothing. """
+        return self.rows.get(row_id, {})
+
+    def record(self, row_id, **fields):
+        """ Update the result of a row and write it to disk right away.
+
+        Args:
+            row_id (str): Identifier of the row.
+            **fields: Fields of the result to set.
+        """
+        with self._lock:
+            result = dict(self.get(row_id), id=row_id, **fields)
+            self.rows[row_id] = result
+            self._file.write(json.dumps(result) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """ Close the log. """
+        self._file.close()
+
+
+class BulkDeployer:
+    """ Deploys contracts from many threads sharing one account.
+
+    Each thread has its own client, the account's nonces are allocated in
+    this process and the gas price is computed only once.
+
+    Attributes:
+        abi (list): ABI of the deployed contract, or of the factory.
+        bytecode (str): Bytecode of the deployed contract, None to deploy
+            clones with the factory.
+        factory_address (str): Address of the CreativeContractFactory.
+        gas_price (int): Gas price of every transaction, in wei.
+        timeout (int): Seconds to wait for each transaction to be mined.
+    """
+
+    def __init__(self,
+                 node_uri,
+                 private_key,
+                 abi,
+                 bytecode=None,
+                 factory_address=None,
+                 use_ipc=False,
+                 use_poa=False,
+                 gas_price=None,
+                 timeout=600):
+        """ Create the deployer, connecting to the node.
+
+        Args:
+            node_uri (str): HTTP address or IPC path of the node.
+            private_key (str): Private key of the deploying account.
+            abi (list): ABI of the deployed contract, or of the factory.
+            bytecode (str): Bytecode of the contract, None to deploy clones.
+            factory_address (str): Address of the CreativeContractFactory.
+            use_ipc (bool): Whether 'node_uri' is an IPC path.
+            use_poa (bool): Whether the chain uses PoA (Rinkeby).
+            gas_price (int): Gas price in wei, by default computed once.
+            timeout (int): Seconds to wait for each transaction to be mined.
+        """
+        self.abi = abi
+        self.bytecode = bytecode
+        self.factory_address = factory_address
+        self.timeout = timeout
+        self._node = (node_uri, use_ipc, use_poa)
+        self._private_key = private_key
+        self._local = threading.local()
+
+        if gas_price is None:
+            # SmartContract's default time based strategy, sampling the last blocks
+            gas_price = SmartContract(*self._node).w3.eth.generateGasPrice()
+        self.gas_price = gas_price
+
+        self.nonces = None
+        sc = self.client()
+        self.nonces = LocalNonceAllocator(sc.w3, sc.default_account)
+        sc.nonce_manager = self.nonces
+
+    def client(self):
+        """ Get the client of the current thread.
+
+        Returns:
+            SmartContract: Client signing with the deploying account.
+        """
+        sc = getattr(self._local, 'sc', None)
+        if sc is None:
+            sc = SmartContract(
+                *self._node,
+                gas_price_strategy=lambda w3, tx: self.gas_price)
+            sc.load_account(self._private_key)
+            sc.nonce_manager = self.nonces
+            self._local.sc = sc
+        return sc
+
+    def send(self, contract_data):
+        """ Send the deployment of one contract.
+
+        Args:
+            contract_data (dict): Arguments of 'set_contract_data'.
+
+        Returns:
+            bytes: The hash of the deployment transaction.
+        """
+        sc = self.client()
+        sc.set_contract_data(**contract_data)
+        if self.bytecode is None:
+            return sc.deploy_clone(self.abi, self.factory_address)
+        return sc.deploy_compiled(self.abi, self.bytecode)
+
+    def deploy(self, row_id, contract_data, results):
+        """ Deploy one contract, or resume its deployment.
+
+        Args:
+            row_id (str): Identifier of the row.
+            contract_data (dict): Arguments of 'set_contract_data'.
+            results (Results): Log of the deployments.
+
+        Returns:
+            dict: The row's result.
+        """
+        sc = self.client()
+        tx_hash = results.get(row_id).get('txHash')
+
+        # Sent by a previous run, unless the node dropped it
+        if tx_hash is None or sc.w3.eth.getTransaction(tx_hash) is None:
+            tx_hash = self.send(contract_data).hex()
+            results.record(row_id, txHash=tx_hash, error=None)
+
+        receipt = sc.w3.eth.waitForTransactionReceipt(
+            tx_hash, timeout=self.timeout)
+        if self.bytecode is None:
+            address = sc.clone_address(self.abi, receipt)
+        else:
+            address = receipt['contractAddress']
+
+        failed = receipt.get('status') == 0 or not address
+        results.record(
+            row_id,
+            contractAddress=address,
+            blockNumber=receipt['blockNumber'],
+            status='failed' if failed else 'mined')
+
+        return results.get(row_id)
+
+
+def main(args):
+    private_key = os.getenv('ETH_USER_PKEY')
+    if not private_key:
+        raise SystemExit('Set ETH_USER_PKEY with the deploying private key')
+
+    rows = read_rows(args.input)
+    results = Results(args.results or args.input + '.results.jsonl')
+
+    # Compiled once for all the rows, and only if the source changed
+    store = ArtifactStore(args.artifacts_dir)
+    if args.factory_address:
+        artifact = store.get(
+            store.compile_file('CreativeContractFactory', args.factory_file))
+        bytecode = None
+    else:
+        artifact = store.get(
+            store.compile_file(args.contract_name, args.contract_file))
+        bytecode = artifact['bin']
+
+    deployer = BulkDeployer(
+        args.node_uri,
+        private_key,
+        artifact['abi'],
+        bytecode,
+        args.factory_address,
+        use_ipc=args.ipc,
+        use_poa=args.poa,
+        gas_price=args.gas_price,
+        timeout=args.timeout)
+
+    # Mined ones (even if failed, they would fail again) aren't retried
+    pending = [(row_id, contract_data) for row_id, contract_data in rows
+               if results.get(row_id).get('status') is None]
+    print('Deploying %d of %d contracts from %s' %
+          (len(pending), len(rows), deployer.client().default_account))
+
+    deployed = failed = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        deployments = {
+            executor.submit(deployer.deploy, row_id, contract_data, results):
+            row_id
+            for row_id, contract_data in pending
+        }
+        for deployment in as_completed(deployments):
+            row_id = deployments[deployment]
+            try:
+                result = deployment.result()
+            except Exception as e:
+                # Retried by the next run
+                results.record(row_id, error=str(e))
+                print('Row %s failed: %s' % (row_id, e))
+                failed += 1
+                continue
+
+            if result['status'] == 'mined':
+                deployed += 1
+            else:
+                failed += 1
+            print('Row %s %s: %s' % (row_id, result['status'],
+                                     result['contractAddress']))
+
+    results.close()
+    print('Deployed %d contracts, %d failed' % (deployed, failed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('input', help='CSV or JSONL file with the contracts')
+    parser.add_argument('--results',
+                        help='JSONL results file, by default next to the '
+                        'input file')
+    parser.add_argument('--node-uri',
+                        default=os.getenv('GETH_NODE_URI',
+                                          'http://localhost:8545'),
+                        help='HTTP address or IPC path of the node')
+    parser.add_argument('--ipc', action='store_true',
+                        help='The node URI is an IPC path')
+    parser.add_argument('--poa', action='store_true',
+                        help='The chain uses PoA (Rinkeby)')
+    parser.add_argument('--contract-file',
+                        default=os.path.join(HERE, '..', 'contracts',
+                                             'CreativeContract.sol'))
+    parser.add_argument('--contract-name', default='CreativeContract')
+    parser.add_argument('--factory-address',
+                        default=os.getenv('CC_FACTORY_ADDRESS'),
+                        help='Deploy clones with this factory instead')
+    parser.add_argument('--factory-file',
+                        default=os.path.join(HERE, '..', 'contracts',
+                                             'CreativeContractFactory.sol'))
+    parser.add_argument('--artifacts-dir',
+                        default=os.getenv('CC_ARTIFACTS_DIR',
+                                          os.path.join(HERE, '.artifacts')))
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Deployments in flight at once')
+    parser.add_argument('--gas-price', type=int,
+                        help='Gas price in wei, by default the node\'s')
+    parser.add_argument('--timeout', type=int, default=600,
+                        help='Seconds to wait for each deployment')
+
+    main(parser.parse_args())
@@ -0,0 +1,9 @@
+""" The celery app, shared by the web app sending tasks and the workers.
+
+Only the workers import the tasks (see 'tasks.py'), the web app sends them
+by name.
+"""
+import config
+from utils import make_celery
+
+celery = make_celery(config.as_dict())
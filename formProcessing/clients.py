@@ -0,0 +1,114 @@
+import time
+import threading
+import contextlib
+from smartcontract import SmartContract
+
+
+class ClientPool:
+    """ Long lived SmartContract clients reused between Celery tasks.
+
+    Each task checks out an idle client and gives it back once done, so a
+    client keeps its web3 provider (with its keep-alive HTTP session or open
+    IPC socket), its middleware caches, its gas price strategy and its
+    unlocked accounts from one task to the next. The pool only grows to the
+    number of tasks using a client at once, also with the gevent pool whose
+    greenlets don't live longer than a task.
+
+    Attributes:
+        check_interval (int): Seconds after which a client is health checked
+            again before being handed out.
+        gas_price_strategy (function): Web3 gas price strategy of the
+            clients, if None the SmartContract's default is used.
+        metrics (Metrics): Metrics recorded by the clients, if any.
+        rpc_counter (RPCCounter): Middleware counting the RPC requests of
+            the clients, if any.
+    """
+
+    def __init__(self,
+                 check_interval=30,
+                 gas_price_strategy=None,
+                 metrics=None,
+                 rpc_counter=None):
+        """ Create an empty pool.
+
+        Args:
+            check_interval (int): Seconds after which a client is health
+                checked again before being handed out.
+            gas_price_strategy (function): Web3 gas price strategy of the
+                clients, if None the SmartContract's default is used.
+            metrics (Metrics): Metrics recorded by the clients, if any.
+            rpc_counter (RPCCounter): Middleware counting the RPC requests of
+                the clients, if any.
+        """
+        self.check_interval = check_interval
+        self.gas_price_strategy = gas_price_strategy
+        self.metrics = metrics
+        self.rpc_counter = rpc_counter
+        self._lock = threading.Lock()
+        self._idle = {}  # Node -> list of idle (client, last check)
+
+    def _checkout(self, key):
+        node_uri, use_ipc, use_poa = key
+        now = time.monotonic()
+
+        while True:
+            with self._lock:
+                if not self._idle.get(key):
+                    break
+                sc, checked_at = self._idle[key].pop()
+
+            if now - checked_at < self.check_interval:
+                return sc, checked_at
+            if sc.is_connected():
+                return sc, now
+
+            # TODO Use the flask app's logger instead of print to stdout
+            # directly
+            print('Lost connection to the node, reconnecting: ', node_uri)
+            sc.close()
+
+        sc = SmartContract(
+            node_uri,
+            use_ipc,
+            use_poa,
+            gas_price_strategy=self.gas_price_strategy,
+            metrics=self.metrics,
+            rpc_counter=self.rpc_counter)
+        return sc, now
+
+    @contextlib.contextmanager
+    def client(self, node_uri, use_ipc=False, use_poa=False):
+        """ Check out a connected client for the given node.
+
+        The client is only used by the caller until the block exits, then it
+        goes back to the pool. A new client is created when there isn't an
+        idle one, or when the idle ones fail their health check.
+
+        Args:
+            node_uri (str): Either the http address of an ethereum node or the
+                path to the IPC file if 'use_ipc=True'.
+            use_ipc (bool): If True then 'node_uri' is a path to 'geth.ipc'.
+            use_poa (bool): If True then injects 'geth_poa_middleware'.
+
+        Yields:
+            SmartContract: Client without contract data nor nonce manager
+                set.
+        """
+        key = (node_uri, bool(use_ipc), bool(use_poa))
+        sc, checked_at = self._checkout(key)
+        try:
+            yield sc
+        finally:
+            # Left by the deployment, so tasks never share them
+            sc.contract_data = None
+            sc.nonce_manager = None
+            with self._lock:
+                self._idle.setdefault(key, []).append((sc, checked_at))
+
+    def close(self):
+        """ Close all the idle clients. """
+        with self._lock:
+            idle = [sc for clients in self._idle.values() for sc, _ in clients]
+            self._idle.clear()
+        for sc in idle:
+            sc.close()
@@ -0,0 +1,78 @@
+""" Make the contract's PDFs smaller, see 'ContractRenderer' compact mode.
+
+Cairo already subsets the fonts and compresses the pages and the images, so
+what's left is the size of the images themselves and what WeasyPrint appends
+to cairo's PDF: an incremental update with the metadata and the links, whose
+objects aren't compressed and which keeps the objects it replaces.
+"""
+import io
+
+# Longest side, in pixels, of the images embedded in compact PDFs. The
+# contract's images are shown at most 2 inches wide, so they still have
+# 300 DPI
+IMAGE_MAX_SIZE = 600
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def downsample_image(data, max_size=IMAGE_MAX_SIZE):
+    """ Downsample a PNG image to the resolution it is printed at.
+
+    Cairo embeds the pixels of PNG images (compressed again), so their size
+    in the PDF depends on the number of pixels. Other formats are returned
+    untouched.
+
+    Args:
+        data (bytes): The image as fetched.
+        max_size (int): Longest side of the downsampled image, in pixels.
+
+    Returns:
+        bytes: The downsampled PNG image, or 'data' if it didn't change.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    changed = max(image.size) > max_size
+    if changed:
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    # Cairo writes the alpha channel as another image (a soft mask), not
+    # needed when every pixel is opaque
+    if image.mode in ('RGBA', 'LA') and image.getextrema()[-1] == (255, 255):
+        image = image.convert(image.mode[:-1])
+        changed = True
+
+    if not changed:
+        return data
+
+    output = io.BytesIO()
+    # Cairo decodes it and compresses the pixels itself, so compressing it
+    # harder wouldn't make the PDF smaller
+    image.save(output, format='PNG', compress_level=1)
+    return output.getvalue()
+
+
+def compact_pdf(pdf):
+    """ Rewrite a PDF compressing its streams and dropping unused objects.
+
+    The PDF is written again with only the objects its trailer references,
+    as a single classic cross-reference table (as 'stamp.deployment_update'
+    expects), and every stream without a filter is deflated.
+
+    Args:
+        pdf (bytes): The PDF as written by WeasyPrint.
+
+    Returns:
+        bytes: The compacted PDF.
+    """
+    from pdfrw import PdfReader, PdfWriter
+
+    reader = PdfReader(fdata=pdf)
+    version = pdf[5:8].decode('latin-1')
+
+    output = io.BytesIO()
+    PdfWriter(output, version=version, compress=True, trailer=reader).write()
+    return output.getvalue()
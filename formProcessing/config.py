@@ -0,0 +1,143 @@
+""" Settings shared by the web app and the celery workers.
+
+Read from the environment, the web app loads them with
+'app.config.from_object' and celery from 'as_dict'. Only the standard library
+is imported here, so loading them costs nothing.
+"""
+import os
+
+
+def _flag(name):
+    """ Read a boolean setting, enabled only by 1, true or yes in any case. """
+    return os.getenv(name, '').strip().lower() in ('1', 'true', 'yes')
+
+
+# Celery will use the broker as a task queue
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND',
+                                  'redis://localhost:6379')
+
+# Options to connect to the Ethereum node used for deployment
+GETH_NODE_URI = os.getenv('GETH_NODE_URI', 'http://localhost:8565')
+GETH_USES_IPC = os.getenv('GETH_USES_IPC', False)
+GETH_USES_POA = os.getenv('GETH_USES_POA', False)
+
+# User account used to sign and deploy the contract
+ETH_USER_PKEY = os.getenv('ETH_USER_PKEY')
+ETH_USER_PASS = os.getenv('ETH_USER_PASS')
+# Or pool of accounts (comma separated) to spread the deployments among,
+# passphrases are only needed if the node signs the transactions
+ETH_DEPLOYER_PKEYS = os.getenv('ETH_DEPLOYER_PKEYS')
+ETH_DEPLOYER_PASSES = os.getenv('ETH_DEPLOYER_PASSES')
+# Addresses (comma separated) of every account that deploys or deployed our
+# contracts, 'indexer.py' only indexes the ones they or 'CC_FACTORY_ADDRESS'
+# created
+ETH_DEPLOYER_ADDRESSES = os.getenv('ETH_DEPLOYER_ADDRESSES')
+# Accounts with less funds (in wei) won't be used for deployments
+ETH_MIN_DEPLOYER_BALANCE = int(os.getenv('ETH_MIN_DEPLOYER_BALANCE', 0))
+# Sign transactions in the worker instead of unlocking the account in the
+# node, 'ETH_USER_PASS' isn't needed then
+ETH_SIGN_LOCALLY = _flag('ETH_SIGN_LOCALLY')
+# Seconds before a locally signed transaction is sent again with a higher gas
+# price
+ETH_TX_STUCK_AFTER = int(os.getenv('ETH_TX_STUCK_AFTER', 300))
+
+# Contract name and file path to the contract's solidity file
+CREATIVE_CONTRACT_NAME = os.getenv('CC_NAME', 'CreativeContract')
+CREATIVE_CONTRACT_FILE = os.getenv('CC_FILE',
+                                   '../contracts/CreativeContract.sol')
+# Deploy each contract as a clone created by this CreativeContractFactory
+# instead of deploying the whole contract
+CC_FACTORY_ADDRESS = os.getenv('CC_FACTORY_ADDRESS')
+CC_FACTORY_FILE = os.getenv('CC_FACTORY_FILE',
+                            '../contracts/CreativeContractFactory.sol')
+# Gas price tier (express, fast, standard or safelow) of the deployments and
+# seconds between gas price refreshes
+GAS_PRICE_TIER = os.getenv('GAS_PRICE_TIER', 'express')
+GAS_PRICE_REFRESH = int(os.getenv('GAS_PRICE_REFRESH', 30))
+
+# Processes rendering PDFs for the web app, the maximum number of renders
+# running or queued and the seconds clients should wait when it is full
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', 2))
+RENDER_QUEUE_SIZE = int(os.getenv('RENDER_QUEUE_SIZE', 8))
+RENDER_RETRY_AFTER = int(os.getenv('RENDER_RETRY_AFTER', 5))
+# Maximum number of contracts of a single batch being rendered at once
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT', 4))
+
+# Where the contract PDFs are stored, either 'local' in 'CONTRACTS_DIR' or
+# 's3' in the given bucket of an S3 compatible service. Their URLs start
+# with 'CONTRACTS_BASE_URL', by default the app's '/contratos/'.
+# 'CONTRACTS_DIR' must not be served as is, it holds the files being written
+CONTRACTS_STORAGE = os.getenv('CONTRACTS_STORAGE', 'local')
+CONTRACTS_DIR = os.getenv('CONTRACTS_DIR', './contratos')
+# Where the PDFs were stored, flat, before being sharded in 'CONTRACTS_DIR'
+CONTRACTS_LEGACY_DIR = os.getenv('CONTRACTS_LEGACY_DIR', './static/contratos')
+CONTRACTS_S3_BUCKET = os.getenv('CONTRACTS_S3_BUCKET')
+CONTRACTS_S3_ENDPOINT = os.getenv('CONTRACTS_S3_ENDPOINT')
+CONTRACTS_BASE_URL = os.getenv('CONTRACTS_BASE_URL')
+# Make the PDFs smaller before they are hashed and stored, it must be the
+# same for the web app and the workers
+CONTRACTS_COMPACT = _flag('CONTRACTS_COMPACT')
+# Let the web server send the local PDFs, either with an 'X-Sendfile' header
+# (Apache, lighttpd) or with an 'X-Accel-Redirect' header to the given
+# internal location mapped to 'CONTRACTS_DIR' (nginx)
+USE_X_SENDFILE = _flag('USE_X_SENDFILE')
+CONTRACTS_ACCEL_REDIRECT = os.getenv('CONTRACTS_ACCEL_REDIRECT')
+
+# SQLite database filled by 'indexer.py' with the state of the contracts
+CC_INDEX_DB = os.getenv('CC_INDEX_DB', 'contracts.sqlite')
+
+# Folder where the compiled contracts are cached
+CC_ARTIFACTS_DIR = os.getenv('CC_ARTIFACTS_DIR', './.artifacts')
+
+# CPU bound tasks run in the 'render' queue (a prefork worker) and the ones
+# waiting on the node in the 'rpc' queue (a gevent worker), so each pool is
+# sized for its own resource
+CELERY_ROUTES = {
+    'tasks.compile_contract': {'queue': 'render'},
+    'tasks.render_deployed_contract': {'queue': 'render'},
+    'tasks.validate_deployment': {'queue': 'rpc'},
+    'tasks.submit_deployment': {'queue': 'rpc'},
+    'tasks.track_deployments': {'queue': 'rpc'},
+    'tasks.replace_stuck_transactions': {'queue': 'rpc'},
+    'tasks.refresh_gas_prices': {'queue': 'rpc'}
+}
+# Retries and rate limit (per worker, e.g. '10/s') of each stage
+SUBMIT_MAX_RETRIES = int(os.getenv('SUBMIT_MAX_RETRIES', 5))
+SUBMIT_RATE_LIMIT = os.getenv('SUBMIT_RATE_LIMIT', '10/s')
+RENDER_DEPLOYED_MAX_RETRIES = int(os.getenv('RENDER_DEPLOYED_MAX_RETRIES', 3))
+RENDER_DEPLOYED_RATE_LIMIT = os.getenv('RENDER_DEPLOYED_RATE_LIMIT')
+
+# Celery queues whose length is exposed by '/metrics'
+METRICS_QUEUES = os.getenv('METRICS_QUEUES', 'celery,render,rpc').split(',')
+
+# Periodic tasks, run with 'celery -A worker.celery beat'
+CELERYBEAT_SCHEDULE = {
+    'replace-stuck-transactions': {
+        'task': 'tasks.replace_stuck_transactions',
+        'schedule': 60.0
+    },
+    'track-deployments': {
+        'task': 'tasks.track_deployments',
+        'schedule': 5.0,
+        # Don't pile up while the 'rpc' worker is down, the next one confirms
+        # all the pending deployments anyway
+        'options': {'expires': 5.0}
+    },
+    'refresh-gas-prices': {
+        'task': 'tasks.refresh_gas_prices',
+        'schedule': float(GAS_PRICE_REFRESH)
+    }
+}
+
+
+def as_dict():
+    """ Get every setting, e.g. to configure celery.
+
+    Returns:
+        dict: The value of each setting by its (uppercase) name.
+    """
+    return {
+        name: value
+        for name, value in globals().items() if name.isupper()
+    }
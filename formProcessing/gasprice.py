@@ -0,0 +1,103 @@
+from web3.gas_strategies.time_based import construct_time_based_gas_price_strategy
+
+# Tier name -> (max wait seconds, blocks sampled, probability to be included)
+TIERS = {
+    'express': (30, 40, 95),
+    'fast': (60, 40, 90),
+    'standard': (300, 40, 80),
+    'safelow': (1800, 40, 50)
+}
+
+
+class GasPriceOracle:
+    """ Gas prices computed once and shared by all workers through Redis.
+
+    Time based gas price strategies sample dozens of blocks each time they are
+    used. Here they are computed periodically with 'refresh' and every
+    transaction only reads the last computed price of its tier.
+
+    Attributes:
+        redis (object): The redis.StrictRedis client holding the prices.
+        ttl (int): Seconds a computed price remains valid.
+        tiers (dict): Maps each tier name to the arguments of its time based
+            gas price strategy.
+    """
+
+    KEY = 'gasprice:%s'
+
+    def __init__(self, redis, ttl=120, tiers=TIERS):
+        """ Create the oracle of the given tiers.
+
+        Args:
+            redis (object): The redis.StrictRedis client holding the prices.
+            ttl (int): Seconds a computed price remains valid, it should be
+                longer than the time between refreshes.
+            tiers (dict): Maps each tier name to the arguments (max wait
+                seconds, blocks sampled, probability) of its time based gas
+                price strategy.
+        """
+        self.redis = redis
+        self.ttl = ttl
+        self.tiers = tiers
+
+    def refresh(self, w3):
+        """ Compute and store the gas price of every tier.
+
+        Args:
+            w3 (object): Instance of the web3 client, its cache middlewares
+                avoid fetching the same blocks again for each tier.
+
+        Returns:
+            dict: The gas price (in wei) of each tier.
+        """
+        prices = {}
+        for tier, arguments in self.tiers.items():
+            strategy = construct_time_based_gas_price_strategy(*arguments)
+            prices[tier] = strategy(w3, None)
+
+        pipe = self.redis.pipeline()
+        for tier, price in prices.items():
+            pipe.setex(self.KEY % tier, self.ttl, price)
+        pipe.execute()
+
+        return prices
+
+    def price(self, tier):
+        """ Get the last computed gas price of a tier.
+
+        Args:
+            tier (str): Name of the tier.
+
+        Returns:
+            int: The gas price in wei, or None if it expired.
+
+        Raises:
+            KeyError: If the tier doesn't exist.
+        """
+        if tier not in self.tiers:
+            raise KeyError('Unknown gas price tier: ' + tier)
+
+        price = self.redis.get(self.KEY % tier)
+
+        return int(price) if price is not None else None
+
+    def strategy(self, tier):
+        """ Build a web3 gas price strategy reading the prices of a tier.
+
+        When the price expired (e.g. nothing refreshed it) the node's
+        suggested gas price is used instead.
+
+        Args:
+            tier (str): Name of the tier.
+
+        Returns:
+            function: The strategy to give to 'setGasPriceStrategy'.
+        """
+        if tier not in self.tiers:
+            raise KeyError('Unknown gas price tier: ' + tier)
+
+        def cached_gas_price_strategy(web3, transaction_params):
+            price = self.price(tier)
+            return price if price is not None else web3.eth.gasPrice
+
+        return cached_gas_price_strategy
@@ -0,0 +1,522 @@
+""" Follow the chain and index the state of every CreativeContract.
+
+The events of the contracts are read block by block and folded into a SQLite
+database holding the current state of each contract, so queries like "all
+contracts past their due date with outstanding debt" don't need a call to
+the node per contract. Chain reorganizations are detected comparing the
+indexed block hashes with the node's ones, and undone. Any contract can
+emit the same events, so only the contracts created by our factories or
+deployed by our accounts are indexed.
+
+    python indexer.py --db contracts.sqlite --node-uri http://localhost:8545
+        --factory-addresses 0x... --deployer-addresses 0x...,0x...
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+
+# Same bits as the contract's intents
+BUSINESS_CANCELS = 1
+CUSTOMER_CANCELS = 2
+BUSINESS_SETTLES = 4
+CUSTOMER_REBATES = 8
+
+# Final state of the contract after each of these events
+FINAL_EVENTS = {
+    'Canceled': 'canceled',
+    'Settled': 'settled',
+    'Rebated': 'rebated',
+    'Claimed': 'claimed'
+}
+
+# Event of the CreativeContractFactory for each contract it creates
+CONTRACT_CREATED_ABI = {
+    'anonymous': False,
+    'inputs': [{
+        'indexed': False,
+        'name': 'contractAddress',
+        'type': 'address'
+    }, {
+        'indexed': False,
+        'name': 'business',
+        'type': 'address'
+    }],
+    'name': 'ContractCreated',
+    'type': 'event'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    address TEXT NOT NULL,
+    event TEXT NOT NULL,
+    args TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_address ON events (address);
+CREATE TABLE IF NOT EXISTS contracts (
+    address TEXT PRIMARY KEY,
+    business TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    oracle TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    oracle_fee TEXT NOT NULL,
+    balance TEXT NOT NULL,
+    settlement_ts INTEGER NOT NULL,
+    due_ts INTEGER NOT NULL,
+    delivery_ts INTEGER NOT NULL,
+    legal_contract_url TEXT NOT NULL,
+    legal_contract_hash TEXT NOT NULL,
+    intents INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    created_block INTEGER NOT NULL,
+    updated_block INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contracts_due ON contracts (state, due_ts);
+"""
+
+
+def _hex(value):
+    # As Web3.toHex of bytes, without importing web3 in the web app which
+    # only reads the index
+    return '0x' + bytes(value).hex()
+
+
+def _wei(value):
+    # Amounts don't fit SQLite's 64 bits integers. Zero padded to more digits
+    # than an uint128 has, they still compare right as text
+    return '%040d' % value
+
+
+class ContractIndex:
+    """ SQLite database with the state of each CreativeContract.
+
+    Attributes:
+        db_path (str): Path to the SQLite database file.
+    """
+
+    def __init__(self, db_path):
+        """ Open the index, creating its tables if needed.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+        """
+        self.db_path = db_path
+        with self.connect() as db:
+            # Readers don't block the indexer, nor the other way around
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+
+    def connect(self):
+        """ Open a new connection, one per thread.
+
+        Returns:
+            object: The sqlite3 connection, a context manager committing the
+                changes made within it.
+        """
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def last_block(self, db):
+        """ Number of the last indexed block, None if nothing was indexed. """
+        return db.execute('SELECT MAX(number) FROM blocks').fetchone()[0]
+
+    def block_hashes(self, db, since):
+        """ Hashes of the indexed blocks, from the newest to 'since'. """
+        return db.execute(
+            'SELECT number, hash FROM blocks WHERE number >= ? '
+            'ORDER BY number DESC', (since, )).fetchall()
+
+    def add_block(self, db, number, block_hash, keep=1000):
+        """ Record an indexed block, forgetting those too old to reorg.
+
+        Args:
+            db (object): The sqlite3 connection.
+            number (int): The block number.
+            block_hash (str): The block hash.
+            keep (int): Number of recent blocks whose hashes are kept.
+        """
+        db.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?)',
+                   (number, block_hash))
+        db.execute('DELETE FROM blocks WHERE number <= ?', (number - keep, ))
+
+    def add_event(self, db, event, ours=False):
+        """ Apply an event to the state of its contract.
+
+        Args:
+            db (object): The sqlite3 connection.
+            event (dict): The decoded log, as returned by 'get_event_data'.
+                Events of unknown contracts are ignored.
+            ours (bool): Whether the contract emitting a 'Created' event was
+                created by our factory or deployers. Any contract can emit
+                one, the others are ignored.
+        """
+        if event['event'] == 'Created':
+            if not ours:
+                return
+        elif db.execute('SELECT 1 FROM contracts WHERE address = ?',
+                        (event['address'], )).fetchone() is None:
+            return  # Not a CreativeContract, or created before the index
+
+        args = dict(event['args'])
+        for key, value in args.items():
+            if isinstance(value, bytes):
+                args[key] = _hex(value)
+
+        db.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)',
+                   (event['blockNumber'], event['logIndex'],
+                    _hex(event['transactionHash']), event['address'],
+                    event['event'], json.dumps(args)))
+        self._apply(db, event['address'], event['event'], args,
+                    event['blockNumber'])
+
+    def _apply(self, db, address, name, args, block_number):
+        if name == 'Created':
+            amount, fee, settlement_ts, due_ts, delivery_ts = args['terms']
+            db.execute(
+                'INSERT OR REPLACE INTO contracts VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (address, args['business'], args['customer'], args['oracle'],
+                 _wei(amount), _wei(fee), _wei(0), settlement_ts, due_ts,
+                 delivery_ts, args['legalContractUrl'],
+                 args['legalContractHash'], 0, 'open', block_number,
+                 block_number))
+            return
+
+        contract = db.execute('SELECT * FROM contracts WHERE address = ?',
+                              (address, )).fetchone()
+        if contract is None:
+            return  # Its creation was undone by a reorg
+
+        balance = int(contract['balance'])
+        intents = contract['intents']
+        state = contract['state']
+        if name == 'Funded':
+            balance = args['balance']
+        elif name == 'CancelIntent':
+            intents |= (BUSINESS_CANCELS if args['party'] == contract[
+                'business'] else CUSTOMER_CANCELS)
+        elif name == 'SettleIntent':
+            intents |= BUSINESS_SETTLES
+        elif name == 'RebateIntent':
+            intents |= CUSTOMER_REBATES
+        elif name in FINAL_EVENTS:
+            # The contract self destructs sending all its funds
+            balance = 0
+            state = FINAL_EVENTS[name]
+
+        db.execute(
+            'UPDATE contracts SET balance = ?, intents = ?, state = ?, '
+            'updated_block = ? WHERE address = ?',
+            (_wei(balance), intents, state, block_number, address))
+
+    def rollback(self, db, fork_block):
+        """ Undo everything indexed from the given block on.
+
+        The contracts with undone events are rebuilt from their remaining
+        ones.
+
+        Args:
+            db (object): The sqlite3 connection.
+            fork_block (int): First block no longer in the chain.
+        """
+        affected = [
+            row['address'] for row in db.execute(
+                'SELECT DISTINCT address FROM events WHERE block_number >= ?',
+                (fork_block, ))
+        ]
+        db.execute('DELETE FROM events WHERE block_number >= ?',
+                   (fork_block, ))
+        db.execute('DELETE FROM blocks WHERE number >= ?', (fork_block, ))
+
+        for address in affected:
+            db.execute('DELETE FROM contracts WHERE address = ?', (address, ))
+            for event in db.execute(
+                    'SELECT * FROM events WHERE address = ? '
+                    'ORDER BY block_number, log_index', (address, )):
+                self._apply(db, address, event['event'],
+                            json.loads(event['args']), event['block_number'])
+
+    @staticmethod
+    def _as_dict(contract):
+        contract = dict(contract)
+        for key in ('amount', 'oracle_fee', 'balance'):
+            contract[key] = int(contract[key])
+        contract['debt'] = max(contract['amount'] - contract['balance'], 0)
+        return contract
+
+    def get(self, address):
+        """ Get the indexed state of a contract.
+
+        Args:
+            address (str): The contract's address, in any case.
+
+        Returns:
+            dict: The contract's columns plus its 'debt', None if unknown.
+
+        Raises:
+            ValueError: If 'address' is not a valid Ethereum address.
+        """
+        from eth_utils import is_address, to_checksum_address
+
+        if not is_address(address):
+            raise ValueError('Not a valid contract address: ' + address)
+        address = to_checksum_address(address)
+
+        with self.connect() as db:
+            contract = db.execute('SELECT * FROM contracts WHERE address = ?',
+                                  (address, )).fetchone()
+
+        return self._as_dict(contract) if contract else None
+
+    def past_due(self, now=None):
+        """ Find the open contracts past their due date with debt.
+
+        Args:
+            now (int): Unix timestamp to compare due dates with, by default
+                the current time.
+
+        Returns:
+            list: Each contract's columns plus its 'debt', by due date.
+        """
+        now = int(time.time()) if now is None else now
+        with self.connect() as db:
+            contracts = db.execute(
+                "SELECT * FROM contracts WHERE state = 'open' AND due_ts < ? "
+                "AND balance < amount ORDER BY due_ts", (now, )).fetchall()
+
+        return [self._as_dict(contract) for contract in contracts]
+
+
+class Indexer:
+    """ Reads the CreativeContract events from the node into the index.
+
+    Attributes:
+        index (ContractIndex): The index being filled.
+        w3 (object): Instance of the web3 client.
+        max_blocks (int): Maximum number of blocks read by each 'poll'.
+        start_block (int): First block to index on an empty index.
+        factories (list): Addresses of our CreativeContractFactory.
+        deployers (list): Addresses of the accounts deploying our contracts.
+    """
+
+    def __init__(self,
+                 index,
+                 w3,
+                 abi,
+                 max_blocks=1000,
+                 start_block=0,
+                 factories=(),
+                 deployers=()):
+        """ Create the indexer.
+
+        Only the contracts created by the given factories or deployed by the
+        given accounts are indexed.
+
+        Args:
+            index (ContractIndex): The index to fill.
+            w3 (object): Instance of the web3 client.
+            abi (list): ABI of the CreativeContract, or of its template.
+            max_blocks (int): Maximum number of blocks read by each 'poll'.
+            start_block (int): First block to index on an empty index, e.g.
+                the block the first contract was deployed in.
+            factories (list): Addresses of our CreativeContractFactory.
+            deployers (list): Addresses of the accounts deploying our
+                contracts.
+
+        Raises:
+            ValueError: If there are neither factories nor deployers, nothing
+                would be indexed.
+        """
+        if not factories and not deployers:
+            raise ValueError('Set the factories or the deployers of the '
+                             'contracts to index')
+
+        self.index = index
+        self.w3 = w3
+        self.max_blocks = max_blocks
+        self.start_block = start_block
+        self.factories = list(factories)
+        self.deployers = list(deployers)
+        from eth_utils import event_abi_to_log_topic
+
+        self._events = {
+            _hex(event_abi_to_log_topic(event)): event
+            for event in abi if event['type'] == 'event'
+        }
+        self._contract_created = _hex(
+            event_abi_to_log_topic(CONTRACT_CREATED_ABI))
+
+    def _last_valid_block(self, db):
+        # Walk back the indexed blocks until one is still in the chain. Only
+        # some blocks are recorded, so everything after it may have changed
+        for number, block_hash in self.index.block_hashes(db, 0):
+            block = self.w3.eth.getBlock(number)
+            if block is not None and _hex(block['hash']) == block_hash:
+                return number
+        # Forked before every recorded block, index everything again
+        return self.start_block - 1
+
+    def _created_by_us(self, from_block, to_block, created):
+        # Lower case addresses of the contracts emitting the given 'Created'
+        # events that were created by our factories or deployers
+        if not created:
+            return set()
+
+        from web3.utils.events import get_event_data
+
+        ours = set()
+        if self.factories:
+            logs = self.w3.eth.getLogs({
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'address': self.factories,
+                'topics': [self._contract_created]
+            })
+            for log in logs:
+                event = get_event_data(CONTRACT_CREATED_ABI, log)
+                ours.add(event['args']['contractAddress'].lower())
+
+        deployers = {address.lower() for address in self.deployers}
+        for event in created:
+            if not deployers or event['address'].lower() in ours:
+                continue
+            receipt = self.w3.eth.getTransactionReceipt(
+                event['transactionHash'])
+            if (receipt['contractAddress']
+                    and receipt['contractAddress'].lower() ==
+                    event['address'].lower()
+                    and receipt['from'].lower() in deployers):
+                ours.add(event['address'].lower())
+
+        return ours
+
+    def poll(self):
+        """ Index the blocks mined since the last call.
+
+        Returns:
+            int: Number of events indexed.
+        """
+        latest = self.w3.eth.blockNumber
+        with self.index.connect() as db:
+            last_block = self.index.last_block(db)
+            if last_block is None:
+                last_block = self.start_block - 1
+            else:
+                valid_block = self._last_valid_block(db)
+                if valid_block < last_block:
+                    # TODO Use the flask app's logger instead of print to
+                    # stdout directly
+                    print('Chain reorganization from block', valid_block + 1)
+                    self.index.rollback(db, valid_block + 1)
+                    last_block = valid_block
+
+            if last_block >= latest:
+                return 0
+
+            to_block = min(latest, last_block + self.max_blocks)
+            logs = self.w3.eth.getLogs({
+                'fromBlock': last_block + 1,
+                'toBlock': to_block,
+                'topics': [list(self._events)]
+            })
+
+            from web3.utils.events import get_event_data
+
+            events = [
+                get_event_data(self._events[_hex(log['topics'][0])], log)
+                for log in logs
+            ]
+            ours = self._created_by_us(
+                last_block + 1, to_block,
+                [event for event in events if event['event'] == 'Created'])
+
+            for log, event in zip(logs, events):
+                self.index.add_event(
+                    db, event, ours=event['address'].lower() in ours)
+                self.index.add_block(db, log['blockNumber'],
+                                     _hex(log['blockHash']))
+
+            # The last block is always recorded to detect reorgs from it
+            block = self.w3.eth.getBlock(to_block)
+            self.index.add_block(db, to_block, _hex(block['hash']))
+
+        return len(logs)
+
+
+def main(args):
+    from artifacts import ArtifactStore
+    from smartcontract import SmartContract
+
+    store = ArtifactStore(args.artifacts_dir)
+    abi = store.get(store.compile_file(args.contract_name,
+                                       args.contract_file))['abi']
+    sc = SmartContract(args.node_uri, args.ipc, args.poa)
+    indexer = Indexer(
+        ContractIndex(args.db),
+        sc.w3,
+        abi,
+        start_block=args.start_block,
+        factories=args.factory_addresses.split(',')
+        if args.factory_addresses else (),
+        deployers=args.deployer_addresses.split(',')
+        if args.deployer_addresses else ())
+
+    while True:
+        indexed = indexer.poll()
+        if indexed:
+            print('Indexed %d events' % indexed)
+        else:
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    import config
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--db', default=os.getenv('CC_INDEX_DB',
+                                                  'contracts.sqlite'))
+    parser.add_argument('--node-uri',
+                        default=os.getenv('GETH_NODE_URI',
+                                          'http://localhost:8545'))
+    parser.add_argument('--ipc', action='store_true',
+                        help='The node URI is an IPC path')
+    parser.add_argument('--poa', action='store_true',
+                        help='The chain uses PoA (Rinkeby)')
+    parser.add_argument('--contract-file',
+                        default=os.path.join(here, '..', 'contracts',
+                                             'CreativeContract.sol'))
+    parser.add_argument('--contract-name', default='CreativeContract')
+    parser.add_argument('--artifacts-dir',
+                        default=os.getenv('CC_ARTIFACTS_DIR',
+                                          os.path.join(here, '.artifacts')))
+    parser.add_argument('--factory-addresses',
+                        default=config.CC_FACTORY_ADDRESS,
+                        help='Comma separated addresses of the factories '
+                        'creating our contracts')
+    parser.add_argument('--deployer-addresses',
+                        default=config.ETH_DEPLOYER_ADDRESSES,
+                        help='Comma separated addresses of the accounts '
+                        'deploying our contracts')
+    parser.add_argument('--start-block', type=int, default=0,
+                        help='First block to index')
+    parser.add_argument('--interval', type=float, default=5,
+                        help='Seconds between polls once up to date')
+
+    args = parser.parse_args()
+    if not args.factory_addresses and not args.deployer_addresses:
+        parser.error('Set the factories (CC_FACTORY_ADDRESS) or deployers '
+                     '(ETH_DEPLOYER_ADDRESSES) of the contracts to index')
+
+    main(args)
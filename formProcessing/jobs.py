@@ -0,0 +1,117 @@
+import json
+import uuid
+
+
+class JobStore:
+    """ Status of each contract creation, shared by the app and the workers.
+
+    Each job is a Redis hash with the fields known so far about a contract,
+    like its 'renderStatus', 'deployStatus', 'legalContractHash' or
+    'contractAddress'. Jobs expire after 'ttl' seconds.
+
+    Jobs can be indexed by a key identifying their input, so repeated
+    submissions of the same contract share a single job.
+
+    Attributes:
+        redis (object): The redis.StrictRedis client holding the jobs.
+        ttl (int): Seconds a job is kept since its last update.
+    """
+
+    KEY = 'job:%s'
+    INDEX_KEY = 'job-index:%s'
+
+    def __init__(self, redis, ttl=7 * 24 * 3600):
+        """ Create a store keeping the jobs in Redis.
+
+        Args:
+            redis (object): The redis.StrictRedis client holding the jobs.
+            ttl (int): Seconds a job is kept since its last update.
+        """
+        self.redis = redis
+        self.ttl = ttl
+
+    def create(self, **fields):
+        """ Create a new job.
+
+        Args:
+            **fields: Initial fields of the job, JSON serializable.
+
+        Returns:
+            str: The job identifier.
+        """
+        job_id = uuid.uuid4().hex
+        self.update(job_id, **fields)
+        return job_id
+
+    def find_or_create(self, key, **fields):
+        """ Get the job indexed by 'key', creating it if there isn't one.
+
+        Args:
+            key (str): Identifier of the job's input.
+            **fields: Initial fields of the job if it's created.
+
+        Returns:
+            tuple: The job identifier and whether it was created.
+        """
+        job_id = uuid.uuid4().hex
+        index_key = self.INDEX_KEY % key
+
+        # Only one of many concurrent submissions gets to create the job
+        if not self.redis.set(index_key, job_id, ex=self.ttl, nx=True):
+            existing = self.redis.get(index_key)
+            if existing is not None:
+                return existing.decode('utf-8'), False
+            self.redis.set(index_key, job_id, ex=self.ttl)
+
+        self.update(job_id, **fields)
+        return job_id, True
+
+    def forget(self, key):
+        """ Remove a key from the index, e.g. because its job failed.
+
+        Args:
+            key (str): Identifier of the job's input.
+        """
+        self.redis.delete(self.INDEX_KEY % key)
+
+    def update(self, job_id, **fields):
+        """ Set some fields of a job.
+
+        Args:
+            job_id (str): The job identifier, if None nothing is updated.
+            **fields: Fields to set, JSON serializable.
+        """
+        if job_id is None:
+            return
+
+        key = self.KEY % job_id
+        pipe = self.redis.pipeline()
+        pipe.hmset(key, {k: json.dumps(v) for k, v in fields.items()})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def get(self, job_id):
+        """ Get all the fields of a job.
+
+        Args:
+            job_id (str): The job identifier.
+
+        Returns:
+            dict: The job's fields, or None if the job doesn't exist.
+        """
+        fields = self.redis.hgetall(self.KEY % job_id)
+        if not fields:
+            return None
+
+        return {
+            k.decode('utf-8'): json.loads(v.decode('utf-8'))
+            for k, v in fields.items()
+        }
+
+    def delete(self, job_id):
+        """ Remove a job.
+
+        Args:
+            job_id (str): The job identifier.
+        """
+        self.redis.delete(self.KEY % job_id)
@@ -0,0 +1,223 @@
+import time
+import threading
+import contextlib
+from collections import Counter
+import redis
+
+# Upper bounds (in seconds) of the histograms' buckets, from a cached read to
+# a transaction waiting for a few blocks
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 120, 300, 600)
+# Buckets of the histograms counting RPC requests
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _labels(labels):
+    # Already in the exposition format, e.g. 'stage="write",task="app.x"'
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                                 .replace('"', '\\"').replace('\n', '\\n'))
+                    for name, value in sorted(labels.items()))
+
+
+def _sample(name, labels, value):
+    if labels:
+        return '%s{%s} %s' % (name, labels, value)
+    return '%s %s' % (name, value)
+
+
+class Metrics:
+    """ Counters and histograms shared by every process through Redis.
+
+    The web app, its render processes and the celery workers all record to
+    the same Redis hashes, so the '/metrics' endpoint of any web process
+    exposes the totals of the whole deployment in the Prometheus text format.
+    The names of the metrics are kept in a set, so they are found without
+    scanning the whole database.
+
+    Attributes:
+        redis_url (str): URL of the Redis database holding the metrics.
+        buckets (tuple): Default upper bounds of the histograms' buckets.
+    """
+
+    COUNTER_KEY = 'metrics:counter:%s'
+    HISTOGRAM_KEY = 'metrics:histogram:%s'
+    COUNTERS_KEY = 'metrics:counters'
+    HISTOGRAMS_KEY = 'metrics:histograms'
+
+    def __init__(self, redis_url, buckets=DEFAULT_BUCKETS):
+        """ Create the metrics stored in the given Redis database.
+
+        Args:
+            redis_url (str): URL of the Redis database holding the metrics.
+            buckets (tuple): Default upper bounds of the histograms' buckets.
+        """
+        self.redis_url = redis_url
+        self.buckets = buckets
+        self._client = None
+
+    def __getstate__(self):
+        # Connections can't be pickled, e.g. to be sent to the render pool
+        state = self.__dict__.copy()
+        state['_client'] = None
+        return state
+
+    @property
+    def client(self):
+        """ object: The redis.StrictRedis client, created on first use. """
+        if self._client is None:
+            self._client = redis.StrictRedis.from_url(self.redis_url)
+        return self._client
+
+    def increment(self, name, amount=1, **labels):
+        """ Increment a counter.
+
+        Args:
+            name (str): Name of the counter, e.g. 'eth_rpc_requests_total'.
+            amount (int): Amount to add.
+            **labels: Labels of the counter's sample.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self.COUNTER_KEY % name, _labels(labels), amount)
+        pipe.sadd(self.COUNTERS_KEY, name)
+        pipe.execute()
+
+    def observe(self, name, value, buckets=None, **labels):
+        """ Record a value in a histogram.
+
+        Args:
+            name (str): Name of the histogram, e.g. 'celery_task_seconds'.
+            value (float): The observed value.
+            buckets (tuple): Upper bounds of the buckets, by default the
+                'buckets' attribute. Must be the same for every observation.
+            **labels: Labels of the histogram's samples.
+        """
+        key = self.HISTOGRAM_KEY % name
+        labels = _labels(labels)
+
+        pipe = self.client.pipeline(transaction=False)
+        for bound in buckets or self.buckets:
+            # Incremented by 0 too, so every bucket is exposed
+            pipe.hincrby(key, '%s|%g' % (labels, bound), int(value <= bound))
+        pipe.hincrby(key, labels + '|+Inf', 1)
+        pipe.hincrbyfloat(key, labels + '|sum', value)
+        pipe.sadd(self.HISTOGRAMS_KEY, name)
+        pipe.execute()
+
+    @contextlib.contextmanager
+    def time(self, name, **labels):
+        """ Record the seconds spent in the block in a histogram.
+
+        Args:
+            name (str): Name of the histogram.
+            **labels: Labels of the histogram's samples.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self, gauges=()):
+        """ Render every metric in the Prometheus text format.
+
+        Args:
+            gauges (list): Tuples with the name, labels (a dict) and value of
+                gauges measured right now, e.g. the length of the queues.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        lines = []
+        for name in sorted(self.client.smembers(self.COUNTERS_KEY)):
+            name = name.decode('utf-8')
+            lines.append('# TYPE %s counter' % name)
+            for labels, value in sorted(
+                    self.client.hgetall(self.COUNTER_KEY % name).items()):
+                lines.append(_sample(name, labels.decode('utf-8'),
+                                     int(value)))
+
+        for name in sorted(self.client.smembers(self.HISTOGRAMS_KEY)):
+            name = name.decode('utf-8')
+            lines.append('# TYPE %s histogram' % name)
+            series = {}
+            for field, value in self.client.hgetall(
+                    self.HISTOGRAM_KEY % name).items():
+                labels, bound = field.decode('utf-8').rsplit('|', 1)
+                series.setdefault(labels, {})[bound] = value.decode('utf-8')
+
+            for labels, samples in sorted(series.items()):
+                separator = ',' if labels else ''
+                bounds = sorted((float(b), b) for b in samples
+                                if b not in ('+Inf', 'sum'))
+                for _, bound in bounds:
+                    lines.append(_sample(
+                        name + '_bucket',
+                        '%s%sle="%s"' % (labels, separator, bound),
+                        samples[bound]))
+                lines.append(_sample(name + '_bucket',
+                                     '%s%sle="+Inf"' % (labels, separator),
+                                     samples.get('+Inf', 0)))
+                lines.append(_sample(name + '_sum', labels,
+                                     samples.get('sum', 0)))
+                lines.append(_sample(name + '_count', labels,
+                                     samples.get('+Inf', 0)))
+
+        gauge_names = set()
+        for name, labels, value in gauges:
+            if name not in gauge_names:
+                lines.append('# TYPE %s gauge' % name)
+                gauge_names.add(name)
+            lines.append(_sample(name, _labels(labels), value))
+
+        return '\n'.join(lines) + '\n'
+
+
+class RPCCounter:
+    """ Web3 middleware counting the RPC requests sent by each thread.
+
+    Added as the innermost middleware it only counts the requests that reach
+    the node, not the ones answered by the cache middlewares.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, make_request, w3):
+        def middleware(method, params):
+            self.counts()[method] += 1
+            return make_request(method, params)
+
+        return middleware
+
+    def counts(self):
+        """ Requests sent by the current thread since the last 'take'.
+
+        Returns:
+            Counter: Number of requests of each RPC method.
+        """
+        if not hasattr(self._local, 'counts'):
+            self._local.counts = Counter()
+        return self._local.counts
+
+    def take(self):
+        """ Get the requests counted by the current thread and start over.
+
+        Returns:
+            Counter: Number of requests of each RPC method.
+        """
+        counts = self.counts()
+        self._local.counts = Counter()
+        return counts
+
+
+class NullMetrics:
+    """ Metrics recording nothing, used when none were given. """
+
+    def increment(self, name, amount=1, **labels):
+        pass
+
+    def observe(self, name, value, buckets=None, **labels):
+        pass
+
+    def time(self, name, **labels):
+        return contextlib.suppress()
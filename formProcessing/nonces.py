@@ -0,0 +1,306 @@
+import json
+import math
+import time
+import heapq
+import threading
+
+# Returns the next nonce to use, reusing released ones first. Returns nil when
+# the counter hasn't been initialized from the chain yet.
+ALLOCATE_SCRIPT = """
+local released = redis.call('ZRANGE', KEYS[2], 0, 0)
+if #released > 0 then
+    redis.call('ZREM', KEYS[2], released[1])
+    redis.call('ZADD', KEYS[3], ARGV[1], released[1])
+    return tonumber(released[1])
+end
+local nonce = redis.call('GET', KEYS[1])
+if not nonce then
+    return nil
+end
+redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[3], ARGV[1], nonce)
+return tonumber(nonce)
+"""
+
+# Reconciles the tracked nonces with the counts of the node in a single step,
+# so nonces allocated meanwhile are neither handed out again nor released.
+# The counter only moves forward. Returns the new counter.
+RESYNC_SCRIPT = """
+local mined = tonumber(ARGV[1])
+local chain_next = tonumber(ARGV[2])
+local lost_since = tonumber(ARGV[3])
+
+local next_nonce = tonumber(redis.call('GET', KEYS[1]) or '-1')
+if chain_next > next_nonce then
+    next_nonce = chain_next
+    redis.call('SET', KEYS[1], next_nonce)
+end
+
+local in_use = {}
+for _, nonce in ipairs(redis.call('HKEYS', KEYS[2])) do
+    if tonumber(nonce) < mined then
+        redis.call('HDEL', KEYS[2], nonce)
+    else
+        in_use[tonumber(nonce)] = true
+    end
+end
+
+local allocated = redis.call('ZRANGE', KEYS[3], 0, -1, 'WITHSCORES')
+for i = 1, #allocated, 2 do
+    local nonce = tonumber(allocated[i])
+    -- Lost by a worker that never sent it
+    if nonce < mined or tonumber(allocated[i + 1]) <= lost_since then
+        redis.call('ZREM', KEYS[3], allocated[i])
+    else
+        in_use[nonce] = true
+    end
+end
+
+for _, nonce in ipairs(redis.call('ZRANGE', KEYS[4], 0, -1)) do
+    -- The node already has a transaction using it
+    if tonumber(nonce) < chain_next then
+        redis.call('ZREM', KEYS[4], nonce)
+    end
+end
+
+for nonce = math.max(mined, chain_next), next_nonce - 1 do
+    if not in_use[nonce] then
+        redis.call('ZADD', KEYS[4], nonce, nonce)
+    end
+end
+
+return next_nonce
+"""
+
+
+class NonceManager:
+    """ Hands out the nonces of one account to many workers at once.
+
+    The next nonce lives in Redis so workers sharing an account don't need to
+    ask the node for it, nor wait for each other's transactions to be mined.
+    Every nonce is tracked from its allocation until it is mined, so gaps left
+    by crashed workers can be filled and stuck transactions replaced.
+
+    Attributes:
+        redis (object): The redis.StrictRedis client holding the nonces.
+        w3 (object): Instance of the web3 client.
+        address (str): Ethereum address whose nonces are managed.
+        allocation_timeout (int): Seconds after which an allocated nonce that
+            wasn't sent is considered lost.
+    """
+
+    def __init__(self, redis, w3, address, allocation_timeout=120):
+        """ Create the manager of the given account's nonces.
+
+        Args:
+            redis (object): The redis.StrictRedis client holding the nonces.
+            w3 (object): Instance of the web3 client.
+            address (str): Ethereum address whose nonces are managed.
+            allocation_timeout (int): Seconds after which an allocated nonce
+                that wasn't sent is considered lost.
+        """
+        self.redis = redis
+        self.w3 = w3
+        self.address = address
+        self.allocation_timeout = allocation_timeout
+
+        prefix = 'nonce:%s:' % address.lower()
+        self._next_key = prefix + 'next'
+        self._released_key = prefix + 'released'
+        self._allocated_key = prefix + 'allocated'
+        self._pending_key = prefix + 'pending'
+        self._allocate = redis.register_script(ALLOCATE_SCRIPT)
+        self._resync = redis.register_script(RESYNC_SCRIPT)
+
+    def allocate(self):
+        """ Reserve the next nonce of the account.
+
+        Every allocated nonce must then be either passed to 'submitted' or
+        given back with 'release'.
+
+        Returns:
+            int: The nonce to use in the next transaction.
+        """
+        keys = [self._next_key, self._released_key, self._allocated_key]
+
+        nonce = self._allocate(keys=keys, args=[time.time()])
+        if nonce is None:
+            self.resync()
+            nonce = self._allocate(keys=keys, args=[time.time()])
+
+        return nonce
+
+    def release(self, nonce):
+        """ Give back a nonce whose transaction couldn't be sent.
+
+        Args:
+            nonce (int): Nonce returned by 'allocate'.
+        """
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._allocated_key, nonce)
+        pipe.zadd(self._released_key, nonce, nonce)
+        pipe.execute()
+
+    def submitted(self, transaction, tx_hash):
+        """ Track a sent transaction until it is mined.
+
+        Args:
+            transaction (dict): The transaction as it was signed, including
+                its 'nonce' and 'gasPrice'.
+            tx_hash (bytes): The hash of the sent transaction.
+        """
+        nonce = transaction['nonce']
+        pending = {
+            'transaction': transaction,
+            'hash': tx_hash.hex(),
+            'sent_at': time.time()
+        }
+
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._allocated_key, nonce)
+        pipe.hset(self._pending_key, nonce, json.dumps(pending))
+        pipe.execute()
+
+    def in_flight(self):
+        """ Count the allocated nonces whose transaction isn't mined yet.
+
+        Returns:
+            int: Number of nonces allocated or sent and not yet forgotten by
+                'resync'.
+        """
+        pipe = self.redis.pipeline()
+        pipe.zcard(self._allocated_key)
+        pipe.hlen(self._pending_key)
+
+        return sum(pipe.execute())
+
+    def resync(self):
+        """ Reconcile the tracked nonces with the node.
+
+        Forgets mined transactions, marks as released the nonces lost by
+        workers that never sent them and moves the counter forward if the
+        account sent transactions without this manager.
+        """
+        mined = self.w3.eth.getTransactionCount(self.address, 'latest')
+        chain_next = self.w3.eth.getTransactionCount(self.address, 'pending')
+
+        # Workers keep allocating meanwhile, so everything else is done by the
+        # script at once
+        keys = [
+            self._next_key, self._pending_key, self._allocated_key,
+            self._released_key
+        ]
+        self._resync(
+            keys=keys,
+            args=[mined, chain_next,
+                  time.time() - self.allocation_timeout])
+
+    def stuck(self, max_age):
+        """ Find the sent transactions that take too long to be mined.
+
+        Args:
+            max_age (int): Seconds since a transaction was sent to consider it
+                stuck.
+
+        Returns:
+            list: The tracked info of each stuck transaction, a dict with keys
+                'transaction', 'hash' and 'sent_at'.
+        """
+        mined = self.w3.eth.getTransactionCount(self.address, 'latest')
+        stuck_since = time.time() - max_age
+
+        stuck = []
+        for nonce, pending in self.redis.hgetall(self._pending_key).items():
+            pending = json.loads(pending.decode('utf-8'))
+            if int(nonce) >= mined and pending['sent_at'] < stuck_since:
+                stuck.append(pending)
+
+        return sorted(stuck, key=lambda p: p['transaction']['nonce'])
+
+    def replace_stuck(self, sc, max_age, bump=1.125):
+        """ Send again the stuck transactions paying a higher gas price.
+
+        The replacement keeps the nonce of the stuck transaction, so only one
+        of both can be mined.
+
+        Args:
+            sc (SmartContract): Client holding the account's signing key.
+            max_age (int): Seconds since a transaction was sent to consider it
+                stuck.
+            bump (float): Minimum increase of the gas price, nodes reject
+                replacements paying less than 10% more.
+
+        Returns:
+            list: Tuples with the hashes of each replaced transaction and its
+                replacement.
+        """
+        from web3 import Web3
+
+        replaced = []
+
+        for pending in self.stuck(max_age):
+            transaction = pending['transaction']
+            gas_price = int(math.ceil(transaction['gasPrice'] * bump))
+            transaction['gasPrice'] = max(
+                gas_price, self.w3.eth.generateGasPrice(transaction) or 0)
+
+            # TODO Use the flask app's logger instead of print to stdout
+            # directly
+            print('Replacing stuck transaction: ', pending['hash'])
+            replaced.append((Web3.toBytes(hexstr=pending['hash']),
+                             sc.send_signed(transaction)))
+
+        return replaced
+
+
+class LocalNonceAllocator:
+    """ Hands out the nonces of one account to the threads of one process.
+
+    Same interface as NonceManager without Redis, for scripts that are the
+    only ones sending transactions from the account while they run.
+
+    Attributes:
+        w3 (object): Instance of the web3 client.
+        address (str): Ethereum address whose nonces are allocated.
+    """
+
+    def __init__(self, w3, address):
+        """ Create the allocator, the first nonce is asked to the node.
+
+        Args:
+            w3 (object): Instance of the web3 client.
+            address (str): Ethereum address whose nonces are allocated.
+        """
+        self.w3 = w3
+        self.address = address
+        self._next = None
+        self._released = []
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        """ Reserve the next nonce of the account.
+
+        Returns:
+            int: The nonce to use in the next transaction.
+        """
+        with self._lock:
+            if self._released:
+                return heapq.heappop(self._released)
+            if self._next is None:
+                self._next = self.w3.eth.getTransactionCount(
+                    self.address, 'pending')
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def release(self, nonce):
+        """ Give back a nonce whose transaction couldn't be sent.
+
+        Args:
+            nonce (int): Nonce returned by 'allocate'.
+        """
+        with self._lock:
+            heapq.heappush(self._released, nonce)
+
+    def submitted(self, transaction, tx_hash):
+        """ Nothing to track, kept for compatibility with NonceManager. """
@@ -0,0 +1,230 @@
+import json
+
+
+class ReceiptTracker:
+    """ Finds the receipts of many pending transactions at once.
+
+    Instead of waiting for each transaction receipt, the hashes of the pending
+    transactions are kept in Redis and every new block is fetched only once to
+    match all of them together. Receipts are only requested for the
+    transactions found in a block.
+
+    Each transaction is looked for from the block that was the latest when it
+    was sent, so it is found even if it was mined before being tracked. The
+    ones not found after 'check_after' blocks are asked to the node one by
+    one, and forgotten if the node doesn't know them anymore.
+
+    Attributes:
+        redis (object): The redis.StrictRedis client holding the pending
+            transactions.
+        w3 (object): Instance of the web3 client.
+        max_blocks (int): Maximum number of blocks processed by each 'poll'.
+        check_after (int): Blocks after which a transaction not found is
+            asked to the node.
+    """
+
+    PENDING_KEY = 'receipts:pending'
+    LOCK_KEY = 'receipts:lock'
+
+    def __init__(self, redis, w3, max_blocks=100, check_after=20):
+        """ Create a tracker sharing its pending transactions through Redis.
+
+        Args:
+            redis (object): The redis.StrictRedis client holding the pending
+                transactions.
+            w3 (object): Instance of the web3 client.
+            max_blocks (int): Maximum number of blocks processed by each
+                'poll'.
+            check_after (int): Blocks after which a transaction not found is
+                asked to the node.
+        """
+        self.redis = redis
+        self.w3 = w3
+        self.max_blocks = max_blocks
+        self.check_after = check_after
+
+    def track(self, tx_hash, details, sent_block=None):
+        """ Wait for the receipt of the given transaction.
+
+        Args:
+            tx_hash (bytes): The hash of the sent transaction.
+            details (dict): JSON serializable data returned by 'poll' together
+                with the receipt.
+            sent_block (int): Number of the latest block before the
+                transaction was sent, by default the latest one now.
+        """
+        if sent_block is None:
+            sent_block = self.w3.eth.blockNumber
+
+        tracked = {
+            'origin': tx_hash.hex(),
+            'details': details,
+            # Next block to look for it in, and when the node was last asked
+            'from_block': sent_block,
+            'checked_block': sent_block
+        }
+        self.redis.hset(self.PENDING_KEY, tx_hash.hex(), json.dumps(tracked))
+
+    def replace(self, old_hash, new_hash):
+        """ Track the transaction replacing one with the same nonce instead.
+
+        Args:
+            old_hash (bytes): The hash of the replaced transaction.
+            new_hash (bytes): The hash of the replacement transaction.
+        """
+        # Keep both, either of them could be the one mined
+        tracked = self.redis.hget(self.PENDING_KEY, old_hash.hex())
+        if tracked is not None:
+            self.redis.hset(self.PENDING_KEY, new_hash.hex(), tracked)
+
+    def poll(self):
+        """ Look for the pending transactions in the blocks mined since the
+        last call.
+
+        The transactions found are returned by every call until they are
+        marked as handled with 'done', so none is lost if handling them
+        fails. They are handled at least once, maybe more if two processes
+        poll before either calls 'done'.
+
+        Returns:
+            list: Tuples with the hash given to 'track', the details given
+                with it and the receipt of each transaction mined, or None as
+                the receipt if the node doesn't know the transaction (nor its
+                replacements) anymore. Empty if another process is polling.
+        """
+        lock = self.redis.lock(self.LOCK_KEY, timeout=60)
+        if not lock.acquire(blocking=False):
+            return []
+
+        try:
+            return self._poll()
+        finally:
+            lock.release()
+
+    def done(self, tx_hash):
+        """ Stop tracking a transaction returned by 'poll' once handled.
+
+        Args:
+            tx_hash (str): The hash returned by 'poll', its replacements are
+                forgotten too.
+        """
+        with self.redis.lock(self.LOCK_KEY, timeout=60):
+            pending = self.redis.hgetall(self.PENDING_KEY)
+            forget = [
+                key for key, tracked in pending.items()
+                if json.loads(tracked.decode('utf-8'))['origin'] == tx_hash
+            ]
+            if forget:
+                self.redis.hdel(self.PENDING_KEY, *forget)
+
+    def _found(self, pending):
+        # Details and receipt, or details only, by the origin of the
+        # transactions mined or dropped in previous polls
+        mined = {}
+        dropped = {}
+        for tracked in pending.values():
+            if tracked['origin'] in mined:
+                continue
+            if tracked.get('mined'):
+                receipt = self.w3.eth.getTransactionReceipt(tracked['mined'])
+                if receipt is not None:
+                    mined[tracked['origin']] = (tracked['mined'],
+                                                tracked['details'], receipt)
+                else:
+                    del tracked['mined']  # Reorganized, look for it again
+            elif tracked.get('dropped'):
+                dropped[tracked['origin']] = tracked['details']
+        return mined, dropped
+
+    def _poll(self):
+        pending = self.redis.hgetall(self.PENDING_KEY)
+        if not pending:
+            return []
+
+        pending = {
+            tx_hash.decode('utf-8'): json.loads(tracked.decode('utf-8'))
+            for tx_hash, tracked in pending.items()
+        }
+        # Hash, details and receipt by the origin of the mined transactions
+        mined, dropped = self._found(pending)
+        searched = {
+            tx_hash: tracked
+            for tx_hash, tracked in pending.items()
+            if tracked['origin'] not in mined
+            and tracked['origin'] not in dropped
+        }
+        if searched:
+            self._search(searched, mined, dropped)
+
+        pipe = self.redis.pipeline()
+        for tx_hash, tracked in pending.items():
+            # Every transaction replaced by (or replacing) it is marked
+            if tracked['origin'] in mined:
+                tracked['mined'] = mined[tracked['origin']][0]
+            elif tracked['origin'] in dropped:
+                tracked['dropped'] = True
+            pipe.hset(self.PENDING_KEY, tx_hash, json.dumps(tracked))
+        pipe.execute()
+
+        return [(origin, details, receipt)
+                for origin, (_, details, receipt) in mined.items()] + [
+                    (origin, details, None)
+                    for origin, details in dropped.items()
+                ]
+
+    def _search(self, pending, mined, dropped):
+        # Look for the pending transactions in the next blocks, adding the
+        # ones found to 'mined' and the ones unknown to the node to 'dropped'
+        latest = self.w3.eth.blockNumber
+        for tracked in pending.values():
+            # Tracked before the blocks were stored with them
+            tracked.setdefault('from_block',
+                               max(latest - self.max_blocks, 0))
+            tracked.setdefault('checked_block', tracked['from_block'])
+
+        from_block = min(t['from_block'] for t in pending.values())
+        to_block = min(latest, from_block + self.max_blocks - 1)
+        found = set()
+
+        for number in range(from_block, to_block + 1):
+            block = self.w3.eth.getBlock(number)
+
+            for tx_hash in block['transactions']:
+                tracked = pending.get(tx_hash.hex())
+                if tracked is None or tracked['origin'] in found:
+                    continue
+
+                receipt = self.w3.eth.getTransactionReceipt(tx_hash)
+                mined[tracked['origin']] = (tx_hash.hex(), tracked['details'],
+                                            receipt)
+                found.add(tracked['origin'])
+
+        unknown = set()
+        for tx_hash, tracked in pending.items():
+            if (tracked['origin'] in found
+                    or to_block - tracked['checked_block'] < self.check_after):
+                continue
+
+            # Not found in the blocks, e.g. they were reorganized
+            tracked['checked_block'] = to_block
+            receipt = self.w3.eth.getTransactionReceipt(tx_hash)
+            if receipt is not None:
+                mined[tracked['origin']] = (tx_hash, tracked['details'],
+                                            receipt)
+                found.add(tracked['origin'])
+            elif self.w3.eth.getTransaction(tx_hash) is None:
+                unknown.add(tx_hash)
+
+        # Dropped only if its replacements are unknown too
+        origins = {}
+        for tx_hash, tracked in pending.items():
+            origins.setdefault(tracked['origin'], tracked['details'])
+        for tx_hash, tracked in pending.items():
+            if tx_hash not in unknown or tracked['origin'] in found:
+                origins.pop(tracked['origin'], None)
+        dropped.update(origins)
+
+        for tracked in pending.values():
+            if tracked['origin'] not in found:
+                tracked['from_block'] = max(tracked['from_block'],
+                                            to_block + 1)
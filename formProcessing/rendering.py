@@ -0,0 +1,287 @@
+import os
+import time
+import hashlib
+import threading
+import importlib.util
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+import config
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Relative URLs in the templates (e.g. '/static/images/image1.png') are
+# resolved against this address and served from the app's folders
+BASE_URL = 'http://creativecontracts.local/'
+
+
+def source_date():
+    """ Date written in the metadata of deterministic renders.
+
+    Returns:
+        str: The W3C date given by the 'SOURCE_DATE_EPOCH' environment
+            variable (as in reproducible builds), by default the unix epoch.
+    """
+    epoch = int(os.getenv('SOURCE_DATE_EPOCH', 0))
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))
+
+
+def weasyprint_version():
+    """ Version of the installed WeasyPrint, without importing it.
+
+    Importing WeasyPrint takes most of a second, and the web app only needs
+    its version (to identify the contracts), it renders in its render pool.
+
+    Returns:
+        str: The version, e.g. '0.42.3'.
+    """
+    spec = importlib.util.find_spec('weasyprint')
+    try:
+        with open(os.path.join(os.path.dirname(spec.origin), 'VERSION')) as f:
+            return f.read().strip()
+    except OSError:
+        import weasyprint
+        return weasyprint.VERSION
+
+
+class ContractRenderer:
+    """ Renders the contract's PDF reusing everything but the event data.
+
+    The Jinja template is compiled once, the stylesheet is parsed once into a
+    WeasyPrint CSS object (including the fonts it imports) and every resource
+    fetched while rendering (images, fonts) is kept in memory. So each render
+    only lays out the document with the given event data.
+
+    In deterministic mode the PDF metadata dates are fixed, so the same event
+    data and templates always produce the same bytes (and SHA256).
+
+    In compact mode the images are downsampled to the resolution they are
+    printed at and the PDF is rewritten with its streams compressed and
+    without the objects WeasyPrint replaced, see 'compact.py'. The PDF is
+    compacted before it is hashed, so its hash is the one of the served file.
+
+    Attributes:
+        templates_dir (str): Folder with the contract's templates.
+        static_dir (str): Folder served as '/static/'.
+        template_name (str): File name of the contract's HTML template.
+        stylesheet_name (str): File name of the contract's CSS stylesheet.
+        deterministic (bool): Whether to write fixed metadata dates.
+        compact (bool): Whether to make the PDFs smaller.
+    """
+
+    def __init__(self,
+                 templates_dir=os.path.join(APP_DIR, 'templates'),
+                 static_dir=os.path.join(APP_DIR, 'static'),
+                 template_name='CONTRATO.html',
+                 stylesheet_name='CONTRATO.css',
+                 deterministic=True,
+                 compact=False):
+        """ Create the renderer, templates are loaded on first use.
+
+        Args:
+            templates_dir (str): Folder with the contract's templates.
+            static_dir (str): Folder served as '/static/'.
+            template_name (str): File name of the contract's HTML template.
+            stylesheet_name (str): File name of the contract's stylesheet.
+            deterministic (bool): Whether to write fixed metadata dates
+                instead of the render time.
+            compact (bool): Whether to downsample the images and compress
+                the PDFs.
+        """
+        self.templates_dir = templates_dir
+        self.static_dir = os.path.abspath(static_dir)
+        self.template_name = template_name
+        self.stylesheet_name = stylesheet_name
+        self.deterministic = deterministic
+        self.compact = compact
+
+        self._env = Environment(
+            loader=FileSystemLoader(templates_dir),
+            autoescape=select_autoescape(['html']),
+            auto_reload=False)
+        self._fetched = {}
+        self._lock = threading.Lock()
+        self._template = None
+        self._stylesheet = None
+        self._font_config = None
+        self._version = None
+
+    @property
+    def template(self):
+        """ object: The compiled Jinja template of the contract. """
+        if self._template is None:
+            self._template = self._env.get_template(self.template_name)
+        return self._template
+
+    @property
+    def stylesheet(self):
+        """ object: The parsed WeasyPrint CSS of the contract. """
+        if self._stylesheet is None:
+            from weasyprint import CSS
+            from weasyprint.fonts import FontConfiguration
+
+            self._font_config = FontConfiguration()
+            with open(os.path.join(self.templates_dir,
+                                   self.stylesheet_name), 'r') as f:
+                self._stylesheet = CSS(
+                    string=f.read(),
+                    base_url=BASE_URL,
+                    url_fetcher=self.url_fetcher,
+                    font_config=self._font_config)
+        return self._stylesheet
+
+    @property
+    def version(self):
+        """ str: SHA256 of everything but the event data used to render.
+
+        Covers the templates, the WeasyPrint version, the metadata dates and
+        the compact mode, so it changes whenever the same event data would
+        render differently.
+        """
+        if self._version is None:
+            digest = hashlib.sha256()
+            digest.update(weasyprint_version().encode('utf-8'))
+            if self.deterministic:
+                digest.update(source_date().encode('utf-8'))
+            if self.compact:
+                from compact import IMAGE_MAX_SIZE
+                digest.update(b'compact:%d' % IMAGE_MAX_SIZE)
+            for name in sorted(os.listdir(self.templates_dir)):
+                with open(os.path.join(self.templates_dir, name), 'rb') as f:
+                    digest.update(name.encode('utf-8'))
+                    digest.update(f.read())
+            self._version = digest.hexdigest()
+        return self._version
+
+    def preload(self):
+        """ Compile the template and parse the stylesheet right away. """
+        self.template
+        self.stylesheet
+
+    def _fetch(self, url):
+        static_url = BASE_URL + 'static/'
+        if url.startswith(static_url):
+            path = os.path.join(self.static_dir, url[len(static_url):])
+            # Don't serve files outside the static folder
+            if os.path.commonpath([os.path.abspath(path),
+                                   self.static_dir]) != self.static_dir:
+                raise ValueError('Not a static file: ' + url)
+            with open(path, 'rb') as f:
+                return {'string': f.read(), 'redirected_url': url}
+
+        from weasyprint import default_url_fetcher
+
+        result = default_url_fetcher(url)
+        if 'file_obj' in result:
+            file_obj = result.pop('file_obj')
+            try:
+                result['string'] = file_obj.read()
+            finally:
+                file_obj.close()
+
+        return result
+
+    def url_fetcher(self, url):
+        """ WeasyPrint URL fetcher keeping every fetched resource in memory.
+
+        Args:
+            url (str): Absolute URL of the resource.
+
+        Returns:
+            dict: The resource as expected by WeasyPrint.
+        """
+        if url not in self._fetched:
+            result = self._fetch(url)
+            if self.compact and 'string' in result:
+                from compact import downsample_image
+                result['string'] = downsample_image(result['string'])
+            with self._lock:
+                self._fetched[url] = result
+
+        return dict(self._fetched[url])
+
+    def render_html(self, event_data):
+        """ Render the contract's HTML without the stylesheet.
+
+        Args:
+            event_data (dict): The event data, see 'utils.generate_pdf'.
+
+        Returns:
+            str: The rendered HTML.
+        """
+        return self.template.render(
+            e=event_data,
+            external_stylesheet=True,
+            metadata_date=source_date() if self.deterministic else None)
+
+    def layout(self, event_data):
+        """ Lay out the contract's pages, without writing the PDF yet.
+
+        Args:
+            event_data (dict): The event data, see 'utils.generate_pdf'.
+
+        Returns:
+            object: The weasyprint Document, see its 'write_pdf'.
+        """
+        from weasyprint import HTML
+
+        stylesheet = self.stylesheet
+        html = HTML(
+            string=self.render_html(event_data),
+            base_url=BASE_URL,
+            url_fetcher=self.url_fetcher)
+
+        return html.render(
+            stylesheets=[stylesheet], font_config=self._font_config)
+
+    def render_pdf(self, event_data, target=None):
+        """ Render the contract in PDF.
+
+        Args:
+            event_data (dict): The event data, see 'utils.generate_pdf'.
+            target (object): File name or file object to write the PDF to.
+
+        Returns:
+            bytes: The PDF if no 'target' was given, None otherwise.
+        """
+        return self.write_pdf(self.layout(event_data), target)
+
+    def write_pdf(self, document, target=None):
+        """ Write the PDF of a laid out contract, compacted in compact mode.
+
+        Args:
+            document (object): The weasyprint Document, see 'layout'.
+            target (object): File name or file object to write the PDF to.
+
+        Returns:
+            bytes: The PDF if no 'target' was given, None otherwise.
+        """
+        if not self.compact:
+            return document.write_pdf(target)
+
+        from compact import compact_pdf
+
+        pdf = compact_pdf(document.write_pdf())
+        if target is None:
+            return pdf
+        if hasattr(target, 'write'):
+            target.write(pdf)
+        else:
+            with open(target, 'wb') as f:
+                f.write(pdf)
+
+
+_default_renderer = None
+
+
+def get_renderer():
+    """ Get the renderer shared by the whole process.
+
+    The PDFs are compacted if the 'CONTRACTS_COMPACT' setting is enabled.
+
+    Returns:
+        ContractRenderer: The renderer of the app's contract template.
+    """
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = ContractRenderer(
+            compact=config.CONTRACTS_COMPACT)
+    return _default_renderer
@@ -0,0 +1,90 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from rendering import get_renderer
+
+
+class RenderQueueFull(Exception):
+    """ Raised when the render pool can't accept more work. """
+
+
+def _preload_renderer():
+    # Parse the template and stylesheet once per process, not on first render
+    get_renderer().preload()
+
+
+class RenderPool:
+    """ Renders contracts in separate processes with a bounded queue.
+
+    Rendering is CPU bound, so it runs in a pool of processes instead of the
+    web server's threads. Work beyond 'max_pending' renders (running or
+    queued) is rejected right away, so callers can ask clients to retry
+    later instead of piling up requests.
+
+    Attributes:
+        workers (int): Number of rendering processes.
+        max_pending (int): Maximum number of renders running or queued.
+    """
+
+    def __init__(self, workers=2, max_pending=8):
+        """ Create the pool, processes are started on first use.
+
+        Args:
+            workers (int): Number of rendering processes.
+            max_pending (int): Maximum number of renders running or queued.
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forked from a server process that imported WeasyPrint once,
+                # so the renderers share its memory and this process (e.g.
+                # the web app) doesn't import it at all
+                context = multiprocessing.get_context('forkserver')
+                preload = ['weasyprint', 'rendering', 'utils']
+                if get_renderer().compact:
+                    preload += ['compact', 'pdfrw', 'PIL.Image']
+                context.set_forkserver_preload(preload)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_preload_renderer)
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """ Run the function in one of the rendering processes.
+
+        Args:
+            fn (function): Module level (picklable) function to run.
+            *args: Arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            object: The concurrent.futures.Future of the function's result.
+
+        Raises:
+            RenderQueueFull: If there are already 'max_pending' renders.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise RenderQueueFull('Too many contracts being rendered')
+
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def shutdown(self):
+        """ Wait for the pending renders and stop the processes. """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -1,7 +1,119 @@
+import json
+import time
 import solc
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.exceptions import NewConnectionError
 from web3 import Web3, HTTPProvider, IPCProvider, middleware
 from web3.gas_strategies.time_based import construct_time_based_gas_price_strategy
 from eth_account import Account
+from metrics import NullMetrics
+
+
+class BatchRequestError(Exception):
+    """ Raised when the node doesn't answer each call of a batch. """
+
+
+class NodeUnreachable(requests.exceptions.ConnectionError):
+    """ Raised when the connection to the node couldn't be established.
+
+    The request was never sent, unlike other connection errors where the
+    node may have received it before the connection was lost.
+    """
+
+
+class KeepAliveHTTPProvider(HTTPProvider):
+    """ HTTP provider owning its keep-alive session to the node.
+
+    Attributes:
+        session (object): The requests.Session reused for every RPC call.
+    """
+
+    def __init__(self, endpoint_uri, pool_size=10, request_kwargs=None):
+        """ Create the provider and its connection pool.
+
+        Args:
+            endpoint_uri (str): The http address of the ethereum node.
+            pool_size (int): Maximum number of connections kept open to the
+                node, should be at least the number of threads using it.
+            request_kwargs (dict): Extra arguments for 'requests.post'.
+        """
+        super().__init__(endpoint_uri, request_kwargs)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _post(self, request_data, kwargs):
+        try:
+            response = self.session.post(
+                self.endpoint_uri, data=request_data, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            # Refused connections are wrapped in a MaxRetryError
+            reason = getattr(e.args[0] if e.args else None, 'reason', None)
+            if (isinstance(e, requests.exceptions.ConnectTimeout)
+                    or isinstance(reason, NewConnectionError)):
+                raise NodeUnreachable(*e.args, request=e.request) from e
+            raise
+        response.raise_for_status()
+        return response
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        kwargs = self.get_request_kwargs()
+        kwargs.setdefault('timeout', 10)
+
+        response = self._post(request_data, kwargs)
+
+        return self.decode_rpc_response(response.content)
+
+    def make_batch_request(self, calls):
+        """ Send many RPC calls in a single JSON-RPC batch request.
+
+        Args:
+            calls (list): Tuples with the method and params of each call.
+
+        Returns:
+            list: The response of each call, in the same order, a dict with
+                either its 'result' or its 'error'.
+
+        Raises:
+            BatchRequestError: If the node rejected the whole batch, e.g. it
+                doesn't support batches or the batch is too big.
+        """
+        request_data = json.dumps([{
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params,
+            'id': i
+        } for i, (method, params) in enumerate(calls)]).encode('utf-8')
+        kwargs = self.get_request_kwargs()
+        kwargs.setdefault('timeout', 10)
+
+        response = self._post(request_data, kwargs)
+
+        responses = json.loads(response.content)
+        if not isinstance(responses, list):
+            # A single error for the whole batch
+            if isinstance(responses, dict):
+                responses = responses.get('error', responses)
+            raise BatchRequestError('The node rejected the batch request: ' +
+                                    json.dumps(responses))
+        ids = sorted(
+            r['id'] for r in responses
+            if isinstance(r, dict) and isinstance(r.get('id'), int))
+        if ids != list(range(len(calls))):
+            raise BatchRequestError(
+                'Expected %d responses to the batch request, got: %s' %
+                (len(calls), response.text[:200]))
+
+        # Nodes may answer in any order
+        return sorted(responses, key=lambda r: r['id'])
+
+    def close(self):
+        """ Close all the connections to the node. """
+        self.session.close()
 
 
 class SmartContract:
@@ -10,10 +122,23 @@ class SmartContract:
     Attributes:
         w3 (object): Instance of the web3 client.
         default_account (str): Ethereum address to use for contract deployment.
+        signing_account (object): Local account signing the transactions of
+            'default_account', or None if the node signs them.
+        nonce_manager (NonceManager): Allocates the nonces of locally signed
+            transactions, if None they are asked to the node.
         contract_data (dict): Dict containing contract's constructor arguments.
+        metrics (Metrics): Records the seconds spent compiling and in each
+            stage of the transactions (gas price, build, nonce, sign, send).
     """
 
-    def __init__(self, node_uri, use_ipc=False, use_poa=False):
+    def __init__(self,
+                 node_uri,
+                 use_ipc=False,
+                 use_poa=False,
+                 provider=None,
+                 gas_price_strategy=None,
+                 metrics=None,
+                 rpc_counter=None):
         """ Create instance to interact with the contract deployer.
 
         Args:
@@ -24,27 +149,44 @@ class SmartContract:
             use_poa (bool): If True then it will inject 'geth_poa_middleware'
                      to the web3 instance. When 'node_uri' refers to a Rinkeby
                      node then this needs to be set to True.
+            provider (object): Web3 provider to use instead of connecting to
+                     'node_uri', like an 'EthereumTesterProvider'.
+            gas_price_strategy (function): Web3 gas price strategy, like the
+                     ones built by 'GasPriceOracle'. If None an express time
+                     based strategy sampling the last blocks is used.
+            metrics (Metrics): Records the seconds spent in each stage, if
+                     given.
+            rpc_counter (RPCCounter): Middleware counting the RPC requests
+                     sent to the node, if given.
         """
-        if use_ipc:
+        if provider is not None:
+            pass
+        elif use_ipc:
             provider = IPCProvider(node_uri)
         else:
-            provider = HTTPProvider(node_uri)
+            provider = KeepAliveHTTPProvider(node_uri)
 
         self.w3 = Web3(provider)
         self.default_account = None
+        self.signing_account = None
+        self.nonce_manager = None
         self.contract_data = None
+        self.metrics = metrics or NullMetrics()
+        self._unlocked_until = {}  # Address -> time when it gets locked again
+        self._loaded_accounts = {}  # Private key -> local account
 
         if use_poa:
             # Needed only with PoA (Rinkeby)
             self.w3.middleware_stack.inject(
                 middleware.geth_poa_middleware, layer=0)
 
-        block_sample = 40
-        prob = 95  # Probability to be included
-        express_strategy = construct_time_based_gas_price_strategy(
-            30, block_sample, prob)
+        if gas_price_strategy is None:
+            block_sample = 40
+            prob = 95  # Probability to be included
+            gas_price_strategy = construct_time_based_gas_price_strategy(
+                30, block_sample, prob)
 
-        self.w3.eth.setGasPriceStrategy(express_strategy)
+        self.w3.eth.setGasPriceStrategy(gas_price_strategy)
         # Tries to make transactions faster (and more expensive?)
         # self.w3.eth.setGasPriceStrategy(fast_gas_price_strategy)
         self.w3.middleware_stack.add(middleware.time_based_cache_middleware)
@@ -52,6 +194,30 @@ class SmartContract:
             middleware.latest_block_based_cache_middleware)
         self.w3.middleware_stack.add(middleware.simple_cache_middleware)
 
+        if rpc_counter is not None:
+            # Innermost, so requests answered by the caches aren't counted
+            self.w3.middleware_stack.inject(rpc_counter, layer=0)
+
+    def is_connected(self):
+        """ Check the connection to the node is alive.
+
+        Returns:
+            bool: True if the node answered.
+        """
+        try:
+            return self.w3.isConnected()
+        except Exception:
+            return False
+
+    def close(self):
+        """ Release the connections to the node. """
+        provider = self.w3.providers[0]
+        if isinstance(provider, KeepAliveHTTPProvider):
+            provider.close()
+        elif isinstance(provider, IPCProvider) and provider._socket.sock:
+            provider._socket.sock.close()
+            provider._socket.sock = None
+
     def validate_to_checksum(self, address):
         """ Validate given Ethereum address and change to checksum version.
 
@@ -177,16 +343,55 @@ class SmartContract:
             ValueError: If the given address is not a valid Ethereum address.
         """
         self.default_account = self.validate_to_checksum(public_key)
+        self.signing_account = None
+
+    def load_account(self, private_key, as_default=True):
+        """ Sign the deployments locally with the given private key.
+
+        Unlike 'import_account' this doesn't send the key to the node nor
+        makes any request to it. The deployment transactions are signed in
+        this process and sent already signed, so the node doesn't need to hold
+        an unlocked account.
+
+        Args:
+            private_key (str): Ethereum private key used to sign transactions.
+            as_default (bool): If True the account will be set as the default
+                account used to deploy the contract.
 
-    def import_account(self, private_key, passphrase, as_default=True):
+        Returns:
+            str: The corresponding public key, that is the Ethereum address
+                 matching to the given private key.
+        """
+        # Deriving the address is relatively costly, reuse the loaded one
+        if self._loaded_accounts.get(private_key) is None:
+            self._loaded_accounts[private_key] = Account.privateKeyToAccount(
+                private_key)
+        account = self._loaded_accounts[private_key]
+
+        if as_default:
+            self.default_account = account.address
+            self.signing_account = account
+
+        return account.address
+
+    def import_account(self,
+                       private_key,
+                       passphrase,
+                       as_default=True,
+                       unlock_duration=300):
         """ Import account to the Ethereum node to sign contract deployment.
 
+        The node is not queried again while the account remains unlocked from
+        a previous call, so long lived instances pay for the import only once
+        every 'unlock_duration' seconds.
+
         Args:
             private_key (str): Ethereum private key to import to the configured
                 node.
             passphrase (str): Passphrase used to protect the private_key.
             as_default (bool): If True the imported account will be set as the
                 default account used to deploy the contract.
+            unlock_duration (int): Seconds the node keeps the account unlocked.
 
         Returns:
             str: The corresponding public key, that is the Ethereum address
@@ -199,6 +404,12 @@ class SmartContract:
         # Check if address exists
         public_key = Account.privateKeyToAccount(private_key).address
 
+        # Keep a margin so the account doesn't get locked mid deployment
+        if self._unlocked_until.get(public_key, 0) > time.monotonic() + 30:
+            if as_default:
+                self.default_account = self.validate_to_checksum(public_key)
+            return public_key
+
         if public_key not in self.w3.eth.accounts:
             # Add a sample wallet with funds
             self.w3.personal.importRawKey(private_key, passphrase)
@@ -208,8 +419,9 @@ class SmartContract:
         # TODO Use the flask app's logger instead of print to stdout directly
         print('Will use account: ', default_account)
 
-        is_unlocked = self.w3.personal.unlockAccount(default_account,
-                                                     passphrase)
+        unlocked_at = time.monotonic()
+        is_unlocked = self.w3.personal.unlockAccount(
+            default_account, passphrase, unlock_duration)
         if not is_unlocked:
             # TODO Use the flask app's logger instead of print to stdout
             # directly
@@ -217,17 +429,103 @@ class SmartContract:
                   default_account)
             return None
 
+        self._unlocked_until[public_key] = unlocked_at + unlock_duration
+
         if as_default:
             self.default_account = self.validate_to_checksum(public_key)
+            self.signing_account = None
 
         return public_key
 
+    def transaction_defaults(self):
+        """ Fields the node would fill in a transaction it signs itself.
+
+        Returns:
+            dict: The 'from' and 'chainId' of the transactions of
+                'default_account'. The 'nonce' is filled by 'send_signed'.
+        """
+        return {
+            'from': self.default_account,
+            # 'net_version' is cached by 'simple_cache_middleware'
+            'chainId': int(self.w3.net.version)
+        }
+
+    def send_signed(self, transaction):
+        """ Sign the transaction with 'signing_account' and send it.
+
+        When the transaction has no 'nonce' it is allocated by 'nonce_manager'
+        if there is one, so many transactions can be in flight at once, or
+        asked to the node otherwise.
+
+        Args:
+            transaction (dict): Transaction with all its fields filled, as
+                returned by 'buildTransaction'.
+
+        Returns:
+            bytes: The hash of the sent transaction.
+        """
+        allocated = False
+
+        if 'nonce' not in transaction:
+            with self.metrics.time('eth_transaction_seconds', stage='nonce'):
+                if self.nonce_manager:
+                    transaction['nonce'] = self.nonce_manager.allocate()
+                    allocated = True
+                else:
+                    transaction['nonce'] = self.w3.eth.getTransactionCount(
+                        self.default_account, 'pending')
+
+        with self.metrics.time('eth_transaction_seconds', stage='sign'):
+            signed = self.signing_account.signTransaction(transaction)
+
+        try:
+            with self.metrics.time('eth_transaction_seconds', stage='send'):
+                tx_hash = self.w3.eth.sendRawTransaction(
+                    signed.rawTransaction)
+        except Exception:
+            if allocated:
+                self.nonce_manager.release(transaction['nonce'])
+            raise
+
+        if self.nonce_manager:
+            self.nonce_manager.submitted(transaction, tx_hash)
+
+        return tx_hash
+
+    def send(self, function_call):
+        """ Send a transaction from 'default_account' calling the function.
+
+        The transaction is signed locally when an account was loaded with
+        'load_account', otherwise the node signs it.
+
+        Args:
+            function_call (object): A contract's function or constructor,
+                with its arguments, to call.
+
+        Returns:
+            bytes: The hash of the sent transaction.
+        """
+        if not self.signing_account:
+            with self.metrics.time('eth_transaction_seconds', stage='send'):
+                return function_call.transact({'from': self.default_account})
+
+        transaction = self.transaction_defaults()
+        # Computed here to time it apart from the gas estimation
+        with self.metrics.time('eth_transaction_seconds', stage='gas_price'):
+            gas_price = self.w3.eth.generateGasPrice()
+        if gas_price is not None:
+            transaction['gasPrice'] = gas_price
+
+        with self.metrics.time('eth_transaction_seconds', stage='build'):
+            transaction = function_call.buildTransaction(transaction)
+
+        return self.send_signed(transaction)
+
     def deploy_compiled(self, abi, bytecode):
         """ Deploy the given contract's ABI and Bytecode.
 
-        Note this function blocks the thread, since it waits for the block
-        containing the deployment transaction to be mined befor returning. So
-        is not a good idea to call it in the main thread.
+        Note this function doesn't wait for the transaction to be mined, use a
+        ReceiptTracker to get the deployed contract's address.
 
         Args:
             abi (str): The contract's ABI to deploy.
@@ -240,7 +538,7 @@ class SmartContract:
                 first.
 
         Returns:
-            str: The deployed contract's Ethereum address.
+            bytes: The hash of the deployment transaction.
         """
         if not (self.default_account and self.contract_data):
             raise ValueError(
@@ -252,7 +550,7 @@ class SmartContract:
         # TODO Can use this to estimate gas and log that out
         # https://web3py.readthedocs.io/en/stable/web3.eth.html#web3.eth.Eth.estimateGas
 
-        tx_hash = contract.constructor(
+        return self.send(contract.constructor(
             self.contract_data['customer_address'],
             self.contract_data['oracle_address'],
             self.contract_data['contract_amount'],
@@ -260,29 +558,108 @@ class SmartContract:
             self.contract_data['lchash'],
             self.contract_data['contract_settlement_ts'],
             self.contract_data['contract_duedate_ts'],
-            self.contract_data['contract_delivery_ts']).transact({
-                'from':
-                self.default_account
-            })
+            self.contract_data['contract_delivery_ts']))
 
-        # TODO Return 'tx_hash' instead so other process could monitor the receipt
-        return tx_hash
+    def deploy_clone(self, factory_abi, factory_address):
+        """ Deploy the contract as a clone created by a CreativeContractFactory.
+
+        The clone is a minimal proxy to the factory's implementation, so this
+        transaction is much cheaper than deploying the whole contract. Use
+        'clone_address' with the transaction receipt to get the address of the
+        new contract.
+
+        Args:
+            factory_abi (list): The ABI of the CreativeContractFactory.
+            factory_address (str): Address of the deployed factory, see
+                'deploy_factory'.
+
+        Raises:
+            ValueError: If the contract data or default account neede for
+                deployment have not been set. Need to call
+                "set_deployment_account" and "set_contract_data" functions
+                first.
+
+        Returns:
+            bytes: The hash of the deployment transaction.
+        """
+        if not (self.default_account and self.contract_data):
+            raise ValueError(
+                'Set up account and contract data before deploying')
+
+        factory = self.w3.eth.contract(
+            address=self.validate_to_checksum(factory_address),
+            abi=factory_abi)
+
+        return self.send(factory.functions.createContract(
+            self.contract_data['customer_address'],
+            self.contract_data['oracle_address'], [
+                self.contract_data['contract_amount'],
+                self.contract_data['oracle_fee'],
+                self.contract_data['contract_settlement_ts'],
+                self.contract_data['contract_duedate_ts'],
+                self.contract_data['contract_delivery_ts']
+            ], self.contract_data['lcurl'], self.contract_data['lchash']))
+
+    def clone_address(self, factory_abi, receipt):
+        """ Get the address of the contract created by 'deploy_clone'.
+
+        Args:
+            factory_abi (list): The ABI of the CreativeContractFactory.
+            receipt (dict): Receipt of the transaction sent by 'deploy_clone'.
+
+        Returns:
+            str: The new contract's address, or None if it wasn't created.
+        """
+        factory = self.w3.eth.contract(abi=factory_abi)
+        created = factory.events.ContractCreated().processReceipt(receipt)
+
+        return created[0]['args']['contractAddress'] if created else None
 
-        # Get tx receipt to get contract address
-        # tx_receipt = self.w3.eth.waitForTransactionReceipt(
-        #     tx_hash, timeout=300)
+    def deploy_factory(self, artifact_store, template_id, factory_id,
+                       timeout=300):
+        """ Deploy the implementation and the factory used by 'deploy_clone'.
 
-        # print('\n\n======= TX RECEIPT ========')
-        # print(pprint.pformat(tx_receipt))
+        This is only done once, so unlike the other deployment functions it
+        waits for the transactions to be mined.
 
-        # return tx_receipt['contractAddress']  # Return contract address
+        Args:
+            artifact_store (ArtifactStore): Store holding the compiled
+                contracts.
+            template_id (str): Artifact identifier of the
+                CreativeContractTemplate.
+            factory_id (str): Artifact identifier of the
+                CreativeContractFactory.
+            timeout (int): Seconds to wait for each transaction to be mined.
+
+        Raises:
+            ValueError: If the default account needed for deployment has not
+                been set.
+
+        Returns:
+            str: The factory's address.
+        """
+        if not self.default_account:
+            raise ValueError('Set up account before deploying')
+
+        deployed = None
+        for artifact_id in (template_id, factory_id):
+            artifact = artifact_store.get(artifact_id)
+            contract = self.w3.eth.contract(
+                abi=artifact['abi'], bytecode=artifact['bin'])
+
+            constructor = (contract.constructor(deployed)
+                           if deployed else contract.constructor())
+            receipt = self.w3.eth.waitForTransactionReceipt(
+                self.send(constructor), timeout=timeout)
+            deployed = receipt['contractAddress']
+
+        return deployed
 
     def deploy(self, contract_name, contract_source_code):
         """ Deploy the contract given the name and the source code.
 
-        Note this function blocks the thread, since it waits for the block
-        containing the deployment transaction to be mined befor returning. So
-        is not a good idea to call it in the main thread.
+        Note this function doesn't wait for the transaction to be mined, use a
+        ReceiptTracker to get the deployed contract's address.
 
         Args:
             contract_name (str): The contract's name.
@@ -295,7 +672,7 @@ class SmartContract:
                 first.
 
         Returns:
-            str: The deployed contract's Ethereum address.
+            bytes: The hash of the deployment transaction.
         """
         # TODO Use an extra flag parameter to know if should loop after
         # TimeExhausted is raised, so it can wait infinitely for the
@@ -305,8 +682,118 @@ class SmartContract:
             raise ValueError(
                 'Set up account and contract data before deploying')
 
-        compiled_sol = solc.compile_source(contract_source_code, optimize=True)
+        with self.metrics.time('contract_compile_seconds'):
+            compiled_sol = solc.compile_source(
+                contract_source_code, optimize=True)
         contract_interface = compiled_sol['<stdin>:' + contract_name]
 
         return self.deploy_compiled(contract_interface['abi'],
                                     contract_interface['bin'])
+
+    def deploy_artifact(self, artifact_store, artifact_id):
+        """ Deploy a contract already compiled in the given artifact store.
+
+        Args:
+            artifact_store (ArtifactStore): Store holding the compiled
+                contract.
+            artifact_id (str): Identifier of the compiled contract in the
+                store, as returned by its 'compile' or 'compile_file'.
+
+        Raises:
+            ValueError: If the contract data or default account neede for
+                deployment have not been set. Need to call
+                "set_deployment_account" and "set_contract_data" functions
+                first.
+            KeyError: If the artifact is not in the store.
+
+        Returns:
+            bytes: The hash of the deployment transaction.
+        """
+        if not (self.default_account and self.contract_data):
+            raise ValueError(
+                'Set up account and contract data before deploying')
+
+        artifact = artifact_store.get(artifact_id)
+
+        return self.deploy_compiled(artifact['abi'], artifact['bin'])
+
+    def _read_calls(self, address, fields, block):
+        calls = []
+        for field in fields:
+            if field == 'balance':
+                calls.append(('eth_getBalance', [address, block]))
+            else:
+                selector = Web3.sha3(text=field + '()')[:4]
+                calls.append(('eth_call', [{
+                    'to': address,
+                    'data': Web3.toHex(selector)
+                }, block]))
+        return calls
+
+    def _read_chunk(self, addresses, fields, block):
+        calls = [
+            call for address in addresses
+            for call in self._read_calls(address, fields, block)
+        ]
+
+        provider = self.w3.providers[0]
+        responses = None
+        if isinstance(provider, KeepAliveHTTPProvider):
+            try:
+                responses = provider.make_batch_request(calls)
+            except BatchRequestError as e:
+                # TODO Use the flask app's logger instead of print to stdout
+                # directly
+                print('Batch request failed, sending the calls one by one: ',
+                      e)
+        if responses is None:
+            # IPC and other providers, one call at a time
+            responses = [
+                provider.make_request(method, params)
+                for method, params in calls
+            ]
+
+        values = {}
+        for i, address in enumerate(addresses):
+            values[address] = {}
+            for j, field in enumerate(fields):
+                result = responses[i * len(fields) + j].get('result')
+                # No value if the call failed or the contract self destructed
+                values[address][field] = (int(result, 16) if result and
+                                          result != '0x' else None)
+        return values
+
+    def read_many(self, addresses, fields, chunk_size=100, concurrency=4):
+        """ Read the state of many contracts with few requests to the node.
+
+        The reads of 'chunk_size' contracts are sent in a single JSON-RPC
+        batch request, and up to 'concurrency' batches at once. Providers
+        other than KeepAliveHTTPProvider (e.g. IPC) make one call at a time.
+        Every read is made at the same block, so values are consistent.
+
+        Args:
+            addresses (list): Addresses of the contracts to read.
+            fields (list): What to read of each contract, either 'balance'
+                (in wei) or the name of a function without arguments
+                returning an uint256, like 'debt'.
+            chunk_size (int): Number of contracts per request.
+            concurrency (int): Number of requests in flight at once.
+
+        Returns:
+            dict: For each address, a dict with the value of each field, None
+                if it couldn't be read (e.g. a destroyed contract).
+        """
+        block = Web3.toHex(self.w3.eth.blockNumber)
+        chunks = [
+            addresses[i:i + chunk_size]
+            for i in range(0, len(addresses), chunk_size)
+        ]
+
+        values = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for chunk_values in executor.map(
+                    lambda chunk: self._read_chunk(chunk, fields, block),
+                    chunks):
+                values.update(chunk_values)
+
+        return values
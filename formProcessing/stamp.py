@@ -0,0 +1,165 @@
+import re
+import zlib
+import qrcode
+from pdfrw import PdfReader, PdfArray, PdfDict
+
+# Layout of the stamp page, in PDF points from the page's top left corner
+MARGIN = 72
+QR_MODULE_SIZE = 4
+
+
+def _startxref(pdf):
+    offsets = re.findall(rb'startxref\s+(\d+)', pdf[-1024:])
+    if not offsets:
+        raise ValueError('Not a PDF, startxref not found')
+    return int(offsets[-1])
+
+
+def _text(value):
+    # Standard fonts use WinAnsiEncoding, close enough to latin-1
+    escaped = value.replace('\\', '\\\\').replace('(', '\\(').replace(
+        ')', '\\)')
+    return b'(' + escaped.encode('latin-1', 'replace') + b')'
+
+
+def _serialize(value, numbers):
+    """ Serialize a value read by pdfrw, referencing its indirect objects.
+
+    Args:
+        value (object): A pdfrw object or token.
+        numbers (dict): Object number and generation by the id() of each
+            indirect object of the file.
+
+    Returns:
+        bytes: The value in PDF syntax.
+    """
+    if id(value) in numbers:
+        return b'%d %d R' % numbers[id(value)]
+    if isinstance(value, PdfDict):
+        if value.stream is not None:
+            raise ValueError('Streams must be indirect objects')
+        return b'<<' + b''.join(
+            b' %s %s' % (key.encode('latin-1'), _serialize(item, numbers))
+            for key, item in value.iteritems()) + b' >>'
+    if isinstance(value, PdfArray):
+        return b'[' + b' '.join(_serialize(item, numbers)
+                                for item in value) + b']'
+    return str(value).encode('latin-1')
+
+
+def _qr_code(data, x, top):
+    """ Draw a QR code as vector rectangles.
+
+    Args:
+        data (str): Content of the QR code.
+        x (float): Horizontal position of its left side.
+        top (float): Vertical position of its top side.
+
+    Returns:
+        bytes: The content stream operators drawing the code.
+    """
+    qr = qrcode.QRCode(border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    size = QR_MODULE_SIZE
+    rectangles = [
+        b'%d %d %d %d re' % (x + col * size, top - (row + 1) * size, size,
+                             size)
+        for row, modules in enumerate(matrix)
+        for col, dark in enumerate(modules) if dark
+    ]
+
+    return b'q 0 g\n' + b'\n'.join(rectangles) + b'\nf Q\n'
+
+
+def deployment_update(pdf, contract_address, contract_hash):
+    """ Create an incremental update adding a page about the deployment.
+
+    The page shows the address of the deployed smart contract, a QR code of
+    it and the hash of the original PDF. Appending the update to the original
+    PDF leaves its bytes untouched, so the hash stored in the blockchain can
+    still be verified against the first bytes of the deployed PDF.
+
+    Args:
+        pdf (bytes): The contract's PDF as rendered by WeasyPrint, which
+            writes a classic cross-reference table.
+        contract_address (str): Address of the deployed smart contract.
+        contract_hash (str): Hex digest of the SHA256 of the original PDF.
+
+    Returns:
+        bytes: The incremental update to append to the original PDF.
+    """
+    reader = PdfReader(fdata=pdf)
+    numbers = {id(obj): key for key, obj in reader.indirect_objects.items()}
+    root, info = reader.Root, reader.Info
+    pages = root.Pages
+    pages_number = numbers[id(pages)]
+
+    left, bottom, right, top = (
+        float(v) for v in pages.Kids[-1].inheritable.MediaBox)
+
+    # The new objects are numbered after the existing ones
+    size = int(reader.Size)
+    page_number, contents_number, font_number = size, size + 1, size + 2
+
+    lines = [
+        (16, 'Contrato inteligente'),
+        (10, 'Dirección: %s' % contract_address),
+        (10, 'SHA256 del contrato original:'),
+        (10, contract_hash),
+    ]
+    contents = b''
+    y = top - MARGIN
+    for font_size, line in lines:
+        y -= font_size * 1.5
+        contents += b'BT /F1 %d Tf %d %d Td %s Tj ET\n' % (
+            font_size, left + MARGIN, y, _text(line))
+    contents += _qr_code(contract_address, left + MARGIN, y - MARGIN / 2)
+    contents = zlib.compress(contents)
+
+    # The Pages tree is replaced by a copy listing the new page too
+    kids = b' '.join(_serialize(kid, numbers) for kid in pages.Kids)
+    inherited = b''.join(
+        b' %s %s' % (key.encode('latin-1'), _serialize(value, numbers))
+        for key, value in pages.iteritems()
+        if key not in ('/Type', '/Kids', '/Count'))
+
+    media_box = ' '.join('%g' % v for v in (left, bottom, right, top))
+
+    objects = [
+        (page_number, b'<< /Type /Page /Parent %d %d R /MediaBox [%s]'
+         b' /Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>' %
+         (pages_number[0], pages_number[1], media_box.encode('latin-1'),
+          font_number, contents_number)),
+        (contents_number, b'<< /Length %d /Filter /FlateDecode >>\nstream\n'
+         b'%s\nendstream' % (len(contents), contents)),
+        (font_number, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica'
+         b' /Encoding /WinAnsiEncoding >>'),
+        (pages_number[0], b'<< /Type /Pages /Kids [%s %d 0 R] /Count %d%s >>'
+         % (kids, page_number, int(pages.Count) + 1, inherited)),
+    ]
+
+    update = b'' if pdf.endswith(b'\n') else b'\n'
+    offsets = {}
+    for number, body in objects:
+        generation = pages_number[1] if number == pages_number[0] else 0
+        offsets[number] = (len(pdf) + len(update), generation)
+        update += b'%d %d obj\n%s\nendobj\n' % (number, generation, body)
+
+    # One subsection per object, they aren't all consecutive
+    xref_offset = len(pdf) + len(update)
+    update += b'xref\n'
+    for number in sorted(offsets):
+        offset, generation = offsets[number]
+        update += b'%d 1\n%010d %05d n \n' % (number, offset, generation)
+
+    trailer = b'/Size %d /Root %s /Prev %d' % (
+        font_number + 1, _serialize(root, numbers), _startxref(pdf))
+    if info is not None:
+        trailer += b' /Info %s' % _serialize(info, numbers)
+    update += b'trailer\n<< %s >>\nstartxref\n%d\n%%%%EOF\n' % (trailer,
+                                                              xref_offset)
+
+    return update
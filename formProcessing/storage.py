@@ -0,0 +1,358 @@
+import os
+import hashlib
+import tempfile
+import contextlib
+import importlib.util
+
+
+class HashingFile:
+    """ Write only file computing the SHA256 of everything written to it.
+
+    Attributes:
+        name (str): Name the file is stored with, set once it is stored.
+        size (int): Number of bytes written so far.
+    """
+
+    def __init__(self, fileobj):
+        """ Wrap the file the content is written to.
+
+        Args:
+            fileobj (object): Binary file open for writing.
+        """
+        self.name = None
+        self.size = 0
+        self._file = fileobj
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        """ Write data to the file and hash it.
+
+        Args:
+            data (bytes): Data to append to the file.
+
+        Returns:
+            int: Number of bytes written.
+        """
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        """ Hex digest of the SHA256 of the data written so far. """
+        return self._sha256.hexdigest()
+
+
+class LocalStorage:
+    """ Stores the contract PDFs in a local folder.
+
+    Files are sharded in nested folders named after the first characters of
+    their name (e.g. 'ab/cd/abcd...pdf'), so no folder grows to millions of
+    entries. They are written to a temporary file, synced to disk and then
+    renamed, so a crash never leaves a partial file under a valid name.
+
+    Files stored before they were sharded, directly in the legacy folder,
+    are still found.
+
+    Attributes:
+        root (str): Folder holding the stored files.
+        shard_depth (int): Number of nested folders, each one named after the
+            next two characters of the file name.
+        legacy_root (str): Folder holding the files stored flat.
+    """
+
+    def __init__(self, root, shard_depth=2, legacy_root=None):
+        """ Create a storage in the given folder.
+
+        Args:
+            root (str): Folder holding the stored files, it is created if it
+                doesn't exist.
+            shard_depth (int): Number of nested folders of each file.
+            legacy_root (str): Folder holding the files stored flat, by
+                default the root.
+        """
+        self.root = root
+        self.shard_depth = shard_depth
+        self.legacy_root = legacy_root or root
+        self._tmp_dir = os.path.join(root, '.tmp')
+
+        os.makedirs(self._tmp_dir, exist_ok=True)
+
+    def key(self, name):
+        """ Relative path of a stored file.
+
+        Args:
+            name (str): Name of the file, e.g. the PDF's hash.
+
+        Returns:
+            str: The path relative to the storage's root, with '/' separators.
+        """
+        shards = [name[i:i + 2] for i in range(0, 2 * self.shard_depth, 2)]
+        return '/'.join(shards + [name + '.pdf'])
+
+    def path(self, name, legacy=True):
+        """ Absolute path of a stored file.
+
+        Args:
+            name (str): Name of the file.
+            legacy (bool): Whether to return the file's flat path in the
+                legacy folder when it is only stored there.
+
+        Returns:
+            str: The path to the file.
+        """
+        path = os.path.abspath(os.path.join(self.root, *self.key(name).split(
+            '/')))
+        if legacy and not os.path.exists(path):
+            flat_path = os.path.abspath(
+                os.path.join(self.legacy_root, name + '.pdf'))
+            if os.path.exists(flat_path):
+                return flat_path
+        return path
+
+    def exists(self, name):
+        """ Whether a file is stored.
+
+        Args:
+            name (str): Name of the file.
+
+        Returns:
+            bool: True if the file exists.
+        """
+        return os.path.exists(self.path(name))
+
+    def open(self, name):
+        """ Open a stored file for reading.
+
+        Args:
+            name (str): Name of the file.
+
+        Returns:
+            object: The binary file, to be closed by the caller.
+
+        Raises:
+            FileNotFoundError: If the file isn't stored.
+        """
+        return open(self.path(name), 'rb')
+
+    def read(self, name):
+        """ Read the whole content of a stored file.
+
+        Args:
+            name (str): Name of the file.
+
+        Returns:
+            bytes: The file's content.
+
+        Raises:
+            FileNotFoundError: If the file isn't stored.
+        """
+        with self.open(name) as f:
+            return f.read()
+
+    @contextlib.contextmanager
+    def writer(self, name=None):
+        """ Store a file as it is written.
+
+        The file is stored once the block exits without errors, under the
+        given name or under the SHA256 of its content.
+
+        Args:
+            name (str): Name to store the file with, by default its hash.
+
+        Yields:
+            HashingFile: The file to write the content to.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir, suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                stored = HashingFile(f)
+                yield stored
+                f.flush()
+                os.fsync(f.fileno())
+
+            stored.name = name or stored.hexdigest()
+            path = self.path(stored.name, legacy=False)
+            folder = os.path.dirname(path)
+            os.makedirs(folder, exist_ok=True)
+            os.replace(tmp_path, path)
+
+            # Make the rename itself durable
+            folder_fd = os.open(folder, os.O_RDONLY)
+            try:
+                os.fsync(folder_fd)
+            finally:
+                os.close(folder_fd)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class S3Storage:
+    """ Stores the contract PDFs in an S3 compatible service, e.g. MinIO.
+
+    Files are written to a temporary file, spilled to disk when big, and
+    uploaded once complete. An upload is atomic, a partial file is never
+    visible.
+
+    Attributes:
+        bucket (str): Name of the bucket holding the files.
+        prefix (str): Prefix of the stored files' keys.
+        endpoint_url (str): URL of the service, None for AWS.
+    """
+
+    def __init__(self, bucket, prefix='contratos/', endpoint_url=None):
+        """ Create a storage in the given bucket.
+
+        Credentials are found by boto3 (environment variables, config files,
+        etc.).
+
+        Args:
+            bucket (str): Name of the bucket holding the files.
+            prefix (str): Prefix of the stored files' keys.
+            endpoint_url (str): URL of the service, None for AWS.
+
+        Raises:
+            RuntimeError: If boto3 isn't installed.
+        """
+        # Imported by the client, only once an S3 storage is used
+        if importlib.util.find_spec('boto3') is None:
+            raise RuntimeError('S3 storage requires boto3 to be installed')
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self._client = None
+
+    def __getstate__(self):
+        # Clients can't be pickled, e.g. to be sent to the render pool
+        state = self.__dict__.copy()
+        state['_client'] = None
+        return state
+
+    @property
+    def client(self):
+        """ object: The boto3 S3 client, created on first use. """
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url)
+        return self._client
+
+    def key(self, name):
+        """ Key of a stored file, relative to the storage's prefix.
+
+        Args:
+            name (str): Name of the file, e.g. the PDF's hash.
+
+        Returns:
+            str: The file's key without the prefix.
+        """
+        return name + '.pdf'
+
+    def exists(self, name):
+        """ Whether a file is stored.
+
+        Args:
+            name (str): Name of the file.
+
+        Returns:
+            bool: True if the file exists.
+        """
+        try:
+            self.client.head_object(
+                Bucket=self.bucket, Key=self.prefix + self.key(name))
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+        return True
+
+    def open(self, name):
+        """ Open a stored file for reading.
+
+        Args:
+            name (str): Name of the file.
+
+        Returns:
+            object: The binary file, to be closed by the caller.
+
+        Raises:
+            FileNotFoundError: If the file isn't stored.
+        """
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.prefix + self.key(name))
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError('Unknown file: ' + name)
+        return response['Body']
+
+    def read(self, name):
+        """ Read the whole content of a stored file.
+
+        Args:
+            name (str): Name of the file.
+
+        Returns:
+            bytes: The file's content.
+
+        Raises:
+            FileNotFoundError: If the file isn't stored.
+        """
+        body = self.open(name)
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    @contextlib.contextmanager
+    def writer(self, name=None):
+        """ Store a file as it is written.
+
+        The file is uploaded once the block exits without errors, under the
+        given name or under the SHA256 of its content.
+
+        Args:
+            name (str): Name to store the file with, by default its hash.
+
+        Yields:
+            HashingFile: The file to write the content to.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as f:
+            stored = HashingFile(f)
+            yield stored
+
+            stored.name = name or stored.hexdigest()
+            f.seek(0)
+            self.client.upload_fileobj(
+                f,
+                self.bucket,
+                self.prefix + self.key(stored.name),
+                ExtraArgs={'ContentType': 'application/pdf'})
+
+
+def make_storage(config):
+    """ Create the contracts storage configured in the app.
+
+    Args:
+        config (dict): App config with 'CONTRACTS_STORAGE' set to either
+            'local' (using 'CONTRACTS_DIR' and 'CONTRACTS_LEGACY_DIR') or
+            's3' (using
+            'CONTRACTS_S3_BUCKET' and 'CONTRACTS_S3_ENDPOINT').
+
+    Returns:
+        object: The LocalStorage or S3Storage.
+
+    Raises:
+        ValueError: If the storage type is unknown.
+    """
+    if config['CONTRACTS_STORAGE'] == 'local':
+        return LocalStorage(
+            config['CONTRACTS_DIR'],
+            legacy_root=config.get('CONTRACTS_LEGACY_DIR'))
+    if config['CONTRACTS_STORAGE'] == 's3':
+        return S3Storage(
+            config['CONTRACTS_S3_BUCKET'],
+            endpoint_url=config['CONTRACTS_S3_ENDPOINT'])
+
+    raise ValueError('Unknown contracts storage: ' +
+                     config['CONTRACTS_STORAGE'])
+
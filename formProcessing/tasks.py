@@ -0,0 +1,375 @@
+""" Celery tasks deploying the contracts, imported only by the workers.
+
+Run them with the 'worker' module, which loads them before forking:
+
+    celery -A worker.celery worker -Q render -P prefork
+"""
+import time
+import redis
+from dateutil import parser as dateparser
+from celery.signals import task_prerun, task_postrun
+from celeryapp import celery
+from utils import validate_event_data
+from artifacts import ArtifactStore
+from clients import ClientPool
+from smartcontract import NodeUnreachable
+from accounts import DeployerPool
+from receipts import ReceiptTracker
+from gasprice import GasPriceOracle
+from jobs import JobStore
+from stamp import deployment_update
+from storage import make_storage
+from metrics import Metrics, RPCCounter, COUNT_BUCKETS
+
+artifact_store = ArtifactStore(celery.conf['CC_ARTIFACTS_DIR'])
+redis_client = redis.StrictRedis.from_url(celery.conf['CELERY_BROKER_URL'])
+metrics = Metrics(celery.conf['CELERY_BROKER_URL'])
+rpc_counter = RPCCounter()
+gas_price_oracle = GasPriceOracle(
+    redis_client, ttl=4 * celery.conf['GAS_PRICE_REFRESH'])
+client_pool = ClientPool(
+    gas_price_strategy=gas_price_oracle.strategy(
+        celery.conf['GAS_PRICE_TIER']),
+    metrics=metrics,
+    rpc_counter=rpc_counter)
+job_store = JobStore(redis_client)
+contract_storage = make_storage(celery.conf)
+
+
+def make_deployer_pool(config):
+    """ Create the pool of deployer accounts configured in the app.
+
+    Args:
+        config (dict): Settings with either 'ETH_DEPLOYER_PKEYS' or
+            'ETH_USER_PKEY' set.
+
+    Returns:
+        DeployerPool: The pool with the configured accounts.
+    """
+    if config['ETH_DEPLOYER_PKEYS']:
+        private_keys = config['ETH_DEPLOYER_PKEYS'].split(',')
+        passphrases = (config['ETH_DEPLOYER_PASSES'].split(',')
+                       if config['ETH_DEPLOYER_PASSES'] else None)
+    else:
+        private_keys = [config['ETH_USER_PKEY']]
+        passphrases = [config['ETH_USER_PASS']]
+
+    return DeployerPool(
+        redis_client,
+        private_keys,
+        passphrases,
+        min_balance=config['ETH_MIN_DEPLOYER_BALANCE'])
+
+
+deployer_pool = make_deployer_pool(celery.conf)
+
+
+task_started = {}  # Task id -> when it started
+
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, **kwargs):
+    task_started[task_id] = time.perf_counter()
+    rpc_counter.take()  # Left by whatever ran before in this thread
+
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    started = task_started.pop(task_id, None)
+    if started is not None:
+        metrics.observe(
+            'celery_task_seconds',
+            time.perf_counter() - started,
+            task=task.name,
+            state=state)
+
+    # RPC requests sent by the task, e.g. by each deployment
+    counts = rpc_counter.take()
+    for method, count in counts.items():
+        metrics.increment(
+            'eth_rpc_requests_total', count, task=task.name, method=method)
+    metrics.observe(
+        'celery_task_rpc_requests',
+        sum(counts.values()),
+        buckets=COUNT_BUCKETS,
+        task=task.name)
+
+
+def contract_artifact_id():
+    """ Get the artifact of the contract deployed for each agreement.
+
+    Returns:
+        str: The artifact identifier of the CreativeContractFactory if the
+            contracts are deployed as clones, or of the CreativeContract
+            otherwise.
+    """
+    # Only compiles when the solidity file changed since the last deployment
+    if celery.conf['CC_FACTORY_ADDRESS']:
+        return artifact_store.compile_file('CreativeContractFactory',
+                                           celery.conf['CC_FACTORY_FILE'])
+
+    return artifact_store.compile_file(celery.conf['CREATIVE_CONTRACT_NAME'],
+                                       celery.conf['CREATIVE_CONTRACT_FILE'])
+
+
+def use_deployment_account(sc, deployer=None):
+    """ Set up one of the deployer accounts to deploy with the given client.
+
+    Args:
+        sc (SmartContract): Client to deploy with.
+        deployer (Deployer): Account to use, if None one is chosen from the
+            pool.
+    """
+    if deployer is None:
+        deployer = deployer_pool.choose(sc.w3)
+
+    if celery.conf['ETH_SIGN_LOCALLY']:
+        sc.load_account(deployer.private_key)
+
+        # Nonces are shared with every worker signing with the same account.
+        # The client is only used by this task until it is given back to the
+        # pool, which unsets its manager
+        sc.nonce_manager = deployer_pool.nonce_manager(sc.w3, deployer.address)
+    else:
+        sc.import_account(deployer.private_key, deployer.passphrase)
+
+
+@celery.task()
+def replace_stuck_transactions():
+    if not celery.conf['ETH_SIGN_LOCALLY']:
+        return  # The node handles the nonces
+
+    with client_pool.client(celery.conf['GETH_NODE_URI'],
+                            celery.conf['GETH_USES_IPC'],
+                            celery.conf['GETH_USES_POA']) as sc:
+        tracker = ReceiptTracker(redis_client, sc.w3)
+
+        for deployer in deployer_pool.deployers:
+            use_deployment_account(sc, deployer)
+            sc.nonce_manager.resync()
+            replaced = sc.nonce_manager.replace_stuck(
+                sc, celery.conf['ETH_TX_STUCK_AFTER'])
+
+            for old_hash, new_hash in replaced:
+                tracker.replace(old_hash, new_hash)
+
+
+@celery.task()
+def refresh_gas_prices():
+    with client_pool.client(celery.conf['GETH_NODE_URI'],
+                            celery.conf['GETH_USES_IPC'],
+                            celery.conf['GETH_USES_POA']) as sc:
+        gas_price_oracle.refresh(sc.w3)
+
+
+@celery.task()
+def track_deployments():
+    with client_pool.client(celery.conf['GETH_NODE_URI'],
+                            celery.conf['GETH_USES_IPC'],
+                            celery.conf['GETH_USES_POA']) as sc:
+        tracker = ReceiptTracker(redis_client, sc.w3)
+
+        # One pass over the new blocks for all the pending deployments. Each
+        # one is forgotten only once handled, if handling it fails it and the
+        # ones after it are returned again by the next poll
+        for tx_hash, details, receipt in tracker.poll():
+            handle_deployment_receipt(sc, details, receipt)
+            tracker.done(tx_hash)
+
+
+def handle_deployment_receipt(sc, details, receipt):
+    """ Update the job of a deployment transaction mined or dropped.
+
+    Args:
+        sc (SmartContract): Client connected to the node.
+        details (dict): The details given to 'ReceiptTracker.track' by
+            'submit_deployment'.
+        receipt (dict): The transaction receipt, None if it was dropped.
+    """
+    if receipt is None:
+        # TODO Use the flask app's logger instead of print to stdout directly
+        print('Deployment transaction dropped by the node: ',
+              details['contract_hash'])
+        job_store.update(
+            details.get('job_id'),
+            deployStatus='failed',
+            deployError='The transaction was dropped by the node')
+        if details.get('job_key'):
+            job_store.forget(details['job_key'])
+        return
+
+    if details.get('factory_artifact_id'):
+        factory_abi = artifact_store.get(
+            details['factory_artifact_id'])['abi']
+        contract_address = sc.clone_address(factory_abi, receipt)
+    else:
+        contract_address = receipt['contractAddress']
+
+    if receipt.get('status') == 0 or not contract_address:
+        # TODO Use the flask app's logger instead of print to stdout directly
+        print("Contract deployment failed, won't generate PDF: ",
+              receipt['transactionHash'].hex())
+        job_store.update(details.get('job_id'), deployStatus='failed')
+        if details.get('job_key'):
+            job_store.forget(details['job_key'])
+        return
+
+    if details.get('submitted_at'):
+        metrics.observe('deployment_confirm_seconds',
+                        time.time() - details['submitted_at'])
+    job_store.update(
+        details.get('job_id'),
+        deployStatus='mined',
+        contractAddress=contract_address,
+        minedAt=time.time())
+    render_deployed_contract.delay(
+        details['contract_hash'],
+        contract_address,
+        job_id=details.get('job_id'),
+        request_id=details.get('request_id'))
+
+
+class DeploymentStage(celery.Task):
+    """ Stage of the deployment pipeline, marking its job failed if it fails.
+
+    Called only once the stage's retries are exhausted, the job is found in
+    the 'job_id' argument or in the deployment passed from stage to stage.
+    The deployment also carries the key indexing the job, which is forgotten
+    so the contract can be submitted again. Stages after the transaction was
+    mined don't get the key, retrying them would deploy it twice.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        job_id = kwargs.get('job_id')
+        job_key = None
+        request_id = kwargs.get('request_id')
+        if job_id is None and args and isinstance(args[0], dict):
+            job_id = args[0].get('job_id')
+            job_key = args[0].get('job_key')
+            request_id = args[0].get('request_id')
+
+        # TODO Use the flask app's logger instead of print to stdout directly
+        print('Deployment stage %s failed: ' % self.name, request_id, job_id,
+              exc)
+        job_store.update(job_id, deployStatus='failed', deployError=str(exc))
+        if job_key:
+            job_store.forget(job_key)
+
+
+# Invalid data stays invalid, so it isn't retried
+@celery.task(base=DeploymentStage)
+def validate_deployment(deployment):
+    event_details = deployment['event_details']
+    errors = validate_event_data(event_details)
+    if errors:
+        raise ValueError(', '.join(errors))
+
+    # Transform dates to unix timestamps
+    due_ts = int(dateparser.parse(event_details['dueDate']).timestamp())
+    settlement_ts = int(
+        dateparser.parse(event_details['settlementDate']).timestamp())
+    delivery_ts = int(
+        dateparser.parse(event_details['dateOfDelivery']).timestamp())
+
+    deployment['contract_data'] = {
+        'customer_address': event_details['customerAddress'],
+        'oracle_address': event_details['oracleAddress'],
+        'contract_amount': int(event_details['amount']),
+        'oracle_fee': int(event_details['oracleFee']),
+        'lcurl': deployment['contract_url'],
+        'lchash': deployment['contract_hash'],
+        'contract_duedate_ts': due_ts,
+        'contract_settlement_ts': settlement_ts,
+        'contract_delivery_ts': delivery_ts
+    }
+
+    return deployment
+
+
+# A broken solidity file doesn't fix itself either
+@celery.task(base=DeploymentStage)
+def compile_contract(deployment):
+    deployment['artifact_id'] = contract_artifact_id()
+    return deployment
+
+
+# Only retried when the connection to the node couldn't be established. Once
+# connected the node may have accepted the transaction even if the connection
+# is lost before its answer, and sending it again would deploy it twice
+@celery.task(
+    base=DeploymentStage,
+    autoretry_for=(NodeUnreachable, ConnectionRefusedError),
+    retry_backoff=True,
+    max_retries=celery.conf['SUBMIT_MAX_RETRIES'],
+    rate_limit=celery.conf['SUBMIT_RATE_LIMIT'])
+def submit_deployment(deployment):
+    artifact_id = deployment['artifact_id']
+    details = {
+        'contract_hash': deployment['contract_hash'],
+        'event_details': deployment['event_details'],
+        'job_id': deployment['job_id'],
+        'job_key': deployment.get('job_key'),
+        'request_id': deployment['request_id'],
+        'submitted_at': time.time()
+    }
+
+    # Reuses the connection, caches and unlocked accounts of previous tasks
+    with client_pool.client(celery.conf['GETH_NODE_URI'],
+                            celery.conf['GETH_USES_IPC'],
+                            celery.conf['GETH_USES_POA']) as sc:
+        use_deployment_account(sc)  # Spreads the work among the deployers
+        sc.set_contract_data(**deployment['contract_data'])
+        # The transaction can't be mined before the next block, it is looked
+        # for from there even if it is mined before being tracked
+        sent_block = sc.w3.eth.blockNumber
+
+        if celery.conf['CC_FACTORY_ADDRESS']:
+            tx_hash = sc.deploy_clone(
+                artifact_store.get(artifact_id)['abi'],
+                celery.conf['CC_FACTORY_ADDRESS'])
+            details['factory_artifact_id'] = artifact_id
+        else:
+            tx_hash = sc.deploy_artifact(artifact_store, artifact_id)
+
+        # The deployed PDF is generated by 'track_deployments' once mined
+        ReceiptTracker(redis_client, sc.w3).track(tx_hash, details,
+                                                  sent_block)
+
+    job_store.update(
+        deployment['job_id'],
+        deployStatus='submitted',
+        txHash=tx_hash.hex(),
+        submittedAt=details['submitted_at'])
+    # TODO Use the flask app's logger instead of print to stdout directly
+    print('Contract submitted: ', deployment['request_id'], tx_hash.hex())
+
+    return tx_hash.hex()
+
+
+# Storage errors (e.g. a S3 timeout) are usually transient
+@celery.task(
+    base=DeploymentStage,
+    autoretry_for=(OSError, ),
+    retry_backoff=True,
+    max_retries=celery.conf['RENDER_DEPLOYED_MAX_RETRIES'],
+    rate_limit=celery.conf['RENDER_DEPLOYED_RATE_LIMIT'])
+def render_deployed_contract(contract_hash,
+                             contract_address,
+                             job_id=None,
+                             request_id=None):
+    # The original PDF stays a prefix of the deployed one, so it can still be
+    # verified against the hash stored in the blockchain
+    contract_in_pdf = contract_storage.read(contract_hash)
+    update = deployment_update(contract_in_pdf, contract_address,
+                               contract_hash)
+
+    # TODO Should the 'contract_address' be part of the file name?
+    with contract_storage.writer(contract_hash + '_deployed') as f:
+        f.write(contract_in_pdf)
+        f.write(update)
+    job_store.update(job_id, deployStatus='deployed', deployedAt=time.time())
+    print('\n\n======= GENERATED PDF =======')
+    print('Request ==> ', request_id)
+    print('Address ==> ', contract_address)
+    print('File    ==> ', contract_storage.key(f.name))
+    print('=================================')
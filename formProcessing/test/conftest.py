@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app's modules are imported as the web app and the workers do, from the
+# formProcessing folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
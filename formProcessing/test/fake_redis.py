@@ -0,0 +1,345 @@
+""" In-memory stand-in for the redis.StrictRedis client (redis-py 2.10).
+
+Implements the commands used by the app, with the same argument order and
+return types (bytes). Lua scripts run in a real Lua interpreter through
+'lupa', holding the client's lock so they are atomic as in Redis.
+"""
+import fnmatch
+import threading
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        value = int(value) if value.is_integer() else repr(value)
+    return str(value).encode('utf-8')
+
+
+def _score(score):
+    score = float(score)
+    return int(score) if score.is_integer() else score
+
+
+class FakeRedis:
+    """ A Redis database living in this process. """
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.lock_ = threading.RLock()
+        self._lua = None
+
+    def __getattribute__(self, name):
+        attr = object.__getattribute__(self, name)
+        if name.startswith('_') or not callable(attr) or name in (
+                'pipeline', 'register_script', 'lock'):
+            return attr
+
+        lock = object.__getattribute__(self, 'lock_')
+
+        def locked(*args, **kwargs):
+            with lock:
+                return attr(*args, **kwargs)
+
+        return locked
+
+    # Strings
+
+    def get(self, name):
+        return self.data.get(_bytes(name))
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        name = _bytes(name)
+        if nx and name in self.data or xx and name not in self.data:
+            return None
+        self.data[name] = _bytes(value)
+        if ex is not None:
+            self.ttls[name] = ex
+        return True
+
+    def setex(self, name, time, value):
+        return self.set(name, value, ex=time)
+
+    def incr(self, name, amount=1):
+        value = int(self.data.get(_bytes(name), 0)) + amount
+        self.data[_bytes(name)] = _bytes(value)
+        return value
+
+    def delete(self, *names):
+        deleted = 0
+        for name in names:
+            deleted += self.data.pop(_bytes(name), None) is not None
+            self.ttls.pop(_bytes(name), None)
+        return deleted
+
+    def exists(self, name):
+        return _bytes(name) in self.data
+
+    def expire(self, name, time):
+        if _bytes(name) not in self.data:
+            return False
+        self.ttls[_bytes(name)] = time
+        return True
+
+    def keys(self, pattern='*'):
+        return [
+            name for name in self.data
+            if fnmatch.fnmatchcase(name.decode('utf-8'), pattern)
+        ]
+
+    # Hashes
+
+    def _hash(self, name):
+        return self.data.setdefault(_bytes(name), {})
+
+    def _cleanup(self, name):
+        if not self.data.get(_bytes(name), True):
+            self.delete(name)
+
+    def hget(self, name, key):
+        return self.data.get(_bytes(name), {}).get(_bytes(key))
+
+    def hset(self, name, key, value):
+        created = _bytes(key) not in self._hash(name)
+        self._hash(name)[_bytes(key)] = _bytes(value)
+        return int(created)
+
+    def hsetnx(self, name, key, value):
+        if _bytes(key) in self._hash(name):
+            return 0
+        return self.hset(name, key, value)
+
+    def hmset(self, name, mapping):
+        for key, value in mapping.items():
+            self.hset(name, key, value)
+        return True
+
+    def hdel(self, name, *keys):
+        deleted = sum(
+            self._hash(name).pop(_bytes(key), None) is not None
+            for key in keys)
+        self._cleanup(name)
+        return deleted
+
+    def hkeys(self, name):
+        return list(self.data.get(_bytes(name), {}))
+
+    def hgetall(self, name):
+        return dict(self.data.get(_bytes(name), {}))
+
+    def hlen(self, name):
+        return len(self.data.get(_bytes(name), {}))
+
+    def hincrby(self, name, key, amount=1):
+        value = int(self.hget(name, key) or 0) + amount
+        self.hset(name, key, value)
+        return value
+
+    def hincrbyfloat(self, name, key, amount=1.0):
+        value = float(self.hget(name, key) or 0) + amount
+        self.hset(name, key, repr(value))
+        return value
+
+    # Sets
+
+    def sadd(self, name, *values):
+        members = self.data.setdefault(_bytes(name), set())
+        added = {_bytes(v) for v in values} - members
+        members.update(added)
+        return len(added)
+
+    def srem(self, name, *values):
+        members = self.data.get(_bytes(name), set())
+        removed = {_bytes(v) for v in values} & members
+        members.difference_update(removed)
+        self._cleanup(name)
+        return len(removed)
+
+    def smembers(self, name):
+        return set(self.data.get(_bytes(name), set()))
+
+    # Sorted sets, scores and members in redis-py 2.10 order
+
+    def zadd(self, name, *args):
+        members = self.data.setdefault(_bytes(name), {})
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += _bytes(member) not in members
+            members[_bytes(member)] = _score(score)
+        return added
+
+    def zrem(self, name, *values):
+        members = self.data.get(_bytes(name), {})
+        removed = sum(
+            members.pop(_bytes(v), None) is not None for v in values)
+        self._cleanup(name)
+        return removed
+
+    def zcard(self, name):
+        return len(self.data.get(_bytes(name), {}))
+
+    def zscore(self, name, value):
+        return self.data.get(_bytes(name), {}).get(_bytes(value))
+
+    def zrange(self, name, start, end, desc=False, withscores=False):
+        members = sorted(
+            self.data.get(_bytes(name), {}).items(),
+            key=lambda item: (item[1], item[0]),
+            reverse=desc)
+        end = len(members) if int(end) == -1 else int(end) + 1
+        members = members[int(start):end]
+        if withscores:
+            return [(member, float(score)) for member, score in members]
+        return [member for member, _ in members]
+
+    def zrangebyscore(self, name, min, max, withscores=False):
+        return [
+            item for item in self.zrange(name, 0, -1, withscores=withscores)
+            if float(min) <= float(self.zscore(
+                name, item[0] if withscores else item)) <= float(max)
+        ]
+
+    # Lists
+
+    def llen(self, name):
+        return len(self.data.get(_bytes(name), []))
+
+    # Transactions, locks and scripts
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def lock(self, name, timeout=None):
+        return FakeLock(self.data, _bytes(name))
+
+    def register_script(self, script):
+        return FakeScript(self, script)
+
+
+class FakeLock:
+    """ A lock stored as a key, as redis.lock.Lock. """
+
+    _mutex = threading.Lock()
+
+    def __init__(self, data, name):
+        self._data = data
+        self._name = name
+
+    def acquire(self, blocking=True):
+        while True:
+            with self._mutex:
+                if self._name not in self._data:
+                    self._data[self._name] = b'locked'
+                    return True
+            if not blocking:
+                return False
+
+    def release(self):
+        with self._mutex:
+            del self._data[self._name]
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class FakePipeline:
+    """ Buffers the commands and runs them all at once on 'execute'. """
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return command
+
+    def execute(self):
+        with self._client.lock_:
+            results = [
+                getattr(self._client, name)(*args, **kwargs)
+                for name, args, kwargs in self._commands
+            ]
+        self._commands = []
+        return results
+
+
+class FakeScript:
+    """ A Lua script run atomically against a FakeRedis. """
+
+    # Redis command name to the client's method and how to convert the
+    # results for Lua
+    COMMANDS = {
+        'GET': 'get',
+        'SET': 'set',
+        'INCR': 'incr',
+        'DEL': 'delete',
+        'HGET': 'hget',
+        'HSET': 'hset',
+        'HDEL': 'hdel',
+        'HKEYS': 'hkeys',
+        'ZADD': 'zadd',
+        'ZREM': 'zrem',
+        'ZRANGE': 'zrange',
+        'SADD': 'sadd',
+        'SREM': 'srem',
+    }
+
+    def __init__(self, client, script):
+        import lupa
+
+        self._client = client
+        self._lua = lupa.LuaRuntime(encoding=None)
+        redis = self._lua.table()
+        redis[b'call'] = self._call
+        self._lua.globals()[b'redis'] = redis
+        self._function = self._lua.eval('function() ' + script + ' end')
+
+    def _call(self, command, *args):
+        command = command.decode('utf-8').upper()
+        args = [_bytes(a) for a in args]
+        withscores = bool(args) and args[-1].upper() == b'WITHSCORES'
+        if withscores:
+            args = args[:-1]
+
+        method = getattr(self._client, self.COMMANDS[command])
+        if withscores:
+            result = method(*args, withscores=True)
+        else:
+            result = method(*args)
+        if command == 'ZRANGE' and withscores:
+            # Flattened, with the scores as strings
+            result = [
+                value for member, score in result
+                for value in (member, _bytes(_score(score)))
+            ]
+        if isinstance(result, list):
+            return self._lua.table(*result)
+        if result is None:
+            return False
+        if result is True:
+            return b'OK'
+        return result
+
+    def _result(self, value):
+        if value is None or value is False:
+            return None
+        if isinstance(value, float):
+            return int(value)
+        if isinstance(value, (int, bytes)):
+            return value
+        return [self._result(v) for v in value.values()]
+
+    def __call__(self, keys=(), args=(), client=None):
+        with self._client.lock_:
+            lua_globals = self._lua.globals()
+            lua_globals[b'KEYS'] = self._lua.table(*[_bytes(k) for k in keys])
+            lua_globals[b'ARGV'] = self._lua.table(*[_bytes(a) for a in args])
+            return self._result(self._function())
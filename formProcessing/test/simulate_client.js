@@ -19,6 +19,7 @@ function create_pdf(item){
         body: JSON.stringify(item)
     })
         .then(res=>res.json())
+        .then(res => wait_for_pdf(res.statusUrl))
         .then(res => {
             item.legalContractUrl= res.legalContractUrl;
             item.legalContractHash = res.legalContractHash;
@@ -27,6 +28,21 @@ function create_pdf(item){
         .catch((err)=>{console.log(err)});
 }
 
+// Poll the job's status until its PDF is rendered
+function wait_for_pdf(status_url){
+    return fetch(status_url)
+        .then(res=>res.json())
+        .then(res => {
+            if (res.renderStatus === 'failed') {
+                throw new Error('Contract rendering failed');
+            }
+            if (res.renderStatus !== 'done') {
+                return new Promise(resolve => setTimeout(resolve, 1000))
+                    .then(() => wait_for_pdf(status_url));
+            }
+            return res;});
+}
+
 // main part of the script
 const item = require('./test_data.json');
 create_pdf(item);
@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('solc')
+
+from artifacts import ArtifactStore  # noqa: E402
+
+
+def write(tmpdir, name, source):
+    path = tmpdir.join(name)
+    path.write(source)
+    return str(path)
+
+
+def test_inlines_relative_imports_once(tmpdir):
+    write(tmpdir, 'Base.sol', 'contract Base {}\n')
+    write(tmpdir, 'Other.sol', 'import "./Base.sol";\ncontract Other {}\n')
+    main = write(tmpdir, 'Main.sol',
+                 'import "./Base.sol";\nimport "./Other.sol";\n'
+                 'contract Main is Base, Other {}\n')
+
+    store = ArtifactStore(str(tmpdir.mkdir('artifacts')))
+    source_code, paths = store.read_source(main)
+
+    assert 'import' not in source_code
+    assert source_code.count('contract Base {}') == 1
+    assert (source_code.index('contract Base') <
+            source_code.index('contract Other') <
+            source_code.index('contract Main'))
+    assert [p.rsplit('/', 1)[1] for p in paths] == [
+        'Main.sol', 'Base.sol', 'Other.sol']
+
+
+def test_compiles_again_when_an_import_changes(tmpdir, monkeypatch):
+    base = write(tmpdir, 'Base.sol', 'contract Base {}\n')
+    main = write(tmpdir, 'Main.sol',
+                 'import "./Base.sol";\ncontract Main is Base {}\n')
+
+    store = ArtifactStore(str(tmpdir.mkdir('artifacts')))
+    compiled = []
+    monkeypatch.setattr(store, 'compile',
+                        lambda name, source: compiled.append(source) or name)
+
+    store.compile_file('Main', main)
+    store.compile_file('Main', main)
+    assert len(compiled) == 1
+
+    with open(base, 'a') as f:
+        f.write('contract Unused {}\n')
+    store.compile_file('Main', main)
+    assert len(compiled) == 2
+    assert 'contract Unused' in compiled[1]
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip('web3')
+pytest.importorskip('solc')
+
+import clients  # noqa: E402
+from clients import ClientPool  # noqa: E402
+
+NODE_URI = 'http://localhost:8545'
+
+
+class FakeSmartContract:
+
+    def __init__(self, node_uri, use_ipc, use_poa, **kwargs):
+        self.node_uri = node_uri
+        self.contract_data = None
+        self.nonce_manager = None
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self):
+        return self.connected
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(clients, 'SmartContract', FakeSmartContract)
+    return ClientPool(check_interval=0)
+
+
+def test_clients_are_reused_once_given_back(pool):
+    with pool.client(NODE_URI) as sc:
+        sc.contract_data = {'amount': 1}
+        sc.nonce_manager = object()
+
+    with pool.client(NODE_URI) as again:
+        assert again is sc
+        assert again.contract_data is None
+        assert again.nonce_manager is None
+
+
+def test_clients_are_used_by_one_task_at_a_time(pool):
+    with pool.client(NODE_URI) as first:
+        with pool.client(NODE_URI) as second:
+            assert first is not second
+
+    with pool.client(NODE_URI) as sc, pool.client(NODE_URI) as other:
+        assert {sc, other} == {first, second}
+
+
+def test_disconnected_clients_are_replaced(pool):
+    with pool.client(NODE_URI) as sc:
+        sc.connected = False
+
+    with pool.client(NODE_URI) as new:
+        assert new is not sc
+    assert sc.closed
+
+    pool.close()
+    assert new.closed
@@ -0,0 +1,29 @@
+import importlib
+import pytest
+import config
+
+
+@pytest.fixture
+def reload_config(monkeypatch):
+
+    def reload(**environ):
+        for name, value in environ.items():
+            monkeypatch.setenv(name, value)
+        return importlib.reload(config)
+
+    yield reload
+    monkeypatch.undo()
+    importlib.reload(config)
+
+
+@pytest.mark.parametrize('value, enabled', [('1', True), ('true', True),
+                                            ('True', True), ('yes', True),
+                                            ('0', False), ('false', False),
+                                            ('', False), ('no', False)])
+def test_flags_are_parsed_strictly(reload_config, value, enabled):
+    settings = reload_config(CONTRACTS_COMPACT=value, USE_X_SENDFILE=value,
+                             ETH_SIGN_LOCALLY=value)
+
+    assert settings.CONTRACTS_COMPACT is enabled
+    assert settings.USE_X_SENDFILE is enabled
+    assert settings.ETH_SIGN_LOCALLY is enabled
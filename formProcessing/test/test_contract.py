@@ -0,0 +1,184 @@
+""" Funds and settles a CreativeContract on an in-process chain.
+
+Needs the benchmarks' requirements (web3[tester]) and solc 0.4.24 or newer
+(0.4.x) in the PATH.
+"""
+import os
+import shutil
+import pytest
+
+pytest.importorskip('eth_tester')
+pytest.importorskip('solc')
+if shutil.which('solc') is None:
+    pytest.skip('solc is needed to compile the contracts',
+                allow_module_level=True)
+
+from eth_tester.exceptions import TransactionFailed  # noqa: E402
+from web3 import EthereumTesterProvider  # noqa: E402
+from artifacts import ArtifactStore  # noqa: E402
+from smartcontract import SmartContract  # noqa: E402
+
+CONTRACTS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'contracts')
+
+AMOUNT = 1000
+ORACLE_FEE = 100
+
+
+@pytest.fixture(scope='module')
+def chain(tmpdir_factory):
+    store = ArtifactStore(str(tmpdir_factory.mktemp('artifacts')))
+    contract_file = os.path.join(CONTRACTS_DIR, 'CreativeContract.sol')
+    artifact_id = store.compile_file('CreativeContract', contract_file)
+
+    sc = SmartContract(None, provider=EthereumTesterProvider())
+    sc.w3.eth.setGasPriceStrategy(None)
+    business, customer, oracle, other = sc.w3.eth.accounts[:4]
+    sc.set_deployment_account(business)
+
+    return {
+        'sc': sc,
+        'store': store,
+        'artifact_id': artifact_id,
+        'business': business,
+        'customer': customer,
+        'oracle': oracle,
+        'other': other
+    }
+
+
+@pytest.fixture
+def contract(chain):
+    """ A new contract due in 100 seconds and delivered in 300. """
+    sc = chain['sc']
+    now = sc.w3.eth.getBlock('pending')['timestamp']
+    sc.set_contract_data(
+        customer_address=chain['customer'],
+        oracle_address=chain['oracle'],
+        contract_amount=AMOUNT,
+        oracle_fee=ORACLE_FEE,
+        lcurl='http://www.creativecontract.org',
+        lchash='B221D9DBB083A7F33428D7C2A3C3198AE925614D70210E28716CCAA7CD4DDB79',
+        contract_duedate_ts=now + 100,
+        contract_settlement_ts=now + 200,
+        contract_delivery_ts=now + 300)
+
+    receipt = sc.w3.eth.waitForTransactionReceipt(
+        sc.deploy_artifact(chain['store'], chain['artifact_id']))
+    deployed = sc.w3.eth.contract(
+        address=receipt.contractAddress,
+        abi=chain['store'].get(chain['artifact_id'])['abi'])
+    deployed.delivered_at = now + 300
+
+    return deployed
+
+
+def fund(chain, contract, value, sender='customer'):
+    tx_hash = contract.functions.fund().transact(
+        {'from': chain[sender], 'value': value})
+    return chain['sc'].w3.eth.waitForTransactionReceipt(tx_hash)
+
+
+def settle(chain, contract, sender):
+    tx_hash = contract.functions.settle().transact({'from': chain[sender]})
+    return chain['sc'].w3.eth.waitForTransactionReceipt(tx_hash)
+
+
+def deliver(chain, contract):
+    chain['sc'].w3.testing.timeTravel(contract.delivered_at + 1)
+
+
+def test_fund_logs_the_payment(chain, contract):
+    receipt = fund(chain, contract, ORACLE_FEE)
+    funded = contract.events.Funded().processReceipt(receipt)[0]['args']
+
+    assert funded['from'] == chain['customer']
+    assert funded['value'] == ORACLE_FEE
+    assert funded['balance'] == ORACLE_FEE
+    assert contract.functions.debt().call() == AMOUNT - ORACLE_FEE
+
+
+def test_fund_counts_the_payment_once(chain, contract):
+    fund(chain, contract, AMOUNT - ORACLE_FEE)
+    receipt = fund(chain, contract, ORACLE_FEE)
+    funded = contract.events.Funded().processReceipt(receipt)[0]['args']
+
+    assert funded['balance'] == AMOUNT
+    assert contract.functions.debt().call() == 0
+
+
+def test_first_payment_covers_the_oracle_fee(chain, contract):
+    with pytest.raises(TransactionFailed):
+        fund(chain, contract, ORACLE_FEE - 1)
+
+
+def test_cant_overpay(chain, contract):
+    with pytest.raises(TransactionFailed):
+        fund(chain, contract, AMOUNT + 1)
+
+    fund(chain, contract, AMOUNT - ORACLE_FEE)
+    with pytest.raises(TransactionFailed):
+        fund(chain, contract, ORACLE_FEE + 1)
+
+
+def test_cant_fund_once_fully_paid(chain, contract):
+    fund(chain, contract, AMOUNT)
+
+    with pytest.raises(TransactionFailed):
+        fund(chain, contract, 1)
+
+
+def test_oracle_settles_after_the_business(chain, contract):
+    w3 = chain['sc'].w3
+    fund(chain, contract, AMOUNT)
+    deliver(chain, contract)
+
+    receipt = settle(chain, contract, 'business')
+    assert contract.events.SettleIntent().processReceipt(receipt)
+
+    oracle_balance = w3.eth.getBalance(chain['oracle'])
+    business_balance = w3.eth.getBalance(chain['business'])
+    receipt = settle(chain, contract, 'oracle')
+    settled = contract.events.Settled().processReceipt(receipt)[0]['args']
+    oracle_gas = receipt.gasUsed * w3.eth.getTransaction(
+        receipt.transactionHash).gasPrice
+
+    assert settled['oracleFee'] == ORACLE_FEE
+    assert settled['balance'] == AMOUNT
+    assert w3.eth.getBalance(contract.address) == 0
+    assert w3.eth.getCode(contract.address) == b''
+    assert (w3.eth.getBalance(chain['oracle']) ==
+            oracle_balance + ORACLE_FEE - oracle_gas)
+    assert (w3.eth.getBalance(chain['business']) ==
+            business_balance + AMOUNT - ORACLE_FEE)
+
+
+@pytest.mark.parametrize('sender', ['customer', 'other'])
+def test_only_the_business_and_oracle_settle(chain, contract, sender):
+    fund(chain, contract, AMOUNT)
+    deliver(chain, contract)
+
+    with pytest.raises(TransactionFailed):
+        settle(chain, contract, sender)
+
+
+def test_oracle_cant_settle_without_the_business(chain, contract):
+    fund(chain, contract, AMOUNT)
+    deliver(chain, contract)
+
+    with pytest.raises(TransactionFailed):
+        settle(chain, contract, 'oracle')
+
+
+def test_cant_settle_before_the_delivery_date(chain, contract):
+    fund(chain, contract, AMOUNT)
+
+    with pytest.raises(TransactionFailed):
+        settle(chain, contract, 'business')
+
+
+def test_cant_settle_without_the_oracle_fee(chain, contract):
+    deliver(chain, contract)
+
+    with pytest.raises(TransactionFailed):
+        settle(chain, contract, 'business')
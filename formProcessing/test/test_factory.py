@@ -0,0 +1,101 @@
+""" Deploys the CreativeContractFactory and its clones on an in-process chain.
+
+Needs the benchmarks' requirements (web3[tester]) and solc 0.4.24 or newer
+(0.4.x) in the PATH.
+"""
+import os
+import shutil
+import pytest
+
+pytest.importorskip('eth_tester')
+pytest.importorskip('solc')
+if shutil.which('solc') is None:
+    pytest.skip('solc is needed to compile the contracts',
+                allow_module_level=True)
+
+from eth_tester.exceptions import TransactionFailed  # noqa: E402
+from web3 import EthereumTesterProvider, Web3  # noqa: E402
+from artifacts import ArtifactStore  # noqa: E402
+from smartcontract import SmartContract  # noqa: E402
+
+CONTRACTS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'contracts')
+
+CONTRACT_DATA = {
+    'customer_address': '0x14723a09acff6d2a60dcdf7aa4aff308fddc160c',
+    'oracle_address': '0x4b0897b0513fdc7c541b6d9d7e929c4e5364d2db',
+    'contract_amount': 10,
+    'oracle_fee': 1,
+    'lcurl': 'http://www.creativecontract.org',
+    'lchash': 'B221D9DBB083A7F33428D7C2A3C3198AE925614D70210E28716CCAA7CD4DDB79',
+    'contract_duedate_ts': 1544779800,
+    'contract_settlement_ts': 1545384600,
+    'contract_delivery_ts': 1546384600
+}
+
+
+@pytest.fixture(scope='module')
+def chain(tmpdir_factory):
+    store = ArtifactStore(str(tmpdir_factory.mktemp('artifacts')))
+    factory_file = os.path.join(CONTRACTS_DIR, 'CreativeContractFactory.sol')
+    template_id = store.compile_file('CreativeContractTemplate', factory_file)
+    factory_id = store.compile_file('CreativeContractFactory', factory_file)
+
+    sc = SmartContract(None, provider=EthereumTesterProvider())
+    sc.w3.eth.setGasPriceStrategy(None)
+    sc.set_deployment_account(sc.w3.eth.accounts[0])
+    sc.set_contract_data(**CONTRACT_DATA)
+    factory_address = sc.deploy_factory(store, template_id, factory_id)
+
+    factory_abi = store.get(factory_id)['abi']
+    factory = sc.w3.eth.contract(address=factory_address, abi=factory_abi)
+
+    return {
+        'sc': sc,
+        'factory_address': factory_address,
+        'factory_abi': factory_abi,
+        'template_abi': store.get(template_id)['abi'],
+        'implementation': factory.functions.implementation().call()
+    }
+
+
+def deploy_clone(chain):
+    sc = chain['sc']
+    receipt = sc.w3.eth.waitForTransactionReceipt(
+        sc.deploy_clone(chain['factory_abi'], chain['factory_address']))
+    return sc.w3.eth.contract(
+        address=sc.clone_address(chain['factory_abi'], receipt),
+        abi=chain['template_abi'])
+
+
+def initialize(contract, sender):
+    return contract.functions.initialize(
+        [sender,
+         Web3.toChecksumAddress(CONTRACT_DATA['customer_address']),
+         Web3.toChecksumAddress(CONTRACT_DATA['oracle_address'])],
+        [1, 0, 0, 0, 0], 'url',
+        b'\x00' * 32).transact({'from': sender})
+
+
+def test_clone_is_initialized_by_the_factory(chain):
+    clone = deploy_clone(chain)
+
+    assert clone.address != chain['implementation']
+    assert clone.functions.debt().call() == CONTRACT_DATA['contract_amount']
+
+
+def test_clone_cant_be_initialized_twice(chain):
+    clone = deploy_clone(chain)
+    attacker = chain['sc'].w3.eth.accounts[1]
+
+    with pytest.raises(TransactionFailed):
+        initialize(clone, attacker)
+
+
+def test_implementation_cant_be_initialized(chain):
+    sc = chain['sc']
+    implementation = sc.w3.eth.contract(
+        address=chain['implementation'], abi=chain['template_abi'])
+
+    with pytest.raises(TransactionFailed):
+        initialize(implementation, sc.w3.eth.accounts[1])
@@ -0,0 +1,211 @@
+import pytest
+from indexer import ContractIndex, Indexer, CONTRACT_CREATED_ABI
+
+pytest.importorskip('eth_utils')
+pytest.importorskip('web3')
+
+from eth_abi import encode_abi  # noqa: E402
+from eth_utils import event_abi_to_log_topic  # noqa: E402
+from web3 import Web3  # noqa: E402
+
+ADDRESS = Web3.toChecksumAddress('0x' + 'ab' * 20)
+FACTORY = Web3.toChecksumAddress('0x' + 'fa' * 20)
+DEPLOYER = Web3.toChecksumAddress('0x' + 'de' * 20)
+BUSINESS = Web3.toChecksumAddress('0x' + '01' * 20)
+
+
+def event_abi(name, *types):
+    return {
+        'anonymous': False,
+        'inputs': [{
+            'indexed': False,
+            'name': name,
+            'type': type_
+        } for name, type_ in types],
+        'name': name,
+        'type': 'event'
+    }
+
+
+CREATED_ABI = event_abi('Created', ('business', 'address'),
+                        ('customer', 'address'), ('oracle', 'address'),
+                        ('terms', 'uint256[5]'),
+                        ('legalContractUrl', 'string'),
+                        ('legalContractHash', 'bytes32'))
+FUNDED_ABI = event_abi('Funded', ('from', 'address'), ('value', 'uint256'),
+                       ('balance', 'uint256'))
+ABI = [CREATED_ABI, FUNDED_ABI]
+
+
+class FakeEth:
+    """ A chain whose blocks are only hashes and a list of logs. """
+
+    def __init__(self, blocks):
+        self.hashes = [bytes([number]) * 32 for number in range(blocks)]
+        self.filters = []
+        self.logs = []
+        self.receipts = {}
+
+    @property
+    def blockNumber(self):
+        return len(self.hashes) - 1
+
+    def getBlock(self, number):
+        if number >= len(self.hashes):
+            return None
+        return {'hash': self.hashes[number]}
+
+    def getLogs(self, log_filter):
+        self.filters.append(log_filter)
+        addresses = log_filter.get('address')
+        topics = log_filter['topics'][0]
+        topics = topics if isinstance(topics, list) else [topics]
+        return [
+            log for log in self.logs
+            if log_filter['fromBlock'] <= log['blockNumber'] <=
+            log_filter['toBlock'] and Web3.toHex(log['topics'][0]) in topics
+            and (addresses is None or log['address'] in addresses)
+        ]
+
+    def getTransactionReceipt(self, tx_hash):
+        return self.receipts[tx_hash]
+
+    def mine(self, *logs):
+        number = len(self.hashes)
+        self.hashes.append(bytes([number]) * 32)
+        for log_index, (address, abi, values) in enumerate(logs):
+            types = [arg['type'] for arg in abi['inputs']]
+            self.logs.append({
+                'address': address,
+                'topics': [event_abi_to_log_topic(abi)],
+                'data': Web3.toHex(encode_abi(types, values)),
+                'blockNumber': number,
+                'blockHash': self.hashes[number],
+                'logIndex': log_index,
+                'transactionIndex': 0,
+                'transactionHash': bytes([number]) * 32
+            })
+        return bytes([number]) * 32
+
+    def fork(self, number):
+        for n in range(number, len(self.hashes)):
+            self.hashes[n] = bytes([n, 0xff]) * 16
+
+
+class FakeWeb3:
+
+    def __init__(self, blocks):
+        self.eth = FakeEth(blocks)
+
+
+def created(block_number):
+    return {
+        'address': ADDRESS,
+        'event': 'Created',
+        'blockNumber': block_number,
+        'logIndex': 0,
+        'transactionHash': b'\x01' * 32,
+        'args': {
+            'business': BUSINESS,
+            'customer': '0x' + '02' * 20,
+            'oracle': '0x' + '03' * 20,
+            'terms': [10, 1, 3, 2, 4],
+            'legalContractUrl': 'url',
+            'legalContractHash': b'\x00' * 32
+        }
+    }
+
+
+def created_log(address):
+    return (address, CREATED_ABI, [
+        BUSINESS, '0x' + '02' * 20, '0x' + '03' * 20, [10, 1, 3, 2, 4], 'url',
+        b'\x00' * 32
+    ])
+
+
+@pytest.fixture
+def index(tmpdir):
+    return ContractIndex(str(tmpdir.join('contracts.sqlite')))
+
+
+def test_reorgs_are_indexed_again_from_the_last_valid_block(index):
+    w3 = FakeWeb3(11)
+    indexer = Indexer(index, w3, [], deployers=[DEPLOYER])
+    indexer.poll()
+
+    # Recorded blocks are 2, 5 (with an event) and 10
+    with index.connect() as db:
+        for number in (2, 5):
+            index.add_block(db, number, '0x' + w3.eth.hashes[number].hex())
+        index.add_event(db, created(5), ours=True)
+
+    # Blocks 3 and 4 changed too, even if they weren't recorded
+    w3.eth.fork(3)
+    indexer.poll()
+
+    assert w3.eth.filters[-1]['fromBlock'] == 3
+    assert index.get(ADDRESS) is None
+    with index.connect() as db:
+        assert index.last_block(db) == 10
+
+
+def test_reorgs_older_than_the_recorded_blocks(index):
+    w3 = FakeWeb3(11)
+    indexer = Indexer(index, w3, [], start_block=1, deployers=[DEPLOYER])
+    indexer.poll()
+
+    w3.eth.fork(0)
+    indexer.poll()
+
+    assert w3.eth.filters[-1]['fromBlock'] == 1
+
+
+def test_indexes_contracts_created_by_our_factory(index):
+    w3 = FakeWeb3(1)
+    indexer = Indexer(index, w3, ABI, factories=[FACTORY])
+    fake = Web3.toChecksumAddress('0x' + 'ee' * 20)
+    w3.eth.mine(
+        created_log(ADDRESS),
+        (FACTORY, CONTRACT_CREATED_ABI, [ADDRESS, BUSINESS]))
+    w3.eth.mine(created_log(fake))
+    w3.eth.mine((ADDRESS, FUNDED_ABI, [BUSINESS, 5, 5]),
+                (fake, FUNDED_ABI, [BUSINESS, 5, 5]))
+
+    indexer.poll()
+
+    assert index.get(ADDRESS)['balance'] == 5
+    assert index.get(fake) is None
+
+
+def test_indexes_contracts_deployed_by_our_accounts(index):
+    w3 = FakeWeb3(1)
+    indexer = Indexer(index, w3, ABI, deployers=[DEPLOYER])
+    fake = Web3.toChecksumAddress('0x' + 'ee' * 20)
+    w3.eth.receipts[w3.eth.mine(created_log(ADDRESS))] = {
+        'from': DEPLOYER,
+        'contractAddress': ADDRESS
+    }
+    w3.eth.receipts[w3.eth.mine(created_log(fake))] = {
+        'from': BUSINESS,
+        'contractAddress': fake
+    }
+
+    indexer.poll()
+
+    assert index.get(ADDRESS) is not None
+    assert index.get(fake) is None
+
+
+def test_needs_the_factories_or_the_deployers(index):
+    with pytest.raises(ValueError):
+        Indexer(index, FakeWeb3(1), ABI)
+
+
+def test_finds_contracts_by_any_case_address(index):
+    with index.connect() as db:
+        index.add_event(db, created(1), ours=True)
+
+    assert index.get(ADDRESS.lower())['business'] == BUSINESS
+    assert index.get(ADDRESS.upper().replace('0X', '0x')) is not None
+    with pytest.raises(ValueError):
+        index.get('0x1234')
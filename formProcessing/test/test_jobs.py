@@ -0,0 +1,61 @@
+from fake_redis import FakeRedis
+from jobs import JobStore
+
+
+def test_update_and_get():
+    store = JobStore(FakeRedis())
+    job_id = store.create(renderStatus='queued')
+
+    store.update(job_id, renderStatus='done', legalContractHash='ab')
+
+    assert store.get(job_id) == {
+        'renderStatus': 'done',
+        'legalContractHash': 'ab'
+    }
+
+
+def test_jobs_expire():
+    redis = FakeRedis()
+    store = JobStore(redis, ttl=60)
+
+    job_id = store.create(renderStatus='queued')
+
+    assert redis.ttls[(JobStore.KEY % job_id).encode('utf-8')] == 60
+
+
+def test_unknown_jobs():
+    store = JobStore(FakeRedis())
+
+    assert store.get('unknown') is None
+    store.update(None, renderStatus='done')  # Ignored
+    assert store.redis.keys() == []
+
+
+def test_find_or_create_shares_the_job():
+    store = JobStore(FakeRedis())
+
+    job_id, created = store.find_or_create('key', renderStatus='queued')
+    assert created
+    assert store.find_or_create('key', renderStatus='queued') == (job_id,
+                                                                 False)
+    assert store.find_or_create('other')[1]
+
+
+def test_forgotten_keys_create_a_new_job():
+    store = JobStore(FakeRedis())
+    job_id, _ = store.find_or_create('key', renderStatus='failed')
+
+    store.forget('key')
+    new_job_id, created = store.find_or_create('key', renderStatus='queued')
+
+    assert created and new_job_id != job_id
+    assert store.get(job_id) == {'renderStatus': 'failed'}
+
+
+def test_delete():
+    store = JobStore(FakeRedis())
+    job_id = store.create(renderStatus='queued')
+
+    store.delete(job_id)
+
+    assert store.get(job_id) is None
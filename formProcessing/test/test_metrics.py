@@ -0,0 +1,35 @@
+import pytest
+from fake_redis import FakeRedis
+from metrics import Metrics
+
+
+@pytest.fixture
+def metrics():
+    metrics = Metrics('redis://localhost')
+    metrics._client = FakeRedis()
+    return metrics
+
+
+def test_renders_counters_and_histograms(metrics):
+    metrics.increment('requests_total', method='eth_call')
+    metrics.increment('requests_total', 2, method='eth_call')
+    metrics.observe('task_seconds', 0.5, buckets=(1, 5), task='submit')
+
+    assert metrics.render([('queue_length', {'queue': 'rpc'}, 3)]) == (
+        '# TYPE requests_total counter\n'
+        'requests_total{method="eth_call"} 3\n'
+        '# TYPE task_seconds histogram\n'
+        'task_seconds_bucket{task="submit",le="1"} 1\n'
+        'task_seconds_bucket{task="submit",le="5"} 1\n'
+        'task_seconds_bucket{task="submit",le="+Inf"} 1\n'
+        'task_seconds_sum{task="submit"} 0.5\n'
+        'task_seconds_count{task="submit"} 1\n'
+        '# TYPE queue_length gauge\n'
+        'queue_length{queue="rpc"} 3\n')
+
+
+def test_render_doesnt_scan_the_database(metrics, monkeypatch):
+    metrics.increment('requests_total')
+    monkeypatch.setattr(metrics.client, 'keys', None)
+
+    assert 'requests_total 1' in metrics.render()
@@ -0,0 +1,124 @@
+import threading
+import pytest
+from fake_redis import FakeRedis
+from nonces import NonceManager
+
+pytest.importorskip('lupa')
+
+ADDRESS = '0x' + 'ab' * 20
+
+
+class FakeEth:
+
+    def __init__(self):
+        self.counts = {'latest': 0, 'pending': 0}
+        self.on_count = None
+
+    def getTransactionCount(self, address, block):
+        if self.on_count is not None:
+            self.on_count()
+        return self.counts[block]
+
+
+class FakeWeb3:
+
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+class FakeHash(bytes):
+
+    def hex(self):
+        return '0x' + super().hex()
+
+
+def make_manager(**kwargs):
+    w3 = FakeWeb3()
+    return NonceManager(FakeRedis(), w3, ADDRESS, **kwargs), w3.eth
+
+
+def test_allocate_starts_at_the_chain_count():
+    manager, eth = make_manager()
+    eth.counts = {'latest': 3, 'pending': 5}
+
+    assert [manager.allocate() for _ in range(3)] == [5, 6, 7]
+
+
+def test_resync_keeps_nonces_allocated_meanwhile():
+    manager, eth = make_manager()
+    nonces = [manager.allocate() for _ in range(3)]
+
+    # Allocated between the node's answers and the update of the counter
+    eth.on_count = lambda: nonces.append(manager.allocate())
+    manager.resync()
+    eth.on_count = None
+
+    nonces += [manager.allocate() for _ in range(3)]
+    assert sorted(nonces) == list(range(8))
+
+
+def test_resync_never_moves_the_counter_back():
+    manager, eth = make_manager()
+    eth.counts = {'latest': 0, 'pending': 4}
+    manager.allocate()
+
+    # The node forgot 2 and 3, which are filled first
+    eth.counts = {'latest': 0, 'pending': 2}
+    manager.resync()
+
+    assert [manager.allocate() for _ in range(3)] == [2, 3, 5]
+
+
+def test_resync_releases_lost_nonces():
+    manager, eth = make_manager(allocation_timeout=0)
+    nonces = [manager.allocate() for _ in range(4)]
+    manager.submitted({'nonce': nonces[1], 'gasPrice': 1}, FakeHash(b'\x01'))
+    manager.release(nonces[3])
+
+    # 0 and 2 were never sent
+    manager.resync()
+
+    assert [manager.allocate() for _ in range(4)] == [0, 2, 3, 4]
+
+
+def test_allocate_and_resync_concurrently():
+    manager, eth = make_manager()
+    nonces = []
+    done = threading.Event()
+
+    def allocate():
+        for _ in range(50):
+            nonces.append(manager.allocate())
+
+    def resync():
+        while not done.is_set():
+            manager.resync()
+
+    resyncer = threading.Thread(target=resync)
+    resyncer.start()
+    allocators = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in allocators:
+        thread.start()
+    for thread in allocators:
+        thread.join()
+    done.set()
+    resyncer.join()
+
+    assert sorted(nonces) == list(range(200))
+
+
+def test_deployer_pool_managers_use_their_own_client():
+    pytest.importorskip('eth_account')
+    from accounts import DeployerPool
+
+    pool = DeployerPool(FakeRedis(), ['0x' + '11' * 32])
+    address = pool.deployers[0].address
+    w3, other_w3 = FakeWeb3(), FakeWeb3()
+    w3.eth.counts = other_w3.eth.counts = {'latest': 0, 'pending': 2}
+
+    manager = pool.nonce_manager(w3, address)
+    other = pool.nonce_manager(other_w3, address)
+
+    assert manager.w3 is w3 and other.w3 is other_w3
+    # The nonces are still shared through Redis
+    assert [manager.allocate(), other.allocate()] == [2, 3]
@@ -0,0 +1,153 @@
+from fake_redis import FakeRedis
+from receipts import ReceiptTracker
+
+
+class FakeHash(bytes):
+
+    def hex(self):
+        return '0x' + super().hex()
+
+
+def _hex(tx_hash):
+    # The node accepts hashes as bytes or hex strings
+    return tx_hash if isinstance(tx_hash, str) else tx_hash.hex()
+
+
+class FakeEth:
+    """ A chain whose blocks are lists of transaction hashes. """
+
+    def __init__(self):
+        self.blocks = [[]]
+        self.known = set()
+
+    @property
+    def blockNumber(self):
+        return len(self.blocks) - 1
+
+    def mine(self, *tx_hashes):
+        self.blocks.append(list(tx_hashes))
+
+    def getBlock(self, number):
+        return {'transactions': self.blocks[number]}
+
+    def getTransactionReceipt(self, tx_hash):
+        for number, transactions in enumerate(self.blocks):
+            if _hex(tx_hash) in map(_hex, transactions):
+                return {'transactionHash': tx_hash, 'blockNumber': number}
+        return None
+
+    def getTransaction(self, tx_hash):
+        if (_hex(tx_hash) in map(_hex, self.known)
+                or self.getTransactionReceipt(tx_hash)):
+            return {'hash': tx_hash}
+        return None
+
+
+class FakeWeb3:
+
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+def make_tracker(**kwargs):
+    w3 = FakeWeb3()
+    return ReceiptTracker(FakeRedis(), w3, **kwargs), w3.eth
+
+
+def test_finds_transactions_mined_in_new_blocks():
+    tracker, eth = make_tracker()
+    tx_hash = FakeHash(b'\x01')
+    tracker.track(tx_hash, {'job_id': 'a'})
+
+    assert tracker.poll() == []
+    eth.mine(FakeHash(b'\x02'))
+    eth.mine(tx_hash)
+
+    [(found, details, receipt)] = tracker.poll()
+    assert found == tx_hash.hex()
+    assert details == {'job_id': 'a'}
+    assert receipt['blockNumber'] == 2
+    tracker.done(found)
+    assert tracker.poll() == []
+
+
+def test_finds_transactions_mined_before_being_tracked():
+    tracker, eth = make_tracker()
+    tracker.poll()
+    tx_hash = FakeHash(b'\x01')
+
+    # Sent, mined right away and only then tracked
+    sent_block = eth.blockNumber
+    eth.mine(tx_hash)
+    eth.mine()
+    tracker.track(tx_hash, {'job_id': 'a'}, sent_block)
+
+    [(_, details, receipt)] = tracker.poll()
+    assert receipt['blockNumber'] == 1
+
+
+def test_finds_replacements():
+    tracker, eth = make_tracker()
+    old_hash, new_hash = FakeHash(b'\x01'), FakeHash(b'\x02')
+    tracker.track(old_hash, {'job_id': 'a'})
+    tracker.replace(old_hash, new_hash)
+    eth.mine(new_hash)
+
+    [(found, details, receipt)] = tracker.poll()
+    assert found == old_hash.hex()
+    assert receipt['transactionHash'] == new_hash
+    tracker.done(found)
+    assert tracker.redis.hlen(ReceiptTracker.PENDING_KEY) == 0
+
+
+def test_forgets_transactions_unknown_to_the_node():
+    tracker, eth = make_tracker(check_after=3)
+    known, dropped = FakeHash(b'\x01'), FakeHash(b'\x02')
+    eth.known.add(known)
+    tracker.track(known, {'job_id': 'a'})
+    tracker.track(dropped, {'job_id': 'b'})
+
+    for _ in range(2):
+        eth.mine()
+        assert tracker.poll() == []
+
+    eth.mine()
+    assert tracker.poll() == [(dropped.hex(), {'job_id': 'b'}, None)]
+    tracker.done(dropped.hex())
+    assert tracker.redis.hkeys(ReceiptTracker.PENDING_KEY) == [
+        known.hex().encode('utf-8')
+    ]
+
+
+def test_processes_at_most_max_blocks_per_poll():
+    tracker, eth = make_tracker(max_blocks=2)
+    tx_hash = FakeHash(b'\x01')
+    tracker.track(tx_hash, {'job_id': 'a'})
+    eth.mine()
+    eth.mine()
+    eth.mine(tx_hash)
+
+    assert tracker.poll() == []
+    assert len(tracker.poll()) == 1
+
+
+def test_returns_the_transactions_found_until_done():
+    tracker, eth = make_tracker()
+    first, second = FakeHash(b'\x01'), FakeHash(b'\x02')
+    tracker.track(first, {'job_id': 'a'})
+    tracker.track(second, {'job_id': 'b'})
+    eth.mine(first, second)
+
+    assert len(tracker.poll()) == 2
+    tracker.done(first.hex())  # Handling the second one failed
+
+    read = []
+    get_block = eth.getBlock
+    eth.getBlock = lambda number: read.append(number) or get_block(number)
+    [(found, details, receipt)] = tracker.poll()
+    assert found == second.hex()
+    assert details == {'job_id': 'b'}
+    assert receipt['blockNumber'] == 1
+    assert read == []  # Without looking for it again
+    tracker.done(found)
+    assert tracker.poll() == []
@@ -0,0 +1,129 @@
+import json
+import socket
+import threading
+import pytest
+import requests
+
+pytest.importorskip('web3')
+pytest.importorskip('solc')
+
+from smartcontract import (  # noqa: E402
+    BatchRequestError, KeepAliveHTTPProvider, NodeUnreachable, SmartContract)
+
+ADDRESS = '0x' + 'ab' * 20
+
+
+class FakeResponse:
+
+    def __init__(self, body):
+        self.content = json.dumps(body).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """ Answers each call with its index, or batches with 'batch_answer'. """
+
+    def __init__(self, batch_answer=None):
+        self.batch_answer = batch_answer
+        self.requests = []
+
+    def post(self, url, data, **kwargs):
+        request = json.loads(data.decode('utf-8'))
+        self.requests.append(request)
+        if isinstance(request, list):
+            if self.batch_answer is not None:
+                return FakeResponse(self.batch_answer)
+            return FakeResponse([{
+                'jsonrpc': '2.0',
+                'id': call['id'],
+                'result': hex(call['id'])
+            } for call in reversed(request)])
+        return FakeResponse({
+            'jsonrpc': '2.0',
+            'id': request['id'],
+            'result': '0x7'
+        })
+
+
+def make_provider(session):
+    provider = KeepAliveHTTPProvider('http://localhost:8545')
+    provider.session = session
+    return provider
+
+
+def test_batch_responses_are_in_order():
+    provider = make_provider(FakeSession())
+
+    responses = provider.make_batch_request([('eth_blockNumber', [])] * 3)
+
+    assert [r['result'] for r in responses] == ['0x0', '0x1', '0x2']
+
+
+@pytest.mark.parametrize('answer', [
+    {
+        'jsonrpc': '2.0',
+        'id': None,
+        'error': {
+            'code': -32600,
+            'message': 'batch too large'
+        }
+    },
+    [{
+        'jsonrpc': '2.0',
+        'id': 0,
+        'result': '0x0'
+    }],
+])
+def test_rejected_batches(answer):
+    provider = make_provider(FakeSession(answer))
+
+    with pytest.raises(BatchRequestError) as error:
+        provider.make_batch_request([('eth_blockNumber', [])] * 2)
+
+    if isinstance(answer, dict):
+        assert 'batch too large' in str(error.value)
+
+
+def test_reads_fall_back_to_one_call_at_a_time():
+    session = FakeSession({'jsonrpc': '2.0', 'id': None, 'error': {}})
+    sc = SmartContract(None, provider=make_provider(session))
+
+    values = sc._read_chunk([ADDRESS], ['balance', 'debt'], 'latest')
+
+    assert values == {ADDRESS: {'balance': 7, 'debt': 7}}
+    assert len(session.requests) == 3
+
+
+def test_refused_connections_are_unreachable():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))  # Bound but not listening, so refused
+        provider = KeepAliveHTTPProvider(
+            'http://127.0.0.1:%d' % s.getsockname()[1])
+
+        with pytest.raises(NodeUnreachable):
+            provider.make_request('eth_blockNumber', [])
+
+
+def test_lost_connections_arent_unreachable():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        s.listen(1)
+
+        def drop_request():
+            conn, _ = s.accept()
+            conn.recv(65536)  # The request reached the node
+            conn.close()
+
+        thread = threading.Thread(target=drop_request)
+        thread.start()
+        provider = KeepAliveHTTPProvider(
+            'http://127.0.0.1:%d' % s.getsockname()[1])
+
+        with pytest.raises(requests.exceptions.ConnectionError) as e:
+            provider.make_request('eth_blockNumber', [])
+        thread.join()
+
+    assert not isinstance(e.value, NodeUnreachable)
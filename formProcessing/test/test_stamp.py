@@ -0,0 +1,87 @@
+import io
+import re
+import zlib
+import logging
+import pytest
+from pdfrw import PdfReader, PdfWriter, PdfDict, PdfName, PdfArray
+from pdfrw.errors import PdfParseError
+
+pytest.importorskip('qrcode')
+
+from compact import compact_pdf  # noqa: E402
+from stamp import deployment_update  # noqa: E402
+
+ADDRESS = '0x14723A09ACff6D2A60DcdF7aA4AFf308FDDC160C'
+CONTRACT_HASH = 'ab' * 32
+
+
+def make_pdf(pages=1):
+    writer = PdfWriter()
+    for number in range(pages):
+        writer.addpage(
+            PdfDict(
+                Type=PdfName.Page,
+                MediaBox=PdfArray([0, 0, 612, 792]),
+                Contents=PdfDict(stream='BT /F1 12 Tf (Page %d) Tj ET' %
+                                 number)))
+    writer.trailer.Info = PdfDict(Producer='test')
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def page_text(page):
+    stream = page.Contents.stream.encode('latin-1')
+    return zlib.decompress(stream) if page.Contents.Filter else stream
+
+
+@pytest.fixture
+def pdfrw_warnings(caplog):
+    caplog.set_level(logging.WARNING, logger='pdfrw')
+    return caplog
+
+
+@pytest.mark.parametrize('pages', [1, 3])
+def test_appends_a_page(pages, pdfrw_warnings):
+    pdf = make_pdf(pages)
+
+    stamped = pdf + deployment_update(pdf, ADDRESS, CONTRACT_HASH)
+
+    assert stamped[:len(pdf)] == pdf
+    reader = PdfReader(fdata=stamped)
+    assert len(reader.pages) == pages + 1
+    assert int(reader.Root.Pages.Count) == pages + 1
+    assert b'Page 0' in page_text(reader.pages[0])
+    assert ADDRESS.encode('latin-1') in page_text(reader.pages[-1])
+    assert CONTRACT_HASH.encode('latin-1') in page_text(reader.pages[-1])
+    assert reader.Info.Producer == '(test)'
+    assert not pdfrw_warnings.records
+
+
+def test_update_points_to_the_original_cross_reference_table():
+    pdf = make_pdf()
+    original = PdfReader(fdata=pdf)
+
+    update = deployment_update(pdf, ADDRESS, CONTRACT_HASH)
+
+    startxref = int(re.findall(rb'startxref\s+(\d+)', pdf)[-1])
+    assert pdf[startxref:].startswith(b'xref')
+    assert int(re.search(rb'/Prev (\d+)', update).group(1)) == startxref
+    # The page, its contents and its font are new objects
+    assert int(re.search(rb'/Size (\d+)', update).group(1)) == int(
+        original.Size) + 3
+
+
+def test_stamps_compacted_pdfs(pdfrw_warnings):
+    pdf = compact_pdf(make_pdf(2))
+
+    stamped = pdf + deployment_update(pdf, ADDRESS, CONTRACT_HASH)
+
+    assert len(PdfReader(fdata=stamped).pages) == 3
+    assert not pdfrw_warnings.records
+
+
+def test_rejects_other_files():
+    with pytest.raises(PdfParseError):
+        deployment_update(b'not a pdf', ADDRESS, CONTRACT_HASH)
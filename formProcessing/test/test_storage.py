@@ -0,0 +1,84 @@
+import os
+import hashlib
+import pytest
+from storage import LocalStorage, make_storage
+
+PDF = b'%PDF-1.5 contract'
+PDF_HASH = hashlib.sha256(PDF).hexdigest()
+
+
+@pytest.fixture
+def storage(tmpdir):
+    return LocalStorage(str(tmpdir.join('contratos')))
+
+
+def stored_files(storage):
+    return sorted(
+        os.path.relpath(os.path.join(folder, name), storage.root)
+        for folder, _, names in os.walk(storage.root) for name in names)
+
+
+def test_stores_files_under_their_hash(storage):
+    with storage.writer() as f:
+        f.write(PDF[:4])
+        f.write(PDF[4:])
+
+    assert f.name == PDF_HASH
+    assert f.size == len(PDF)
+    assert storage.read(PDF_HASH) == PDF
+    assert storage.exists(PDF_HASH)
+    assert not storage.exists('ff' * 32)
+
+
+def test_shards_the_files(storage):
+    assert storage.key('abcdef') == 'ab/cd/abcdef.pdf'
+    assert LocalStorage(storage.root, shard_depth=1).key('abcdef') == (
+        'ab/abcdef.pdf')
+
+    with storage.writer('abcdef') as f:
+        f.write(PDF)
+
+    assert storage.path('abcdef') == os.path.join(storage.root, 'ab', 'cd',
+                                                  'abcdef.pdf')
+    with storage.open('abcdef') as stored:
+        assert stored.read() == PDF
+
+
+def test_failed_writes_leave_nothing(storage):
+    with pytest.raises(RuntimeError):
+        with storage.writer() as f:
+            f.write(PDF)
+            raise RuntimeError('Render failed')
+
+    assert stored_files(storage) == []
+
+
+def test_unknown_files(storage):
+    with pytest.raises(FileNotFoundError):
+        storage.read('ff' * 32)
+
+
+def test_finds_files_stored_flat(tmpdir):
+    legacy = tmpdir.mkdir('legacy')
+    legacy.join(PDF_HASH + '.pdf').write_binary(PDF)
+    storage = LocalStorage(
+        str(tmpdir.join('contratos')), legacy_root=str(legacy))
+
+    assert storage.exists(PDF_HASH)
+    assert storage.read(PDF_HASH) == PDF
+    assert storage.path(PDF_HASH) == str(legacy.join(PDF_HASH + '.pdf'))
+
+    # New files are always sharded
+    with storage.writer(PDF_HASH) as f:
+        f.write(PDF)
+    assert storage.path(PDF_HASH) == storage.path(PDF_HASH, legacy=False)
+
+
+def test_make_storage(tmpdir):
+    config = {'CONTRACTS_STORAGE': 'local', 'CONTRACTS_DIR': str(tmpdir)}
+    assert isinstance(make_storage(config), LocalStorage)
+    storage = make_storage(dict(config, CONTRACTS_LEGACY_DIR='legacy'))
+    assert storage.legacy_root == 'legacy'
+
+    with pytest.raises(ValueError):
+        make_storage(dict(config, CONTRACTS_STORAGE='ftp'))
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip('jinja2')
+pytest.importorskip('dateutil')
+
+from utils import parse_batch, validate_event_data  # noqa: E402
+
+
+def test_parse_json_array():
+    assert parse_batch(' [{"a": 1}, {"a": 2}]') == [{'a': 1}, {'a': 2}]
+
+
+def test_parse_ndjson():
+    body = '{"a": 1}\n\n{"a": 2}\r\n  \n'
+
+    assert parse_batch(body) == [{'a': 1}, {'a': 2}]
+
+
+def test_parse_empty_body():
+    assert parse_batch('') == []
+
+
+@pytest.mark.parametrize('body', ['[{"a": 1}', '{"a": 1}\n{"a":'])
+def test_parse_invalid_body(body):
+    with pytest.raises(ValueError):
+        parse_batch(body)
+
+
+EVENT_DATA = {
+    'customerAddress': '0x' + 'ab' * 20,
+    'oracleAddress': '0x' + 'cd' * 20,
+    'amount': 10,
+    'oracleFee': 1,
+    'dueDate': '2018-12-14',
+    'settlementDate': '2018-12-21',
+    'dateOfDelivery': '2019-01-01'
+}
+
+
+def test_valid_event_data():
+    assert validate_event_data(EVENT_DATA) == []
+
+
+def test_amount_must_be_positive():
+    assert validate_event_data(dict(EVENT_DATA, amount=0)) == [
+        'amount must be a positive number']
+
+
+@pytest.mark.parametrize('fee, errors', [
+    (0, []), (-1, ['oracleFee must be a non-negative number'])])
+def test_oracle_fee_can_be_zero(fee, errors):
+    assert validate_event_data(dict(EVENT_DATA, oracleFee=fee)) == errors
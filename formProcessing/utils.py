@@ -1,10 +1,71 @@
+import re
+import json
+import time
 import hashlib
-from celery import Celery
-from weasyprint import HTML
-from flask import render_template
+from rendering import get_renderer
+from metrics import NullMetrics
 
 
-def generate_pdf(event_data):
+ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+
+def validate_event_data(event_data):
+    """ Check the event data has what's needed to deploy its contract.
+
+    Args:
+        event_data (dict): The event data, see 'generate_pdf'.
+
+    Returns:
+        list: Description of each problem found, empty if it's valid.
+    """
+    if not isinstance(event_data, dict):
+        return ['Event data must be an object']
+
+    errors = []
+    for field in ('customerAddress', 'oracleAddress'):
+        if not ADDRESS_RE.match(str(event_data.get(field, ''))):
+            errors.append('%s must be an Ethereum address' % field)
+
+    # A contract of 0 can't be funded, but the oracle may work for free
+    for field, minimum, description in (('amount', 1, 'a positive'),
+                                        ('oracleFee', 0, 'a non-negative')):
+        try:
+            if int(event_data[field]) < minimum:
+                raise ValueError()
+        except (KeyError, TypeError, ValueError):
+            errors.append('%s must be %s number' % (field, description))
+
+    # Only imported when validating, the web app loads utils at startup
+    from dateutil import parser as dateparser
+
+    for field in ('dueDate', 'settlementDate', 'dateOfDelivery'):
+        try:
+            dateparser.parse(event_data[field])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            errors.append('%s must be a date' % field)
+
+    return errors
+
+
+def parse_batch(body):
+    """ Parse the event data of a batch of contracts.
+
+    Args:
+        body (str): Either a JSON array or one JSON object per line (NDJSON).
+
+    Returns:
+        list: The event data of each contract.
+
+    Raises:
+        ValueError: If the body isn't valid JSON nor NDJSON.
+    """
+    if body.lstrip().startswith('['):
+        return json.loads(body)
+
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+def generate_pdf(event_data, storage, renderer=None, metrics=None):
     """ Generate the contract in PDF given the event data.
 
     Args:
@@ -20,42 +81,70 @@ def generate_pdf(event_data):
             eventType: Categorization of the event.
             Cliente: Customer name receiving the service.
             email: Customer email.
+        storage (object): The LocalStorage or S3Storage to store it in.
+        renderer (ContractRenderer): Renderer to use, by default the one
+            shared by the whole process.
+        metrics (Metrics): Records the seconds spent laying out, writing
+            and storing the PDF, if given.
 
     Returns:
         str: Hex digest of the SHA256 computed from the generated PDF.
     """
-    contract_in_html = render_template('CONTRATO.html', e=event_data)
-    contract_in_pdf = HTML(string=contract_in_html).write_pdf()
-    contract_hash = hashlib.sha256(contract_in_pdf).hexdigest()
-    contract_path = "./static/contratos/%s.pdf" % contract_hash
-    filehandler = open(contract_path, "wb")
-    filehandler.write(contract_in_pdf)
+    renderer = renderer or get_renderer()
+    metrics = metrics or NullMetrics()
 
-    return contract_hash
+    with metrics.time('contract_render_seconds', stage='layout'):
+        document = renderer.layout(event_data)
 
+    # Hashed while it is written, stored under its hash
+    with storage.writer() as f:
+        with metrics.time('contract_render_seconds', stage='write'):
+            renderer.write_pdf(document, f)
+        written = time.perf_counter()
+    metrics.observe('contract_render_seconds', time.perf_counter() - written,
+                    stage='store')
 
-def make_celery(app):
-    """ Create an instance of celery configured using Flask app.
+    return f.name
+
+
+def event_data_key(event_data, template_version):
+    """ Identify the contract rendered from the given event data.
 
     Args:
-        app (object): The Flask application object with configurations
-                      'CELERY_RESULT_BACKEND' and 'CELERY_BROKER_URL'.
+        event_data (dict): The event data, see 'generate_pdf'.
+        template_version (str): The renderer's 'version'.
 
     Returns:
-        object: The celery.Celery object instance.
+        str: Hex digest of the SHA256 of the canonical JSON of the event data
+            and the template version.
     """
-    celery = Celery(
-        app.import_name,
-        backend=app.config['CELERY_RESULT_BACKEND'],
-        broker=app.config['CELERY_BROKER_URL'])
+    canonical = json.dumps(
+        {'event': event_data, 'template': template_version},
+        sort_keys=True,
+        separators=(',', ':'),
+        ensure_ascii=False)
 
-    celery.conf.update(app.config)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
 
-    class ContextTask(celery.Task):
-        def __call__(self, *args, **kwargs):
-            with app.app_context():
-                return self.run(*args, **kwargs)
 
-    celery.Task = ContextTask
+def make_celery(settings):
+    """ Create an instance of celery configured with the app's settings.
+
+    Args:
+        settings (dict): The settings, see 'config.as_dict', with
+            'CELERY_RESULT_BACKEND' and 'CELERY_BROKER_URL'.
+
+    Returns:
+        object: The celery.Celery object instance.
+    """
+    # Imported here, the web app only needs celery once it sends a task
+    from celery import Celery
+
+    celery = Celery(
+        'tasks',
+        backend=settings['CELERY_RESULT_BACKEND'],
+        broker=settings['CELERY_BROKER_URL'])
+
+    celery.conf.update(settings)
 
     return celery
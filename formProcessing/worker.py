@@ -0,0 +1,27 @@
+""" Entry point of the celery workers and of celery beat.
+
+    celery -A worker.celery worker -Q render -P prefork -c 4 -n render@%h
+    celery -A worker.celery worker -Q rpc -P gevent -c 100 -n rpc@%h
+    celery -A worker.celery beat
+
+Importing this module imports every task and the libraries they use (web3,
+pdfrw, solc's bindings...). Celery does it in the main process, and a
+prefork worker also compiles (or loads) the contract there before forking
+its children, so they all share that memory copy-on-write instead of each
+loading its own copy.
+"""
+import gc
+from celery.signals import worker_init
+import tasks
+
+celery = tasks.celery
+
+
+@worker_init.connect
+def preload(**kwargs):
+    # Runs in the main process, before the pool's processes are forked
+    tasks.artifact_store.get(tasks.contract_artifact_id())
+
+    # Keep the garbage collector from touching (and so copying) the shared
+    # objects in every child
+    gc.freeze()